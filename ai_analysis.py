@@ -1,11 +1,21 @@
-import sqlite3
 import os
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import tiktoken
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
 import pandas as pd
 import numpy as np
+from db import connection
+from migrate import migrate
+import llm_cache
+from batch_packer import pack_batches, fill_ratio
+import sampling
+import sentiment
+from engagement import ENGAGEMENT_FIELDS
 
 # =========================
 # 1. 初始化 & 配置
@@ -13,18 +23,33 @@ import numpy as np
 
 load_dotenv()
 
-DB_NAME = "multi_source.db"
 MODEL = "gpt-5.2"  # 使用你们提供的模型
 
 MAX_TOKENS_PER_BATCH = 4000
 SAMPLE_SIZE = 100
+# Reduce 时最多合并最近多少个已保存的 Map 批次结果
+REDUCE_MAX_BATCHES = 50
 
 # ✅ 关键修复：手动指定 tokenizer（与模型名解耦）
 ENCODING = tiktoken.get_encoding("cl100k_base")
 
+# Map 阶段并发数及 API 限流（每分钟请求数 / token 数）
+MAP_WORKERS = int(os.getenv("MAP_WORKERS", "4"))
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+MAP_OUTPUT_TOKENS = 500     # 估算单次 Map 输出 token，用于 TPM 预扣
+REDUCE_OUTPUT_TOKENS = 1000
+
+# 429 / 5xx / 网络错误的指数退避重试
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# 重试由 chat_completion 统一处理，关闭 SDK 自带重试避免叠加
 client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL")
+    base_url=os.getenv("OPENAI_BASE_URL"),
+    max_retries=0
 )
 
 # =========================
@@ -36,6 +61,91 @@ def get_token_count(text: str) -> int:
     return len(ENCODING.encode(text))
 
 
+class TokenBucket:
+    """令牌桶限流：每分钟补充 rate_per_minute 个令牌，不足时阻塞等待"""
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        # 单次需求超过桶容量时按满桶处理，避免永久阻塞
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+request_limiter = TokenBucket(REQUESTS_PER_MINUTE)
+token_limiter = TokenBucket(TOKENS_PER_MINUTE)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float | None:
+    """可重试错误返回等待秒数，否则返回 None"""
+    if isinstance(error, (APIConnectionError, RateLimitError, InternalServerError)):
+        retryable = True
+    else:
+        retryable = isinstance(error, APIStatusError) and error.status_code >= 500
+    if not retryable:
+        return None
+
+    # 服务端给出 Retry-After 时优先使用
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+    except ValueError:
+        pass
+    delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def chat_completion(messages: list[dict], estimated_tokens: int = 0):
+    """带限流和指数退避重试的 chat completion 调用（JSON 输出）"""
+    for attempt in range(MAX_RETRIES + 1):
+        request_limiter.acquire()
+        token_limiter.acquire(estimated_tokens)
+        try:
+            return client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == MAX_RETRIES:
+                raise
+            print(f"⏳ 请求失败 ({e.__class__.__name__})，{delay:.1f}s 后第 {attempt + 1} 次重试...")
+            time.sleep(delay)
+
+
+def cached_json_completion(messages: list[dict], estimated_tokens: int = 0, phase: str = "") -> dict:
+    """
+    先查 LLM 响应缓存（键为模型 + 完整消息的哈希），未命中才调用 API 并写回缓存
+    返回解析后的 JSON dict
+    """
+    key = llm_cache.make_key(MODEL, messages)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = chat_completion(messages, estimated_tokens)
+    result = json.loads(response.choices[0].message.content)
+    llm_cache.put(key, result, phase)
+    return result
+
+
 def filter_dirty_data(df: pd.DataFrame) -> pd.DataFrame:
     """初步过滤脏数据"""
     initial_count = len(df)
@@ -58,14 +168,9 @@ def filter_dirty_data(df: pd.DataFrame) -> pd.DataFrame:
 # 3. Map 阶段
 # =========================
 
-def map_phase(batches: list[str], language: str = "zh") -> list[dict]:
-    map_results = []
-
-    for i, batch in enumerate(batches):
-        print(f"🧠 正在处理第 {i+1}/{len(batches)} 个批次...")
-
-        if language == "en":
-            prompt = f"""
+def build_map_prompt(batch: str, language: str = "zh") -> str:
+    if language == "en":
+        return f"""
 You are a professional data analyst. Please analyze the following batch of social media comments.
 
 Task:
@@ -85,8 +190,7 @@ Please return ONLY valid JSON:
   "spam_info": "None"
 }}
 """
-        else:
-            prompt = f"""
+    return f"""
 你是一个专业的数据分析师，请分析以下社交媒体评论批次。
 
 任务：
@@ -107,40 +211,134 @@ Please return ONLY valid JSON:
 }}
 """
 
-        try:
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a professional data analysis assistant." if language == "en" else "你是一个专业的数据分析助手。"},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
 
-            result = json.loads(response.choices[0].message.content)
-            map_results.append(result)
+def map_one(batch: str, language: str = "zh") -> dict:
+    """分析单个批次，失败时抛出异常"""
+    prompt = build_map_prompt(batch, language)
+    return cached_json_completion(
+        messages=[
+            {"role": "system", "content": "You are a professional data analysis assistant." if language == "en" else "你是一个专业的数据分析助手。"},
+            {"role": "user", "content": prompt}
+        ],
+        estimated_tokens=get_token_count(prompt) + MAP_OUTPUT_TOKENS,
+        phase="map"
+    )
+
+
+def map_phase(batches: list[str], language: str = "zh", max_workers: int = MAP_WORKERS) -> list[dict]:
+    """
+    并发执行 Map：最多 max_workers 个批次同时请求，受 RPM/TPM 限流
+    返回结果保持批次顺序；重试后仍失败的批次被跳过
+    """
+    return [r for r in map_batches(batches, language, max_workers) if r is not None]
 
+
+def map_batches(batches: list[str], language: str = "zh", max_workers: int = MAP_WORKERS) -> list[dict | None]:
+    """同 map_phase，但结果与 batches 一一对应，失败的批次为 None"""
+    results = [None] * len(batches)
+
+    def run(i):
+        print(f"🧠 正在处理第 {i+1}/{len(batches)} 个批次...")
+        try:
+            results[i] = map_one(batches[i], language)
         except Exception as e:
             print(f"❌ 批次 {i+1} 处理失败: {e}")
 
-    return map_results
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        list(executor.map(run, range(len(batches))))
+
+    return results
+
+
+# =========================
+# 3.1 增量分析结果存储
+# =========================
+
+def _scope(keyword: str | None) -> str:
+    return keyword or "*"
+
+
+def load_unanalyzed(keyword: str | None, language: str) -> pd.DataFrame:
+    """
+    读取该关键词下尚未被 Map 分析过的 cleaned_data 行（含采样策略需要的字段）
+    近似重复簇只保留代表行（cluster_id = 自身），其余成员不再送去分析
+    """
+    keyword_filter = "AND c.keyword = ?" if keyword else ""
+    params = (_scope(keyword), language) + ((keyword,) if keyword else ())
+    with connection() as conn:
+        migrate(conn)
+        return pd.read_sql_query(f"""
+        SELECT c.id, c.content, c.platform, c.timestamp, {', '.join(f'c.{f}' for f in ENGAGEMENT_FIELDS)}
+        FROM cleaned_data c
+        LEFT JOIN analysis_batch_doc d
+            ON d.cleaned_id = c.id AND d.scope = ? AND d.language = ?
+        LEFT JOIN near_dup_doc n ON n.cleaned_id = c.id
+        WHERE d.cleaned_id IS NULL AND (n.cluster_id IS NULL OR n.cluster_id = c.id) {keyword_filter}
+        """, conn, params=params)
+
+
+def save_batch_results(keyword: str | None, language: str, batch_doc_ids: list[list[int]], results: list[dict | None]) -> int:
+    """
+    保存成功批次的 Map 结果并记录其包含的文档，返回保存的批次数
+    同时记录批次中本地情感无法判定（sentiment_confident = 0）的文档数，Reduce 按它加权 LLM 情感分
+    """
+    now = int(time.time())
+    saved = 0
+    with connection() as conn, conn:
+        for doc_ids, result in zip(batch_doc_ids, results):
+            if result is None:
+                continue
+            ambiguous = conn.execute(f"""
+            SELECT COUNT(*) FROM cleaned_data
+            WHERE id IN ({", ".join("?" * len(doc_ids))}) AND COALESCE(sentiment_confident, 0) = 0
+            """, doc_ids).fetchone()[0]
+            cur = conn.execute("""
+            INSERT INTO analysis_batch (scope, language, result, doc_count, ambiguous_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (_scope(keyword), language, json.dumps(result, ensure_ascii=False), len(doc_ids), ambiguous, now))
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis_batch_doc (cleaned_id, scope, language, batch_id) VALUES (?, ?, ?, ?)",
+                [(doc_id, _scope(keyword), language, cur.lastrowid) for doc_id in doc_ids]
+            )
+            saved += 1
+    return saved
+
+
+def load_batch_results(keyword: str | None, language: str, limit: int = REDUCE_MAX_BATCHES) -> list[dict]:
+    """读取最近保存的 Map 结果（按时间顺序），ambiguous_docs 为批次中本地无法判定的文档数"""
+    with connection() as conn:
+        rows = conn.execute("""
+        SELECT result, COALESCE(ambiguous_count, doc_count) FROM analysis_batch WHERE scope = ? AND language = ?
+        ORDER BY batch_id DESC LIMIT ?
+        """, (_scope(keyword), language, limit)).fetchall()
+    return [{**json.loads(r[0]), "ambiguous_docs": r[1]} for r in reversed(rows)]
 
 
 # =========================
 # 4. Reduce 阶段
 # =========================
 
-def reduce_phase(map_results: list[dict], language: str = "zh", keyword: str = None) -> dict | None:
+def reduce_phase(map_results: list[dict], language: str = "zh", keyword: str = None,
+                 local_sentiment: dict | None = None) -> dict | None:
+    """
+    local_sentiment: sentiment.keyword_summary 的结果；提供时总体情感分由 sentiment.blend 合成：
+                     confident 行直接取本地得分，LLM 的批次得分只代表本地无法确定 (ambiguous) 的那部分文本
+    Map 结果中的 ambiguous_docs（见 load_batch_results）为 LLM 得分的权重，全为 confident 文档的批次只贡献要点
+    """
     print(f"🔄 正在汇总最终分析结果 (关键词: {keyword or '未指定'})...")
 
     all_scores = []
+    weights = []
     all_points = []
 
     for r in map_results:
         all_scores.append(r.get("sentiment_score", 50))
+        weights.append(r.get("ambiguous_docs", 1))
         all_points.extend(r.get("key_points", []))
 
-    avg_sentiment = round(float(np.mean(all_scores)), 2)
+    llm_mean = round(float(np.average(all_scores, weights=weights)), 2) if sum(weights) else None
+    avg_sentiment = sentiment.blend(local_sentiment, llm_mean)
+
     points_text = "\n".join(f"- {p}" for p in all_points)
     
     # 确定主题名称
@@ -218,17 +416,17 @@ Return ONLY valid JSON:
 """
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        final_result = cached_json_completion(
             messages=[
                 {"role": "system", "content": "You are a senior public opinion expert." if language == "en" else "你是一个高级舆情分析专家。"},
                 {"role": "user", "content": prompt}
             ],
-            response_format={"type": "json_object"}
+            estimated_tokens=get_token_count(prompt) + REDUCE_OUTPUT_TOKENS,
+            phase="reduce"
         )
-
-        final_result = json.loads(response.choices[0].message.content)
         final_result["avg_sentiment"] = avg_sentiment
+        if local_sentiment:
+            final_result["local_sentiment"] = local_sentiment
         return final_result
 
     except Exception as e:
@@ -240,10 +438,12 @@ Return ONLY valid JSON:
 # 5. 主流程
 # =========================
 
-def run_analysis(language: str = "zh", keyword: str = None, progress_callback=None):
+def run_analysis(language: str = "zh", keyword: str = None, progress_callback=None,
+                 sampling_strategy: str = sampling.DEFAULT_STRATEGY):
     """
     AI 舆情分析
     progress_callback: 可选的进度回调函数，签名为 progress_callback(message)
+    sampling_strategy: 采样策略，见 sampling.STRATEGIES
     """
     def update_progress(msg):
         print(msg)
@@ -256,63 +456,64 @@ def run_analysis(language: str = "zh", keyword: str = None, progress_callback=No
         update_progress("❌ 未检测到 OPENAI_API_KEY")
         return
 
-    # 读取数据
-    update_progress("📖 正在读取数据...")
-    conn = sqlite3.connect(DB_NAME)
-    if keyword:
-        df = pd.read_sql_query("SELECT content FROM cleaned_data WHERE keyword = ?", conn, params=(keyword,))
+    # 读取数据：只读取尚未分析过的文档，历史结果已保存在 analysis_batch 中
+    update_progress("📖 正在读取未分析的数据...")
+    df = load_unanalyzed(keyword, language)
+    has_new_data = not df.empty
+
+    if has_new_data:
+        # 清洗
+        update_progress("🧹 正在清洗数据...")
+        df = filter_dirty_data(df)
+
+    if not df.empty:
+        # 采样控制成本
+        if len(df) > SAMPLE_SIZE:
+            update_progress(f"📉 新数据量过大，按 {sampling_strategy} 策略采样 {SAMPLE_SIZE} 条")
+        df = sampling.sample(df, SAMPLE_SIZE, sampling_strategy)
+
+        # 分批（同时记录每个批次包含的文档 id）
+        update_progress("📦 正在分批处理...")
+        packed = pack_batches(df["content"].tolist(), MAX_TOKENS_PER_BATCH, ENCODING, ids=df["id"].tolist())
+        batches = [b["text"] for b in packed]
+        batch_doc_ids = [b["ids"] for b in packed]
+
+        update_progress(f"📦 共生成 {len(batches)} 个批次 (平均填充率 {fill_ratio(packed, MAX_TOKENS_PER_BATCH):.0%})")
+
+        # Map：只分析新文档，并保存结果供后续运行复用
+        update_progress("🔄 正在执行 Map 阶段...")
+        results = map_batches(batches, language)
+        saved = save_batch_results(keyword, language, batch_doc_ids, results)
+        update_progress(f"💾 已保存 {saved}/{len(batches)} 个批次的分析结果")
     else:
-        df = pd.read_sql_query("SELECT content FROM cleaned_data", conn)
-    conn.close()
-
-    if df.empty:
-        update_progress(f"⚠️ 数据库中没有可分析数据 (关键词: {keyword or '全部'})")
-        return
-
-    # 清洗
-    update_progress("🧹 正在清洗数据...")
-    df = filter_dirty_data(df)
+        update_progress("✅ 没有新的数据需要分析，复用已保存的结果")
 
-    # 采样控制成本
-    if len(df) > SAMPLE_SIZE:
-        update_progress(f"📉 数据量过大，采样 {SAMPLE_SIZE} 条")
-        df = df.sample(SAMPLE_SIZE, random_state=42)
+    # 本地情感分覆盖该关键词下的全部数据（不受采样限制）
+    with connection() as conn:
+        local_sentiment = sentiment.keyword_summary(conn, keyword)
 
-    # 分批
-    update_progress("📦 正在分批处理...")
-    batches = []
-    current_batch = ""
-    current_tokens = 0
-
-    for text in df["content"].tolist():
-        tokens = get_token_count(text)
-
-        if current_tokens + tokens > MAX_TOKENS_PER_BATCH:
-            batches.append(current_batch.strip())
-            current_batch = text
-            current_tokens = tokens
-        else:
-            current_batch += "\n" + text
-            current_tokens += tokens
-
-    if current_batch.strip():
-        batches.append(current_batch.strip())
-
-    update_progress(f"📦 共生成 {len(batches)} 个批次")
-
-    # Map
-    update_progress("🔄 正在执行 Map 阶段...")
-    map_results = map_phase(batches, language)
+    # 合并历史与本次的 Map 结果
+    map_results = load_batch_results(keyword, language)
     if not map_results:
-        update_progress("❌ Map 阶段无结果")
+        if has_new_data:
+            update_progress("❌ Map 阶段无结果")
+        else:
+            update_progress(f"⚠️ 数据库中没有可分析数据 (关键词: {keyword or '全部'})")
         return
 
+    if local_sentiment["total"]:
+        update_progress(f"😊 本地情感打分: {local_sentiment['confident']}/{local_sentiment['total']} 条可直接判定，"
+                        f"其余 {local_sentiment['ambiguous']} 条参考 LLM 结果")
+
     # Reduce
     update_progress("🔄 正在执行 Reduce 阶段...")
-    final_report = reduce_phase(map_results, language, keyword)
+    final_report = reduce_phase(map_results, language, keyword, local_sentiment)
     if not final_report:
         return
 
+    stats = llm_cache.get_stats()
+    update_progress(f"💾 LLM 缓存累计命中 {stats['hits']} 次，未命中 {stats['misses']} 次 (命中率 {stats['hit_rate']:.0%})")
+
     # 输出
     update_progress("\n" + "=" * 50)
     update_progress("📊 AI 舆情分析报告")
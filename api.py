@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+import functools
 import sqlite3
 import json
 import os
 import logging
 import time
-import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+import db
+from db import get_connection, connection
+from migrate import migrate
+from sampling import DEFAULT_STRATEGY, STRATEGIES
+import keyword_stats
+import source_data
+import events
+import jobs
+import job_queue
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -22,43 +34,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-DB_NAME = "multi_source.db"
 REPORT_FILE = "analysis_report.json"
 
-# 初始化调度器
+# 初始化调度器（在服务启动时 start，见 start_background_workers）
 scheduler = BackgroundScheduler()
-scheduler.start()
 
-# 任务状态跟踪（使用线程锁保证线程安全）
-task_status_lock = threading.Lock()
-task_status = {
-    "is_running": False,
-    "current_task": None,
-    "last_update": 0,
-    "progress": "",
-}
+# 数据库访问专用线程池：接口中阻塞的 SQLite 查询和文件读写都在这里执行，不占用事件循环
+# 连接从 db 的连接池借出，用完归还
+DB_WORKERS = int(os.getenv("API_DB_WORKERS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="api-db")
+
+async def run_db(func, *args, **kwargs):
+    """在数据库线程池中执行阻塞函数并等待结果（异常原样抛出）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
+# 任务状态跟踪：每个采集 / 分析任务在 jobs.registry 中有独立的状态
 
 def get_db_connection():
-    if not os.path.exists(DB_NAME):
+    if not os.path.exists(db.DB_NAME):
         # 如果数据库不存在，尝试初始化
         try:
             init_db_tables()
         except:
-            logger.error(f"Database file {DB_NAME} not found and init failed.")
+            logger.error(f"Database file {db.DB_NAME} not found and init failed.")
             return None
     try:
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return get_connection(row_factory=sqlite3.Row)
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         return None
 
 def init_db_tables():
     """初始化数据库表，包括新的订阅和报警表"""
-    with sqlite3.connect(DB_NAME) as conn:
+    with connection() as conn:
         cur = conn.cursor()
         # 确保原有表存在 (简略)
         
@@ -74,7 +86,8 @@ def init_db_tables():
             interval_seconds INTEGER DEFAULT 21600,
             last_run INTEGER DEFAULT 0,
             next_run INTEGER DEFAULT 0,
-            execution_count INTEGER DEFAULT 0
+            execution_count INTEGER DEFAULT 0,
+            sampling_strategy TEXT DEFAULT 'uniform'
         )
         """)
         
@@ -89,12 +102,7 @@ def init_db_tables():
         )
         """)
         conn.commit()
-
-# 确保启动时检查表结构
-try:
-    init_db_tables()
-except Exception as e:
-    logger.warning(f"DB Init warning: {e}")
+        migrate(conn)
 
 def clean_nan(obj):
     """递归清理字典或列表中的 NaN/Inf 值"""
@@ -109,85 +117,153 @@ def clean_nan(obj):
         return obj
     return obj
 
-def update_task_status(is_running=None, progress=None, current_task=None):
-    """线程安全地更新 task_status"""
-    global task_status
-    with task_status_lock:
-        if is_running is not None:
-            task_status["is_running"] = is_running
-        if progress is not None:
-            task_status["progress"] = progress
-        if current_task is not None:
-            task_status["current_task"] = current_task
-        task_status["last_update"] = int(time.time())
-        logger.info(f"[TaskStatus] is_running={task_status['is_running']}, progress={task_status['progress']}")
-
-# --- 调度任务逻辑 ---
-def scheduled_collection_task(sub_id):
+# --- 任务执行逻辑 ---
+def run_pipeline(job_id, keyword, language, reddit_limit, youtube_limit, twitter_limit, sampling_strategy):
+    """采集（含清洗）+ AI 分析，各阶段耗时记录到 job；返回 (采集结果, 分析报告)"""
+    from collect import run_collection
+    from ai_analysis import run_analysis
+
+    # 进度回调：更新所有进度信息（不过滤）
+    progress_callback = functools.partial(jobs.registry.progress, job_id)
+
+    with jobs.registry.stage(job_id, "collect"):
+        logger.info(f"Starting collection for: {keyword}")
+        collected = run_collection(keyword, language, reddit_limit, youtube_limit, twitter_limit,
+                                   progress_callback=progress_callback)
+    with jobs.registry.stage(job_id, "analyze"):
+        jobs.registry.progress(job_id, "正在进行 AI 分析...")
+        logger.info("Starting AI analysis")
+        report = run_analysis(language=language, keyword=keyword, progress_callback=progress_callback,
+                              sampling_strategy=sampling_strategy)
+    return collected, report
+
+def summarize_result(collected, report):
+    """job 的结果摘要：各数据源采集条数与情感得分"""
+    summary = {
+        "collected": {source: r["count"] for source, r in collected.items() if isinstance(r, dict)},
+        "collect_elapsed": collected.get("total_elapsed"),
+        "avg_sentiment": None,
+        "report": bool(report),
+    }
+    if report:
+        summary["avg_sentiment"] = report.get("avg_sentiment")
+    return summary
+
+def run_manual_job(job_id, keyword, language, reddit_limit, youtube_limit, twitter_limit, sampling_strategy):
+    jobs.registry.start(job_id)
+    jobs.registry.progress(job_id, f"正在采集数据: {keyword}")
+    try:
+        collected, report = run_pipeline(job_id, keyword, language, reddit_limit, youtube_limit,
+                                         twitter_limit, sampling_strategy)
+        jobs.registry.progress(job_id, "任务完成！")
+        jobs.registry.finish(job_id, result=summarize_result(collected, report))
+        logger.info("Pipeline completed successfully")
+    except Exception as e:
+        logger.error(f"Pipeline failed: {e}")
+        jobs.registry.progress(job_id, f"任务失败: {str(e)}")
+        jobs.registry.finish(job_id, error=e)
+
+def scheduled_collection_task(sub_id, job_id):
+    """
+    执行一次定时订阅；同一 (keyword, language) 正在执行或刚完成时共享其结果
+    共享正在执行的 job 时不阻塞当前工作线程：返回一个 Future，在共享的 job 结束时完成
+    """
     logger.info(f"Running scheduled task for subscription {sub_id}")
     
-    update_task_status(is_running=True, progress="开始执行定时任务...", current_task=f"subscription_{sub_id}")
-    
     conn = get_db_connection()
     if not conn: 
-        update_task_status(is_running=False)
+        jobs.registry.finish(job_id, error="数据库连接失败")
         return
     
     try:
         sub = conn.execute("SELECT * FROM subscriptions WHERE id = ?", (sub_id,)).fetchone()
         if not sub: 
-            update_task_status(is_running=False)
+            jobs.registry.finish(job_id, error=f"订阅 #{sub_id} 不存在")
             return
         
         keyword = sub["keyword"]
-        language = sub["language"]
         
         # 1. 运行采集和分析
-        from collect import run_collection
-        from ai_analysis import run_analysis
-        
-        # 创建进度回调函数
-        def progress_callback(msg):
-            # 更新所有进度信息（不过滤）
-            update_task_status(progress=msg)
-        
-        logger.info(f"Scheduled Collection: {keyword}")
-        run_collection(keyword, language, sub["reddit_limit"], sub["youtube_limit"], sub["twitter_limit"], progress_callback=progress_callback)
-        
-        logger.info("Scheduled Analysis")
-        run_analysis(language=language, keyword=keyword, progress_callback=progress_callback)
-        
-        # 2. 检查情感得分并报警
-        update_task_status(progress="检查情感得分...")
-        if os.path.exists(REPORT_FILE):
-            with open(REPORT_FILE, "r", encoding="utf-8") as f:
-                report = json.load(f)
-                score = report.get("avg_sentiment", 50)
-                if score < 30:
-                    msg = f"⚠️ 负面舆情报警: '{keyword}' 情感得分仅 {score:.1f}！"
-                    conn.execute("INSERT INTO alerts (subscription_id, message, created_at) VALUES (?, ?, ?)",
-                                 (sub_id, msg, int(time.time())))
-                    conn.commit()
-                    logger.warning(msg)
-        
-        # 3. 更新下次运行时间和执行计数
-        now = int(time.time())
-        next_run = now + sub["interval_seconds"]
-        execution_count = (sub["execution_count"] or 0) + 1
-        conn.execute("UPDATE subscriptions SET last_run = ?, next_run = ?, execution_count = ? WHERE id = ?",
-                     (now, next_run, execution_count, sub_id))
-        conn.commit()
-        
-        update_task_status(progress="任务完成！")
-        logger.info(f"✓ 定时任务完成: {keyword}")
-        
+        shared_id, outcome = jobs.registry.begin(job_id)
+        if outcome == jobs.NEW:
+            jobs.registry.progress(job_id, "开始执行定时任务...")
+            logger.info(f"Scheduled Collection: {keyword}")
+            collected, report = run_pipeline(job_id, keyword, sub["language"], sub["reddit_limit"],
+                                             sub["youtube_limit"], sub["twitter_limit"],
+                                             sub["sampling_strategy"] or DEFAULT_STRATEGY)
+            complete_scheduled_task(conn, sub, job_id, summarize_result(collected, report))
+            return
     except Exception as e:
-        logger.error(f"Scheduled task failed: {e}")
-        update_task_status(progress=f"任务失败: {str(e)}")
+        fail_scheduled_task(job_id, e)
+        # 继续抛出，由工作线程把队列记录标记为 failed
+        raise
     finally:
         conn.close()
-        update_task_status(is_running=False)
-        logger.info("Task status set to is_running=False")
+
+    logger.info(f"Scheduled task shares job {shared_id} ({outcome}): {keyword}")
+    future = Future()
+
+    def on_shared_finished(shared):
+        try:
+            if shared is None:
+                raise RuntimeError(f"共享的任务 {shared_id} 已不存在")
+            if shared["state"] != jobs.SUCCEEDED:
+                raise RuntimeError(f"共享的任务 {shared_id} 失败: {shared['error']}")
+            with connection() as conn:
+                complete_scheduled_task(conn, sub, job_id, shared["result"])
+        except Exception as e:
+            fail_scheduled_task(job_id, e)
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    jobs.registry.on_finish(shared_id, on_shared_finished)
+    return future
+
+def complete_scheduled_task(conn, sub, job_id, result):
+    """定时任务拿到结果后：检查情感得分并报警、更新下次运行时间，结束 job"""
+    # 检查情感得分并报警（使用本次任务自己的结果，并发任务不会互相覆盖）
+    jobs.registry.progress(job_id, "检查情感得分...")
+    score = result.get("avg_sentiment")
+    if score is not None and score < 30:
+        msg = f"⚠️ 负面舆情报警: '{sub['keyword']}' 情感得分仅 {score:.1f}！"
+        conn.execute("INSERT INTO alerts (subscription_id, message, created_at) VALUES (?, ?, ?)",
+                     (sub["id"], msg, int(time.time())))
+        conn.commit()
+        logger.warning(msg)
+    
+    # 更新下次运行时间和执行计数
+    now = int(time.time())
+    next_run = now + sub["interval_seconds"]
+    execution_count = (sub["execution_count"] or 0) + 1
+    conn.execute("UPDATE subscriptions SET last_run = ?, next_run = ?, execution_count = ? WHERE id = ?",
+                 (now, next_run, execution_count, sub["id"]))
+    conn.commit()
+    
+    jobs.registry.progress(job_id, "任务完成！")
+    jobs.registry.finish(job_id, result=result)
+    logger.info(f"✓ 定时任务完成: {sub['keyword']}")
+
+def fail_scheduled_task(job_id, error):
+    logger.error(f"Scheduled task failed: {error}")
+    jobs.registry.progress(job_id, f"任务失败: {str(error)}")
+    jobs.registry.finish(job_id, error=error)
+
+def run_queued_job(item):
+    """
+    工作线程领取到队列记录后执行；进程重启后恢复的记录在登记表中没有 job，重新登记一个
+    共享其他 job 的结果时返回 Future，工作线程不等待（见 job_queue.WorkerPool）
+    """
+    job_id = item["job_id"]
+    if job_id is None or jobs.registry.get(job_id) is None:
+        with connection() as conn:
+            sub = conn.execute("SELECT keyword, language FROM subscriptions WHERE id = ?",
+                               (item["subscription_id"],)).fetchone()
+            keyword, language = sub if sub else (None, None)
+            job_id = jobs.registry.create(f"subscription_{item['subscription_id']}", keyword=keyword,
+                                          language=language, subscription_id=item["subscription_id"])
+            job_queue.set_job_id(conn, item["id"], job_id)
+    return scheduled_collection_task(item["subscription_id"], job_id)
 
 def check_subscriptions():
     """每分钟检查一次是否有任务需要运行"""
@@ -209,31 +285,51 @@ def check_subscriptions():
             
             # 简单的防重入：如果 last_run 很近（比如1分钟内），跳过
             if sub["last_run"] > 0 and now - sub["last_run"] < 60:
-                logger.info(f"  跳过（最近刚执行过）")
+                logger.info("  跳过（最近刚执行过）")
                 continue
             
-            logger.info(f"  ✓ 触发任务执行: {sub['keyword']}")
+            # 写入任务队列，由固定数量的工作线程执行；该订阅上一次还没执行完时不重复入队
+            queue_id = job_queue.enqueue(conn, sub["id"], sub["next_run"])
+            if queue_id is None:
+                logger.info("  跳过（已在队列中）")
+                continue
             
-            # 直接在后台线程中执行任务（不使用 scheduler）
-            # 这样可以立即更新 task_status，前端可以立即看到进度
-            import threading
-            thread = threading.Thread(target=scheduled_collection_task, args=(sub["id"],), daemon=True)
-            thread.start()
+            logger.info(f"  ✓ 加入任务队列: {sub['keyword']}")
+            job_id = jobs.registry.create(f"subscription_{sub['id']}", keyword=sub["keyword"],
+                                          language=sub["language"], subscription_id=sub["id"])
+            conn.execute("UPDATE job_queue SET job_id = ? WHERE id = ?", (job_id, queue_id))
             
             # 更新 next_run 避免重复提交
             next_run_temp = now + sub["interval_seconds"]
             conn.execute("UPDATE subscriptions SET next_run = ? WHERE id = ?", (next_run_temp, sub["id"]))
             conn.commit()
             logger.info(f"  下次运行时间已更新: {next_run_temp}")
+        
+        job_pool.notify()
+        job_queue.prune(conn)
             
     except Exception as e:
         logger.error(f"Subscription check failed: {e}")
     finally:
         conn.close()
 
+# 定时订阅的工作线程池（JOB_WORKERS 个线程）
+job_pool = job_queue.WorkerPool(run_queued_job)
+
 # 添加定时检查器
 scheduler.add_job(check_subscriptions, 'interval', minutes=1)
 
+@app.on_event("startup")
+def start_background_workers():
+    # 建表、迁移和后台线程都不在导入时执行：cpu_pool 以 spawn 方式创建的子进程会重新导入主模块，
+    # 导入时执行会让每个子进程各自迁移一遍数据库、各跑一份调度器和工作线程
+    try:
+        init_db_tables()
+    except Exception as e:
+        logger.warning(f"DB Init warning: {e}")
+    scheduler.start()
+    job_pool.start()
+
 
 @app.get("/")
 async def root():
@@ -241,6 +337,9 @@ async def root():
 
 @app.get("/api/dashboard")
 async def get_dashboard(keyword: str = None):
+    return await run_db(load_dashboard, keyword)
+
+def load_dashboard(keyword: str = None):
     # 1. 检查数据库是否有数据
     conn = get_db_connection()
     if not conn:
@@ -257,13 +356,9 @@ async def get_dashboard(keyword: str = None):
                 keyword = result["keyword"]
                 logger.info(f"Dashboard: 使用最新关键词 '{keyword}'")
         
-        # 查询指定关键词的数据量
-        if keyword:
-            cursor.execute("SELECT COUNT(*) as total FROM cleaned_data WHERE keyword = ?", (keyword,))
-        else:
-            cursor.execute("SELECT COUNT(*) as total FROM cleaned_data")
-        
-        total_count = cursor.fetchone()["total"]
+        # 读取预计算的聚合统计（由 process_data 增量维护，O(1) 查询）
+        stats = keyword_stats.get_stats(keyword, conn)
+        total_count = stats["total_posts"] if stats else 0
         
         # 如果没有数据，返回空状态
         if total_count == 0:
@@ -314,37 +409,6 @@ async def get_dashboard(keyword: str = None):
                 "mermaid_graph": ""
             }
         
-        # 获取互动数 (解析 engagement JSON)
-        if keyword:
-            cursor.execute("SELECT engagement FROM cleaned_data WHERE keyword = ?", (keyword,))
-        else:
-            cursor.execute("SELECT engagement FROM cleaned_data")
-        rows = cursor.fetchall()
-        total_engagement = 0
-        import math
-        def safe_add(current, val):
-            try:
-                v = float(val) if val is not None else 0
-                if math.isnan(v) or math.isinf(v):
-                    return current
-                return current + v
-            except:
-                return current
-
-        for row in rows:
-            try:
-                eng_str = row["engagement"]
-                if eng_str:
-                    eng = json.loads(eng_str)
-                    total_engagement = safe_add(total_engagement, eng.get("score"))
-                    total_engagement = safe_add(total_engagement, eng.get("view_count"))
-                    total_engagement = safe_add(total_engagement, eng.get("retweet_count"))
-                    total_engagement = safe_add(total_engagement, eng.get("like_count"))
-                    total_engagement = safe_add(total_engagement, eng.get("num_comments"))
-            except Exception as e:
-                logger.warning(f"Error parsing engagement JSON: {e}")
-                continue
-        
         conn.close()
     except Exception as e:
         logger.error(f"Error querying database: {e}")
@@ -352,12 +416,8 @@ async def get_dashboard(keyword: str = None):
             conn.close()
         raise HTTPException(status_code=500, detail="Database query failed")
     
-    # 计算热度指标 (简单加权)
-    heat_index = total_count + (total_engagement / 10.0 if total_engagement else 0)
-    
-    # 确保 heat_index 不是 NaN
-    if math.isnan(heat_index) or math.isinf(heat_index):
-        heat_index = 0
+    # 热度指标 (简单加权)：帖数 + 总互动 / 10，已在统计表中算好
+    heat_index = stats["heat_index"]
     
     return clean_nan({
         "heat_index": float(heat_index),
@@ -374,111 +434,211 @@ async def get_dashboard(keyword: str = None):
     })
 
 @app.get("/api/source-data")
-async def get_source_data(keyword: str = None):
+async def get_source_data(keyword: str = None,
+                          limit: int = Query(None, ge=1, le=source_data.MAX_PAGE_SIZE),
+                          cursor: str = None, platform: str = None, since: str = None, until: str = None,
+                          fields: str = None):
+    """
+    按时间倒序返回源数据（响应体是列表）
+    limit 与 cursor 都未指定时与旧版一致，一次返回全部匹配数据；
+    指定任一参数时分页返回（只给 cursor 时每页 DEFAULT_PAGE_SIZE 条），
+    下一页游标放在响应头 X-Next-Cursor 中，没有更多数据时不返回该响应头
+    fields: 逗号分隔的返回字段，如 "content,url,engagement"
+    """
+    try:
+        selected = source_data.parse_fields(fields)
+        if cursor:
+            source_data.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 直接在线程池中序列化为 JSONResponse：大页数据跳过 FastAPI 在事件循环上的 jsonable_encoder
+    def render():
+        if limit is None and not cursor:
+            return JSONResponse(load_all_source_data(keyword, platform, since, until, selected))
+        items, next_cursor = load_source_page(keyword, limit or source_data.DEFAULT_PAGE_SIZE, cursor,
+                                              platform, since, until, selected)
+        return JSONResponse(items, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+    return await run_db(render)
+
+def load_source_page(keyword, limit, cursor, platform, since, until, fields, resolve_keyword=True):
+    """读取一页源数据，返回 (items, next_cursor)；出错时返回空页"""
     conn = get_db_connection()
     if not conn:
         raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
-        cursor = conn.cursor()
-        
-        # 检查表是否存在
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='cleaned_data'")
-        if not cursor.fetchone():
-            conn.close()
-            return []
-        
         # 如果没有指定关键词，获取最新的关键词
-        if not keyword:
-            cursor.execute("SELECT keyword FROM cleaned_data WHERE keyword != 'unknown' ORDER BY rowid DESC LIMIT 1")
-            result = cursor.fetchone()
-            if result:
-                keyword = result["keyword"]
-        
-        # 按关键词查询
-        if keyword:
-            cursor.execute("SELECT platform, content, author, timestamp, engagement, url, keyword FROM cleaned_data WHERE keyword = ? ORDER BY timestamp DESC", (keyword,))
-        else:
-            cursor.execute("SELECT platform, content, author, timestamp, engagement, url, keyword FROM cleaned_data ORDER BY timestamp DESC")
-        
-        rows = cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            item = dict(row)
-            try:
-                if item["engagement"]:
-                    item["engagement"] = json.loads(item["engagement"])
-                else:
-                    item["engagement"] = {}
-            except:
-                item["engagement"] = {}
-            result.append(item)
+        if not keyword and resolve_keyword:
+            keyword = source_data.latest_keyword(conn)
         
+        return source_data.fetch_page(conn, keyword, limit, cursor, platform, since, until, fields)
+    except Exception as e:
+        logger.error(f"Error querying database: {e}")
+        return [], None
+    finally:
         conn.close()
-        return clean_nan(result)
+
+def load_all_source_data(keyword, platform, since, until, fields):
+    """逐页读取全部匹配的源数据并拼成一个列表；出错时返回空列表"""
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+    try:
+        if not keyword:
+            keyword = source_data.latest_keyword(conn)
+
+        items, cursor = [], None
+        while True:
+            page, cursor = source_data.fetch_page(conn, keyword, source_data.STREAM_PAGE_SIZE, cursor,
+                                                  platform, since, until, fields)
+            items.extend(page)
+            if not cursor:
+                return items
     except Exception as e:
         logger.error(f"Error querying database: {e}")
-        if conn:
-            conn.close()
         return []
+    finally:
+        conn.close()
+
+@app.get("/api/source-data/stream")
+async def stream_source_data(keyword: str = None, platform: str = None, since: str = None,
+                             until: str = None, fields: str = None):
+    """以 NDJSON 流式返回全部匹配的源数据（每行一个 JSON 对象），服务端逐页读取，内存占用恒定"""
+    try:
+        selected = source_data.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not keyword:
+        keyword = await run_db(latest_keyword)
+
+    async def generate():
+        # 每一页都在数据库线程池中读取，两页之间让出事件循环
+        cursor = None
+        while True:
+            items, cursor = await run_db(load_source_page, keyword, source_data.STREAM_PAGE_SIZE, cursor,
+                                         platform, since, until, selected, resolve_keyword=False)
+            for item in items:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            if not cursor:
+                break
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def latest_keyword():
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        return source_data.latest_keyword(conn)
+    finally:
+        conn.close()
 
 @app.post("/api/collect")
 async def collect_data(params: dict, background_tasks: BackgroundTasks):
-    global task_status
-    
     keyword = params.get("keyword", "DeepSeek")
     language = params.get("language", "en")
     reddit_limit = params.get("reddit_limit", 30)
     youtube_limit = params.get("youtube_limit", 30)
     twitter_limit = params.get("twitter_limit", 30)
+    sampling_strategy = params.get("sampling_strategy", DEFAULT_STRATEGY)
+    if sampling_strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown sampling_strategy: {sampling_strategy}")
     
-    def run_pipeline():
-        def progress_callback(msg):
-            # 更新所有进度信息（不过滤）
-            update_task_status(progress=msg)
-        
-        update_task_status(is_running=True, current_task=f"manual_{keyword}", progress=f"正在采集数据: {keyword}")
-        
-        try:
-            from collect import run_collection
-            from ai_analysis import run_analysis
-            
-            logger.info(f"Starting collection for: {keyword}")
-            run_collection(keyword, language, reddit_limit, youtube_limit, twitter_limit, progress_callback=progress_callback)
-            
-            update_task_status(progress="正在进行 AI 分析...")
-            logger.info("Starting AI analysis")
-            run_analysis(language=language, keyword=keyword, progress_callback=progress_callback)
-            
-            update_task_status(progress="任务完成！")
-            logger.info("Pipeline completed successfully")
-        except Exception as e:
-            logger.error(f"Pipeline failed: {e}")
-            update_task_status(progress=f"任务失败: {str(e)}")
-        finally:
-            update_task_status(is_running=False)
-
-    background_tasks.add_task(run_pipeline)
-    return {"status": "accepted", "message": "Collection and analysis started in background"}
+    # 同一 (keyword, language) 已在执行时挂到该任务上，新鲜结果直接复用；force 为真时不复用已完成的结果
+    fresh_within = 0 if params.get("force") else jobs.FRESHNESS_SECONDS
+    job_id, outcome = jobs.registry.submit(f"manual_{keyword}", keyword, language, params={
+        "reddit_limit": reddit_limit, "youtube_limit": youtube_limit,
+        "twitter_limit": twitter_limit, "sampling_strategy": sampling_strategy,
+    }, fresh_within=fresh_within)
+    if outcome == jobs.ATTACHED:
+        return {"status": "attached", "message": "Same keyword is already being processed", "job_id": job_id}
+    if outcome == jobs.FRESH:
+        return {"status": "fresh", "message": "Reusing a recent result for this keyword", "job_id": job_id}
+    background_tasks.add_task(run_manual_job, job_id, keyword, language, reddit_limit, youtube_limit,
+                              twitter_limit, sampling_strategy)
+    return {"status": "accepted", "message": "Collection and analysis started in background", "job_id": job_id}
 
-# 获取任务状态
+# 获取任务状态（兼容旧版单任务接口：返回最近更新的进行中任务）
 @app.get("/api/task-status")
 async def get_task_status():
-    with task_status_lock:
-        # 返回一个副本，避免并发修改问题
-        return {
-            "is_running": task_status["is_running"],
-            "current_task": task_status["current_task"],
-            "last_update": task_status["last_update"],
-            "progress": task_status["progress"],
-        }
+    return jobs.registry.legacy_status()
+
+# 任务列表 / 详情
+@app.get("/api/jobs")
+async def list_jobs(state: str = None, limit: int = Query(50, ge=1, le=jobs.MAX_FINISHED)):
+    if state is not None and state not in jobs.STATES:
+        raise HTTPException(status_code=400, detail=f"Unknown state: {state}")
+    return jobs.registry.list(state, limit)
+
+@app.get("/api/queue")
+async def get_queue_metrics():
+    """定时任务队列指标：队列深度、运行数、吞吐量、延迟"""
+    return await run_db(job_pool.metrics)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# 进度事件推送 (Server-Sent Events)，替代轮询 /api/task-status
+SSE_KEEPALIVE_SECONDS = 15
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+def event_job_name_is(name, event):
+    return isinstance(event["data"], dict) and event["data"].get("name") == name
+
+@app.get("/api/events")
+async def stream_events(job: str = None, task: str = None, last_event_id: int = 0,
+                        last_event_id_header: str = Header(None, alias="Last-Event-ID")):
+    """
+    订阅任务进度事件：job 为 job id（/api/collect 返回或 /api/jobs 中的 id），不传则订阅所有任务
+    task: 旧版参数，按任务名（如 manual_Python / subscription_3）过滤，匹配该名称的所有 job；与 job 同时给出时以 job 为准
+    先补发最近的历史事件（Last-Event-ID 请求头或 last_event_id 参数之后的），再实时推送；
+    不带 job 时（包括 task）只补发所有任务合并后的最近 events.REPLAY_SIZE 条
+    """
+    if last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = max(last_event_id, int(last_event_id_header))
+
+    match = functools.partial(event_job_name_is, task) if task and not job else None
+
+    async def generate():
+        subscription = events.bus.subscribe(job, last_event_id, match)
+        pending = None
+        try:
+            while True:
+                pending = pending or asyncio.ensure_future(subscription.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=SSE_KEEPALIVE_SECONDS)
+                if not done:
+                    # 注释行作为心跳，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                event, pending = pending.result(), None
+                yield format_sse(event)
+        finally:
+            if pending:
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+            await subscription.aclose()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # --- 订阅相关 API ---
 
 @app.get("/api/subscriptions")
 async def get_subscriptions():
+    return await run_db(list_subscriptions)
+
+def list_subscriptions():
     conn = get_db_connection()
     if not conn: raise HTTPException(status_code=500)
     try:
@@ -489,6 +649,9 @@ async def get_subscriptions():
 
 @app.post("/api/subscriptions")
 async def create_subscription(params: dict):
+    return await run_db(insert_subscription, params)
+
+def insert_subscription(params: dict):
     conn = get_db_connection()
     if not conn: raise HTTPException(status_code=500)
     try:
@@ -498,9 +661,13 @@ async def create_subscription(params: dict):
         # 计算间隔秒数
         interval_seconds = params.get("interval_seconds", 21600)  # 默认 6 小时
         
-        conn.execute("""
-            INSERT INTO subscriptions (keyword, language, reddit_limit, youtube_limit, twitter_limit, interval_seconds, next_run)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+        sampling_strategy = params.get("sampling_strategy", DEFAULT_STRATEGY)
+        if sampling_strategy not in STRATEGIES:
+            raise HTTPException(status_code=400, detail=f"Unknown sampling_strategy: {sampling_strategy}")
+        
+        cur = conn.execute("""
+            INSERT INTO subscriptions (keyword, language, reddit_limit, youtube_limit, twitter_limit, interval_seconds, next_run, sampling_strategy)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             keyword,
             params.get("language", "en"),
@@ -508,15 +675,20 @@ async def create_subscription(params: dict):
             params.get("youtube_limit", 30),
             params.get("twitter_limit", 30),
             interval_seconds,
-            int(time.time()) # 立即运行一次? 或者稍后. 这里设为当前时间意味着下次检查会立即触发
+            int(time.time()), # 立即运行一次? 或者稍后. 这里设为当前时间意味着下次检查会立即触发
+            sampling_strategy
         ))
         conn.commit()
-        return {"status": "ok"}
+        # 前端用 id 订阅 /api/events?task=subscription_{id} 跟踪首次执行
+        return {"status": "ok", "id": cur.lastrowid}
     finally:
         conn.close()
 
 @app.delete("/api/subscriptions/{id}")
 async def delete_subscription(id: int):
+    return await run_db(remove_subscription, id)
+
+def remove_subscription(id: int):
     conn = get_db_connection()
     if not conn: raise HTTPException(status_code=500)
     try:
@@ -528,6 +700,9 @@ async def delete_subscription(id: int):
 
 @app.get("/api/alerts")
 async def get_alerts():
+    return await run_db(list_alerts)
+
+def list_alerts():
     conn = get_db_connection()
     if not conn: raise HTTPException(status_code=500)
     try:
@@ -539,6 +714,9 @@ async def get_alerts():
 @app.post("/api/clear-data")
 async def clear_data():
     """清空所有采集数据和分析报告"""
+    return await run_db(clear_all_data)
+
+def clear_all_data():
     try:
         # 1. 删除报告文件
         if os.path.exists(REPORT_FILE):
@@ -550,6 +728,12 @@ async def clear_data():
         if conn:
             try:
                 conn.execute("DELETE FROM cleaned_data")
+                conn.execute("DELETE FROM analysis_batch_doc")
+                conn.execute("DELETE FROM analysis_batch")
+                conn.execute("DELETE FROM cleaning_watermark")
+                conn.execute("DELETE FROM near_dup_doc")
+                conn.execute("DELETE FROM near_dup_band")
+                conn.execute("DELETE FROM keyword_stats")
                 conn.commit()
                 logger.info("Cleared cleaned_data table")
             except Exception as e:
@@ -0,0 +1,145 @@
+"""
+Map 阶段的批次打包
+- 多核时用 tiktoken 的批量编码（线程池）一次算出所有文档的 token 数；单核时线程池只有调度开销，逐条编码
+- 按 token 数降序做首次适应 (First-Fit-Decreasing) 装箱，批次填充更满
+- 超过单批上限的文档按 token 边界切分，不会整段塞进一个超限批次；切分点回退到完整的 UTF-8 字符边界
+  （一个中文字符可能跨多个 token），并按重新编码后的 token 数校验，切出的每段都不超过上限
+- 批次文本用 list + join 拼接，避免字符串反复相加
+"""
+import os
+
+SEPARATOR = "\n"
+# 批量编码的线程数上限（与 tiktoken 默认值一致）
+MAX_ENCODE_THREADS = 8
+
+
+class _FirstFitTree:
+    """线段树维护各批次剩余容量的最大值，O(log n) 找到第一个放得下的批次"""
+
+    def __init__(self):
+        self.size = 1
+        self.tree = [-1] * 2
+
+    def _grow(self):
+        old = self.tree[self.size:]
+        self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        self.tree[self.size:self.size + len(old)] = old
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def set(self, index, value):
+        while index >= self.size:
+            self._grow()
+        i = index + self.size
+        self.tree[i] = value
+        i //= 2
+        while i:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+    def first_fit(self, need):
+        """返回第一个剩余容量 >= need 的批次下标，没有则返回 -1"""
+        if self.tree[1] < need:
+            return -1
+        i = 1
+        while i < self.size:
+            i = 2 * i if self.tree[2 * i] >= need else 2 * i + 1
+        return i - self.size
+
+
+def _utf8_boundary(tokens, start, end, encoding, max_shift=8):
+    """
+    返回离 end 最近、使 tokens[start:cut] 能完整解码为 UTF-8 的切分点 cut：优先向前回退，
+    回退范围内没有（单个字符就超过上限）时向后查找；都找不到时返回 end
+    """
+    backward = range(end, max(start, end - max_shift), -1)
+    forward = range(end + 1, min(len(tokens), end + max_shift) + 1)
+    for cut in (*backward, *forward):
+        try:
+            encoding.decode_bytes(tokens[start:cut]).decode("utf-8")
+            return cut
+        except UnicodeDecodeError:
+            continue
+    return end
+
+
+def encode_all(texts, encoding):
+    """编码全部文本；encode_ordinary_batch 每条文本提交一个线程池任务，只有多核时才划算"""
+    threads = min(MAX_ENCODE_THREADS, os.cpu_count() or 1)
+    if threads > 1:
+        return encoding.encode_ordinary_batch(texts, num_threads=threads)
+    return [encoding.encode_ordinary(text) for text in texts]
+
+
+def split_tokens(tokens, max_tokens, encoding):
+    """
+    把超长文档的 token 序列切成若干段，返回 [(token 数, 文本), ...]
+    每段在字符边界处切开，且重新编码后的 token 数不超过 max_tokens（单个字符就超过上限时除外）
+    """
+    pieces = []
+    start = 0
+    while start < len(tokens):
+        end = _utf8_boundary(tokens, start, min(start + max_tokens, len(tokens)), encoding)
+        while True:
+            text = encoding.decode(tokens[start:end])
+            n_tokens = len(encoding.encode_ordinary(text))
+            if n_tokens <= max_tokens:
+                break
+            # 切片边界处的 BPE 合并可能与原文不同，按超出的数量缩短后重试
+            shorter = _utf8_boundary(tokens, start, max(start + 1, end - (n_tokens - max_tokens)), encoding)
+            if shorter >= end:
+                break
+            end = shorter
+        pieces.append((n_tokens, text))
+        start = end
+    return pieces
+
+
+def pack_batches(texts, max_tokens, encoding, ids=None):
+    """
+    把文本打包成不超过 max_tokens 的批次
+    texts: 文本列表；ids: 与 texts 对应的文档 id（可选，默认用下标）
+    返回 [{"text": 批次文本, "ids": 包含的文档 id, "tokens": 批次 token 数}, ...]
+    """
+    if ids is None:
+        ids = list(range(len(texts)))
+    sep_tokens = len(encoding.encode_ordinary(SEPARATOR))
+
+    # 1. 批量编码，只保留非空文档
+    items = [(doc_id, text) for doc_id, text in zip(ids, texts) if text]
+    encoded = encode_all([text for _, text in items], encoding)
+
+    # 2. 超长文档按 token 边界切片
+    pieces = []
+    for (doc_id, text), tokens in zip(items, encoded):
+        if len(tokens) <= max_tokens:
+            pieces.append((len(tokens), doc_id, text))
+        else:
+            for n_tokens, piece in split_tokens(tokens, max_tokens, encoding):
+                pieces.append((n_tokens, doc_id, piece))
+
+    # 3. First-Fit-Decreasing 装箱（每多一个文档多占一个分隔符的 token）
+    pieces.sort(key=lambda p: p[0], reverse=True)
+    bins = []
+    tree = _FirstFitTree()
+    for n_tokens, doc_id, text in pieces:
+        index = tree.first_fit(n_tokens + sep_tokens)
+        if index == -1:
+            index = len(bins)
+            bins.append({"texts": [text], "ids": [doc_id], "tokens": n_tokens})
+        else:
+            b = bins[index]
+            b["texts"].append(text)
+            b["ids"].append(doc_id)
+            b["tokens"] += n_tokens + sep_tokens
+        tree.set(index, max_tokens - bins[index]["tokens"])
+
+    return [{"text": SEPARATOR.join(b["texts"]), "ids": b["ids"], "tokens": b["tokens"]} for b in bins]
+
+
+def fill_ratio(batches, max_tokens):
+    """批次平均填充率（总 token / 批次数 * 上限）"""
+    if not batches:
+        return 0.0
+    return sum(b["tokens"] for b in batches) / (len(batches) * max_tokens)
@@ -1,10 +1,15 @@
 import requests
-import sqlite3
+import os
 import time
 import html
 import traceback
 import re
 import argparse
+import threading
+import queue
+from collections import deque
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 
 # YouTube
@@ -23,13 +28,28 @@ except ImportError:
     SELENIUM_AVAILABLE = False
     print("Warning: Selenium 爬虫未安装，将只使用 Nitter 镜像站")
 from data_cleaning import process_data
+from db import connection
+from migrate import migrate, create_raw_task_indexes
+import transcript_cache
+import cpu_pool
 
 
-DB_NAME = "multi_source.db"
+# 字幕抓取: 并发数、单视频截止时间、整个阶段的总预算（秒）
+TRANSCRIPT_WORKERS = int(os.getenv("TRANSCRIPT_WORKERS", "8"))
+TRANSCRIPT_VIDEO_TIMEOUT = float(os.getenv("TRANSCRIPT_VIDEO_TIMEOUT", "20"))
+TRANSCRIPT_STAGE_TIMEOUT = float(os.getenv("TRANSCRIPT_STAGE_TIMEOUT", "60"))
+
+# 每个数据源同时进行的采集数上限（所有任务共享）：多个订阅同时运行时不会对同一站点并发请求过多
+SOURCE_CONCURRENCY = {
+    "reddit": int(os.getenv("COLLECT_REDDIT_CONCURRENCY", "2")),
+    "youtube": int(os.getenv("COLLECT_YOUTUBE_CONCURRENCY", "2")),
+    "twitter": int(os.getenv("COLLECT_TWITTER_CONCURRENCY", "1")),
+}
+_source_slots = {name: threading.BoundedSemaphore(n) for name, n in SOURCE_CONCURRENCY.items()}
 
 # ----------------- 1. 初始化数据库 (优化连接管理) -----------------
 def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
+    with connection() as conn:
         cur = conn.cursor()
 
         # 采集任务表
@@ -87,17 +107,60 @@ def init_db():
             url TEXT
         )
         """)
+
+        create_raw_task_indexes(cur)
         conn.commit()
 
-# ----------------- 2. 创建采集任务 -----------------
+    migrate()
+
+# ----------------- 2. 创建采集任务 & 批量写入 -----------------
+# 每个数据源的目标表及列顺序（task_id 由写入层注入）
+RECORD_TABLES = {
+    "reddit": ("reddit_submission", ["post_id", "task_id", "title", "subreddit", "score", "num_comments",
+                                     "created_utc", "is_self", "is_stickied", "url"]),
+    "youtube": ("youtube_video", ["video_id", "task_id", "title", "channel", "published_at",
+                                  "view_count", "url", "transcript"]),
+    "twitter": ("twitter_tweet", ["tweet_id", "task_id", "content", "username", "created_at",
+                                  "retweet_count", "like_count", "url"]),
+}
+
+def _insert_task(cur, source_type, keyword, language, limit_count):
+    cur.execute("""
+    INSERT INTO crawl_task (source_type, keyword, language, limit_count, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    """, (source_type, keyword, language, limit_count, int(time.time())))
+    return cur.lastrowid
+
+def bulk_insert(conn, source_type, task_id, records):
+    """用 executemany 一次性写入一批记录（不提交，由调用方控制事务）"""
+    table, columns = RECORD_TABLES[source_type]
+    # task_id 放在最后一列，其余字段用 itemgetter 一次取出；行以生成器交给 executemany，不先建中间列表
+    fields = [c for c in columns if c != "task_id"]
+    sql = (f"INSERT OR IGNORE INTO {table} ({', '.join(fields)}, task_id) "
+           f"VALUES ({', '.join('?' * (len(fields) + 1))})")
+    get_fields = itemgetter(*fields)
+    conn.executemany(sql, (get_fields(r) + (task_id,) for r in records))
+    return len(records)
+
 def create_task(source_type, keyword, language, limit_count):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        cur.execute("""
-        INSERT INTO crawl_task (source_type, keyword, language, limit_count, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """, (source_type, keyword, language, limit_count, int(time.time())))
-        task_id = cur.lastrowid
+    with connection() as conn:
+        task_id = _insert_task(conn.cursor(), source_type, keyword, language, limit_count)
+        conn.commit()
+    return task_id
+
+def save_records(source_type, task_id, records):
+    """在单个事务中批量写入某个任务的记录"""
+    if not records: return
+    with connection() as conn:
+        bulk_insert(conn, source_type, task_id, records)
+        conn.commit()
+
+def save_task_with_records(source_type, keyword, language, limit_count, records):
+    """在同一个事务中创建任务并写入其记录，任一步失败则整体回滚"""
+    with connection() as conn:
+        task_id = _insert_task(conn.cursor(), source_type, keyword, language, limit_count)
+        if records:
+            bulk_insert(conn, source_type, task_id, records)
         conn.commit()
     return task_id
 
@@ -143,21 +206,7 @@ def fetch_reddit(keyword, limit=30, language="en"):
         return []
 
 def save_reddit(task_id, posts):
-    if not posts: return
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        for p in posts:
-            cur.execute("""
-            INSERT OR IGNORE INTO reddit_submission
-            (post_id, task_id, title, subreddit, score, num_comments,
-             created_utc, is_self, is_stickied, url)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                p["post_id"], task_id, p["title"], p["subreddit"],
-                p["score"], p["num_comments"], p["created_utc"],
-                p["is_self"], p["is_stickied"], p["url"]
-            ))
-        conn.commit()
+    save_records("reddit", task_id, posts)
 
 # ----------------- 4. YouTube (处理数字转换) -----------------
 def parse_view_count(view_text):
@@ -204,43 +253,184 @@ def fetch_youtube(keyword, limit=10, language="en"):
         print(f"❌ YouTube 搜索失败: {e}")
         return []
 
-def fetch_transcripts(videos, lang='en'):
-    for v in videos:
+def fetch_transcript(video_id, lang='en'):
+    """获取单个视频的字幕文本，无字幕时返回空字符串"""
+    transcript_obj = YouTubeTranscriptApi.list_transcripts(video_id)
+    # 优先找手动字幕，没有则找自动生成的
+    try:
+        t = transcript_obj.find_manually_created_transcript([lang])
+    except:
+        t = transcript_obj.find_generated_transcript([lang])
+
+    transcript_list = t.fetch()
+    return " ".join([x["text"] for x in transcript_list])
+
+def fetch_transcripts(videos, lang='en', max_workers=TRANSCRIPT_WORKERS,
+                      video_timeout=TRANSCRIPT_VIDEO_TIMEOUT, stage_timeout=TRANSCRIPT_STAGE_TIMEOUT):
+    """
+    并发获取字幕
+    max_workers: 同时进行的请求数
+    video_timeout: 单个视频的最长等待秒数，超时视为无字幕，并让出名额给下一个视频
+    stage_timeout: 整个字幕阶段的总预算，到期后未完成的视频直接放弃
+    超时的视频 transcript 置为空，其余结果按原顺序写回 videos
+    每个请求在守护线程中执行：被放弃的请求无法中断，但不再占用并发名额，也不会阻止进程退出
+    """
+    if not videos:
+        return videos
+
+    # 先查磁盘缓存，只对未命中的视频发起网络请求
+    misses = []
+    for i, v in enumerate(videos):
+        cached = transcript_cache.get(v["video_id"], lang)
+        if cached is None:
+            misses.append(i)
+        else:
+            v["transcript"] = cached
+    if len(misses) < len(videos):
+        stats = transcript_cache.get_stats()
+        print(f"   💾 字幕缓存命中 {len(videos) - len(misses)}/{len(videos)} (累计命中率 {stats['hit_rate']:.0%})")
+    if not misses:
+        return videos
+
+    results = queue.Queue()
+    todo = deque(misses)
+    running = {}  # 视频下标 -> 开始时间
+    abandoned = []
+
+    def worker(idx, video_id):
         try:
-            transcript_obj = YouTubeTranscriptApi.list_transcripts(v["video_id"])
-            # 优先找手动字幕，没有则找自动生成的
-            try:
-                t = transcript_obj.find_manually_created_transcript([lang])
-            except:
-                t = transcript_obj.find_generated_transcript([lang])
-            
-            transcript_list = t.fetch()
-            v["transcript"] = " ".join([x["text"] for x in transcript_list])
+            results.put((idx, fetch_transcript(video_id, lang), None))
+        except Exception as e:
+            results.put((idx, None, e))
+
+    def launch():
+        while todo and len(running) < max_workers:
+            idx = todo.popleft()
+            running[idx] = time.monotonic()
+            threading.Thread(target=worker, args=(idx, videos[idx]["video_id"]),
+                             name=f"transcript-{idx}", daemon=True).start()
+
+    stage_deadline = time.monotonic() + stage_timeout
+    launch()
+    while running:
+        now = time.monotonic()
+        if now >= stage_deadline:
+            break
+
+        # 放弃已超过单视频截止时间的请求，空出的名额交给排队的视频
+        for idx, started in list(running.items()):
+            if now - started >= video_timeout:
+                del running[idx]
+                abandoned.append(idx)
+        launch()
+        if not running:
+            break
+
+        try:
+            idx, text, error = results.get(timeout=min(0.5, stage_deadline - now))
+        except queue.Empty:
+            continue
+        if running.pop(idx, None) is None:
+            # 已放弃的视频迟到的结果直接丢弃
+            continue
+        launch()
+
+        v = videos[idx]
+        if error is None:
+            v["transcript"] = text
+            transcript_cache.put(v["video_id"], text, lang)
             print(f"   ✅ 获取字幕成功: {v['title'][:20]}...")
-        except (TranscriptsDisabled, NoTranscriptFound):
+        elif isinstance(error, (TranscriptsDisabled, NoTranscriptFound)):
             print(f"   ⚠️ 无字幕: {v['title'][:20]}...")
             v["transcript"] = ""
-        except Exception as e:
-            # print(f"   ❌ 字幕获取出错 {v['video_id']}: {e}")
+            # 确认无字幕的结果同样缓存，避免重复请求
+            transcript_cache.put(v["video_id"], "", lang)
+        else:
+            # print(f"   ❌ 字幕获取出错 {v['video_id']}: {error}")
             v["transcript"] = ""
+
+    # 不等待慢请求，直接返回已拿到的部分结果
+    abandoned.extend(running)
+    abandoned.extend(todo)
+    if abandoned:
+        for idx in abandoned:
+            videos[idx]["transcript"] = ""
+        print(f"   ⏱️ 字幕阶段超时: 放弃 {len(abandoned)}/{len(misses)} 个视频")
+
     return videos
 
 def save_youtube(task_id, videos):
-    if not videos: return
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        for v in videos:
-            cur.execute("""
-            INSERT OR IGNORE INTO youtube_video
-            (video_id, task_id, title, channel, published_at, view_count, url, transcript)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                v["video_id"], task_id, v["title"], v["channel"],
-                v["published_at"], v["view_count"], v["url"], v["transcript"]
-            ))
-        conn.commit()
+    save_records("youtube", task_id, videos)
 
 # ----------------- 5. Twitter (使用 Nitter 镜像站) -----------------
+def parse_nitter_page(page_html, limit):
+    """解析 Nitter 搜索结果页，最多返回 limit 条推文"""
+    tweets = []
+    soup = BeautifulSoup(page_html, "html.parser")
+    items = soup.select(".timeline-item")
+    
+    for item in items:
+        if len(tweets) >= limit:
+            break
+            
+        # 排除非推文项（如"加载更多"）
+        if "show-more" in item.get("class", []):
+            continue
+        
+        try:
+            # 提取推文 ID 和 URL
+            tweet_link_el = item.select_one(".tweet-link")
+            if not tweet_link_el:
+                continue
+            tweet_path = tweet_link_el.get("href")  # /username/status/123456#m
+            tweet_id = tweet_path.split("/")[-1].split("#")[0]
+            
+            # 提取内容
+            content_el = item.select_one(".tweet-content")
+            content = content_el.get_text(strip=True) if content_el else ""
+            
+            # 提取用户名
+            username_el = item.select_one(".username")
+            username = username_el.get_text(strip=True) if username_el else ""
+            
+            # 提取时间
+            date_el = item.select_one(".tweet-date a")
+            created_at = date_el.get("title") if date_el else ""
+            
+            # 提取统计数据
+            stats = item.select(".tweet-stats .icon-container")
+            retweet_count = 0
+            like_count = 0
+            for stat in stats:
+                text = stat.get_text(strip=True).replace(",", "")
+                if not text:
+                    continue
+                
+                # 根据图标类名判断
+                icon = stat.select_one("span")
+                if not icon:
+                    continue
+                icon_class = icon.get("class", [])
+                
+                if "icon-retweet" in icon_class:
+                    retweet_count = int(text) if text.isdigit() else 0
+                elif "icon-heart" in icon_class:
+                    like_count = int(text) if text.isdigit() else 0
+
+            tweets.append({
+                "tweet_id": tweet_id,
+                "content": content,
+                "username": username,
+                "created_at": created_at,
+                "retweet_count": retweet_count,
+                "like_count": like_count,
+                "url": f"https://twitter.com{tweet_path.split('#')[0]}"
+            })
+        except Exception as e:
+            # print(f"   ❌ 解析单条推文失败: {e}")
+            continue
+    return tweets
+
 def fetch_twitter(keyword, limit=30, language="en"):
     """使用 Nitter 镜像站抓取推文内容"""
     # 可用的 Nitter 实例列表
@@ -270,69 +460,8 @@ def fetch_twitter(keyword, limit=30, language="en"):
                 print(f"   ⚠️ {instance} 返回状态码 {resp.status_code}")
                 continue
                 
-            soup = BeautifulSoup(resp.text, "html.parser")
-            items = soup.select(".timeline-item")
-            
-            for item in items:
-                if len(tweets) >= limit:
-                    break
-                    
-                # 排除非推文项（如"加载更多"）
-                if "show-more" in item.get("class", []):
-                    continue
-                
-                try:
-                    # 提取推文 ID 和 URL
-                    tweet_link_el = item.select_one(".tweet-link")
-                    if not tweet_link_el:
-                        continue
-                    tweet_path = tweet_link_el.get("href")  # /username/status/123456#m
-                    tweet_id = tweet_path.split("/")[-1].split("#")[0]
-                    
-                    # 提取内容
-                    content_el = item.select_one(".tweet-content")
-                    content = content_el.get_text(strip=True) if content_el else ""
-                    
-                    # 提取用户名
-                    username_el = item.select_one(".username")
-                    username = username_el.get_text(strip=True) if username_el else ""
-                    
-                    # 提取时间
-                    date_el = item.select_one(".tweet-date a")
-                    created_at = date_el.get("title") if date_el else ""
-                    
-                    # 提取统计数据
-                    stats = item.select(".tweet-stats .icon-container")
-                    retweet_count = 0
-                    like_count = 0
-                    for stat in stats:
-                        text = stat.get_text(strip=True).replace(",", "")
-                        if not text:
-                            continue
-                        
-                        # 根据图标类名判断
-                        icon = stat.select_one("span")
-                        if not icon:
-                            continue
-                        icon_class = icon.get("class", [])
-                        
-                        if "icon-retweet" in icon_class:
-                            retweet_count = int(text) if text.isdigit() else 0
-                        elif "icon-heart" in icon_class:
-                            like_count = int(text) if text.isdigit() else 0
-
-                    tweets.append({
-                        "tweet_id": tweet_id,
-                        "content": content,
-                        "username": username,
-                        "created_at": created_at,
-                        "retweet_count": retweet_count,
-                        "like_count": like_count,
-                        "url": f"https://twitter.com{tweet_path.split('#')[0]}"
-                    })
-                except Exception as e:
-                    # print(f"   ❌ 解析单条推文失败: {e}")
-                    continue
+            # HTML 解析是 CPU 密集的，启用 cpu_pool 时在子进程中执行
+            tweets.extend(cpu_pool.run(parse_nitter_page, resp.text, limit - len(tweets)))
                     
             if tweets:
                 print(f"   ✅ 从 {instance} 成功获取 {len(tweets)} 条推文")
@@ -359,66 +488,103 @@ def fetch_twitter(keyword, limit=30, language="en"):
     return tweets
 
 def save_twitter(task_id, tweets):
-    if not tweets:
-        return
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        for t in tweets:
-            cur.execute("""
-            INSERT OR IGNORE INTO twitter_tweet
-            (tweet_id, task_id, content, username, created_at, retweet_count, like_count, url)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                t["tweet_id"], task_id, t["content"], t["username"],
-                t["created_at"], t["retweet_count"], t["like_count"], t["url"]
-            ))
-        conn.commit()
+    save_records("twitter", task_id, tweets)
 
 # ----------------- 6. 统一采集入口 -----------------
-def run_collection(keyword, language="en", reddit_limit=30, youtube_limit=30, twitter_limit=30, progress_callback=None):
+def collect_reddit(keyword, language, limit, update_progress):
+    update_progress(f"[Reddit] 正在抓取 '{keyword}'...")
+    posts = fetch_reddit(keyword, limit, language)
+    update_progress(f"[Reddit] 正在保存数据...")
+    task_id = save_task_with_records("reddit", keyword, language, limit, posts)
+    update_progress(f"[Reddit] 成功保存 {len(posts)} 条帖子")
+    return task_id, len(posts)
+
+def collect_youtube(keyword, language, limit, update_progress):
+    update_progress(f"[YouTube] 正在抓取 '{keyword}'...")
+    videos = fetch_youtube(keyword, limit, language)
+    if videos:
+        update_progress(f"[YouTube] 正在获取字幕...")
+        videos = fetch_transcripts(videos, language)
+        update_progress(f"[YouTube] 正在保存数据...")
+    task_id = save_task_with_records("youtube", keyword, language, limit, videos)
+    update_progress(f"[YouTube] 成功保存 {len(videos)} 个视频")
+    return task_id, len(videos)
+
+def collect_twitter(keyword, language, limit, update_progress):
+    update_progress(f"[Twitter] 正在抓取 '{keyword}'...")
+    tweets = fetch_twitter(keyword, limit, language)
+    update_progress(f"[Twitter] 正在保存数据...")
+    task_id = save_task_with_records("twitter", keyword, language, limit, tweets)
+    update_progress(f"[Twitter] 成功保存 {len(tweets)} 条推文")
+    return task_id, len(tweets)
+
+def _timed(source, func, *args):
+    """执行单个数据源的采集（受 SOURCE_CONCURRENCY 限制），返回 task_id、条数、耗时与排队等待秒数"""
+    start = time.perf_counter()
+    with _source_slots[source]:
+        waited = time.perf_counter() - start
+        try:
+            task_id, count = func(*args)
+        except Exception as e:
+            print(f"❌ [{source}] 采集异常: {e}")
+            traceback.print_exc()
+            task_id, count = None, 0
+    return {"task_id": task_id, "count": count, "elapsed": round(time.perf_counter() - start, 3),
+            "waited": round(waited, 3)}
+
+def run_collection(keyword, language="en", reddit_limit=30, youtube_limit=30, twitter_limit=30,
+                   progress_callback=None, concurrent=True):
     """
     采集数据
     progress_callback: 可选的进度回调函数，签名为 progress_callback(message)
+    concurrent: 为 True 时三个数据源在线程池中并行采集，否则按顺序采集
+    返回: 每个数据源的 task_id、条数、耗时与等待并发名额的时间，
+          例如 {"reddit": {"task_id": 1, "count": 30, "elapsed": 1.2, "waited": 0.0}, ...}
     """
+    progress_lock = threading.Lock()
+
     def update_progress(msg):
-        print(msg)
-        if progress_callback:
-            progress_callback(msg)
-    
+        # 并行模式下回调会被多个线程调用，加锁保证顺序输出
+        with progress_lock:
+            print(msg)
+            if progress_callback:
+                progress_callback(msg)
+
     update_progress("--- 正在初始化数据库 ---")
     init_db()
 
-    # -------- Reddit ----------
-    reddit_task_id = create_task("reddit", keyword, language, reddit_limit)
-    update_progress(f"[Reddit] 正在抓取 '{keyword}'...")
-    reddit_posts = fetch_reddit(keyword, reddit_limit, language)
-    update_progress(f"[Reddit] 正在保存数据...")
-    save_reddit(reddit_task_id, reddit_posts)
-    update_progress(f"[Reddit] 成功保存 {len(reddit_posts)} 条帖子")
+    sources = [
+        ("reddit", collect_reddit, reddit_limit),
+        ("youtube", collect_youtube, youtube_limit),
+        ("twitter", collect_twitter, twitter_limit),
+    ]
 
-    # -------- YouTube ----------
-    youtube_task_id = create_task("youtube", keyword, language, youtube_limit)
-    update_progress(f"[YouTube] 正在抓取 '{keyword}'...")
-    youtube_videos = fetch_youtube(keyword, youtube_limit, language)
-    if youtube_videos:
-        update_progress(f"[YouTube] 正在获取字幕...")
-        youtube_videos = fetch_transcripts(youtube_videos, language)
-        update_progress(f"[YouTube] 正在保存数据...")
-        save_youtube(youtube_task_id, youtube_videos)
-    update_progress(f"[YouTube] 成功保存 {len(youtube_videos)} 个视频")
+    start = time.perf_counter()
+    results = {}
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = {
+                name: executor.submit(_timed, name, func, keyword, language, limit, update_progress)
+                for name, func, limit in sources
+            }
+            for name, future in futures.items():
+                results[name] = future.result()
+    else:
+        for name, func, limit in sources:
+            results[name] = _timed(name, func, keyword, language, limit, update_progress)
+    total_elapsed = round(time.perf_counter() - start, 3)
 
-    # -------- Twitter ----------
-    twitter_task_id = create_task("twitter", keyword, language, twitter_limit)
-    update_progress(f"[Twitter] 正在抓取 '{keyword}'...")
-    twitter_posts = fetch_twitter(keyword, twitter_limit, language)
-    update_progress(f"[Twitter] 正在保存数据...")
-    save_twitter(twitter_task_id, twitter_posts)
-    update_progress(f"[Twitter] 成功保存 {len(twitter_posts)} 条推文")
+    timing = ", ".join(f"{name} {r['elapsed']}s" for name, r in results.items())
+    update_progress(f"⏱️ 采集耗时: {timing} (总计 {total_elapsed}s)")
 
     # -------- 自动清洗 ----------
     update_progress("--- 正在清洗数据 ---")
-    task_ids = [reddit_task_id, youtube_task_id, twitter_task_id]
-    process_data(keyword, task_ids)
+    task_ids = [r["task_id"] for r in results.values() if r["task_id"] is not None]
+    if task_ids:
+        process_data(keyword, task_ids)
+
+    results["total_elapsed"] = total_elapsed
+    return results
 
 # ----------------- 主程序 -----------------
 def main():
@@ -428,6 +594,7 @@ def main():
     parser.add_argument("--reddit", type=int, default=30, help="Reddit 抓取限制")
     parser.add_argument("--youtube", type=int, default=30, help="YouTube 抓取限制")
     parser.add_argument("--twitter", type=int, default=30, help="Twitter 抓取限制")
+    parser.add_argument("--sequential", action="store_true", help="按顺序采集各数据源（默认并行）")
     
     args = parser.parse_args()
 
@@ -446,7 +613,8 @@ def main():
         youtube_limit = args.youtube
         twitter_limit = args.twitter
     
-    run_collection(keyword, language, reddit_limit, youtube_limit, twitter_limit)
+    run_collection(keyword, language, reddit_limit, youtube_limit, twitter_limit,
+                   concurrent=not args.sequential)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
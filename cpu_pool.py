@@ -0,0 +1,88 @@
+"""
+CPU 密集阶段的可选进程池
+- 文本清洗、时间解析、本地情感打分、HTML 解析都是纯 Python 计算，在调度线程或 API 线程池里执行时
+  一直占着 GIL，会拖慢同一进程里的接口响应；CPU_WORKERS > 0 时这些阶段改在子进程中执行
+- map_chunks 把输入按 CPU_CHUNK_SIZE 切块分发给各子进程，结果按原顺序拼接
+- CPU_WORKERS = 0（默认）时直接在当前线程执行，行为与不使用进程池完全相同
+- 子进程以 spawn 方式启动（父进程有多个线程，fork 不安全），首次使用时创建；
+  进程池异常退出时回退为在当前线程执行
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0"))
+CPU_CHUNK_SIZE = int(os.getenv("CPU_CHUNK_SIZE", "1000"))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def enabled():
+    return CPU_WORKERS > 0
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+def _discard_broken(e):
+    global _executor
+    logger.warning(f"进程池异常，改为在当前线程执行: {e}")
+    with _lock:
+        _executor = None
+
+
+def run(func, *args):
+    """执行单个任务：启用进程池时在子进程中执行并等待结果"""
+    if not enabled():
+        return func(*args)
+    try:
+        return get_executor().submit(func, *args).result()
+    except BrokenProcessPool as e:
+        _discard_broken(e)
+        return func(*args)
+
+
+def map_chunks(func, *columns, chunk_size=None):
+    """
+    func(*column_slices) 返回与切片等长的结果列表；columns 为等长的列表
+    按 chunk_size 切块分发到子进程并按原顺序拼接；未启用进程池或数据不足一块时直接调用 func
+    """
+    chunk_size = chunk_size or CPU_CHUNK_SIZE
+    n = len(columns[0])
+    if not enabled() or n <= chunk_size:
+        return func(*columns)
+    try:
+        executor = get_executor()
+        futures = [executor.submit(func, *(c[start:start + chunk_size] for c in columns))
+                   for start in range(0, n, chunk_size)]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+    except BrokenProcessPool as e:
+        _discard_broken(e)
+        return func(*columns)
@@ -1,11 +1,30 @@
-import sqlite3
 import re
 import html
-import json
 from datetime import datetime
+import numpy as np
 import pandas as pd
+from db import get_connection
+from migrate import migrate
+import near_dup
+import sentiment
+import keyword_stats
+import cpu_pool
+from engagement import ENGAGEMENT_FIELDS
+
+# 预编译的清洗正则（clean_text 与 clean_text_series 共用）
+URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+# 保留中文字符、英文字符、数字和基本标点，去除其他杂质 (\u4e00-\u9fa5 是中文范围)
+JUNK_RE = re.compile(r'[^\w\s\u4e00-\u9fa5,.!?，。！？]')
+JUNK_RUN_RE = re.compile(JUNK_RE.pattern + '+')
+SPACE_RE = re.compile(r'\s+')
+
+# 已知 pd.to_datetime 无法解析、会原样返回的时间格式，直接跳过解析
+# Nitter: "Jan 15, 2024 · 3:45 PM UTC"；YouTube: "2 days ago" / "Streamed 3 weeks ago"
+NITTER_TIME_RE = re.compile(r'^[A-Z][a-z]{2} \d{1,2}, \d{4} · \d{1,2}:\d{2} [AP]M UTC$')
+YOUTUBE_RELATIVE_RE = re.compile(r'^(?:Streamed |Premiered )?\d+ (?:second|minute|hour|day|week|month|year)s? ago$')
+# ISO-8601 字符串可批量解析；按时区后缀分组，保证与逐条解析结果一致
+ISO_TIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?(Z|[+-]\d{2}:\d{2})?$')
 
-DB_NAME = "multi_source.db"
 
 def clean_text(text):
     if not text:
@@ -15,17 +34,30 @@ def clean_text(text):
     text = html.unescape(text)
     
     # 2. 去除 URL 链接
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = URL_RE.sub('', text)
     
-    # 3. 保留中文字符、英文字符、数字和基本标点，去除其他杂质
-    # \u4e00-\u9fa5 是中文范围
-    text = re.sub(r'[^\w\s\u4e00-\u9fa5,.!?，。！？]', '', text)
+    # 3. 去除杂质字符
+    text = JUNK_RE.sub('', text)
     
     # 4. 规范化空白字符
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = SPACE_RE.sub(' ', text).strip()
     
     return text
 
+def _clean_text_fast(text):
+    """与 clean_text 等价，但跳过无效步骤：无 '&' 不解码、无 'http' 不匹配 URL，杂质按连续片段删除"""
+    if not text:
+        return ""
+    if '&' in text:
+        text = html.unescape(text)
+    if 'http' in text:
+        text = URL_RE.sub('', text)
+    return ' '.join(JUNK_RUN_RE.sub('', text).split())
+
+def clean_text_series(series):
+    """clean_text 的批量版本，输出与逐条调用 clean_text 相同"""
+    return pd.Series([_clean_text_fast(t) for t in series.tolist()], index=series.index, dtype=object)
+
 def normalize_time(val):
     """将各种时间格式统一为 ISO-8601 字符串"""
     if not val:
@@ -50,82 +82,208 @@ def normalize_time(val):
     
     return str(val)
 
-def process_data(keyword="unknown", task_ids=None):
+def normalize_time_series(series):
+    """
+    normalize_time 的向量化版本，输出与逐条调用 normalize_time 相同
+    - Unix 时间戳 (Reddit) 直接用 datetime.fromtimestamp 转换
+    - Nitter / YouTube 相对时间等已知无法解析的格式原样返回
+    - ISO-8601 字符串按时区后缀分组，每组一次 pd.to_datetime
+    - 其余值按唯一值回退到 normalize_time
+    """
+    values = series.tolist()
+    result = [None] * len(values)
+    iso_groups = {}
+    fallback = []
+
+    for i, val in enumerate(values):
+        if not val:
+            continue
+        kind = type(val)
+        if kind is int or (kind is float and val == val):
+            try:
+                result[i] = datetime.fromtimestamp(val).isoformat()
+            except (OverflowError, OSError, ValueError):
+                fallback.append(i)
+        elif kind is str:
+            val_str = val.strip()
+            if NITTER_TIME_RE.match(val_str) or YOUTUBE_RELATIVE_RE.match(val_str):
+                result[i] = val
+                continue
+            m = ISO_TIME_RE.match(val_str)
+            if m:
+                iso_groups.setdefault(m.group(1), []).append(i)
+            else:
+                fallback.append(i)
+        else:
+            fallback.append(i)
+
+    for positions in iso_groups.values():
+        parsed = pd.to_datetime([values[i].strip() for i in positions], errors='coerce', format='ISO8601')
+        for i, dt in zip(positions, parsed):
+            if pd.notnull(dt):
+                result[i] = dt.isoformat()
+            else:
+                fallback.append(i)
+
+    cache = {}
+    for i in fallback:
+        val = values[i]
+        key = (type(val), val)
+        if key not in cache:
+            cache[key] = normalize_time(val)
+        result[i] = cache[key]
+
+    return pd.Series(result, index=series.index, dtype=object)
+
+SOURCE_TABLES = ("reddit_submission", "youtube_video", "twitter_tweet")
+
+def get_watermarks(conn, keyword):
+    """读取每个原始表在该关键词下已清洗到的最大 rowid"""
+    rows = conn.execute(
+        "SELECT source_table, last_rowid FROM cleaning_watermark WHERE keyword = ?", (keyword,)
+    ).fetchall()
+    marks = {table: 0 for table in SOURCE_TABLES}
+    marks.update({r[0]: r[1] for r in rows})
+    return marks
+
+def save_watermarks(conn, keyword, marks):
+    conn.executemany("""
+    INSERT INTO cleaning_watermark (source_table, keyword, last_rowid) VALUES (?, ?, ?)
+    ON CONFLICT(source_table, keyword) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)
+    """, [(table, keyword, rowid) for table, rowid in marks.items()])
+
+# 每个原始表的读取列和字段映射；互动字段（engagement.PLATFORM_FIELDS）在原始表中同名
+SOURCES = {
+    "reddit_submission": {
+        "platform": "reddit",
+        "columns": "post_id, title, subreddit, score, created_utc, url",
+        "rename": {'post_id': 'raw_id', 'title': 'content', 'subreddit': 'author', 'created_utc': 'raw_time'},
+    },
+    "youtube_video": {
+        "platform": "youtube",
+        "columns": "video_id, title, channel, published_at, view_count, url",
+        "rename": {'video_id': 'raw_id', 'title': 'content', 'channel': 'author', 'published_at': 'raw_time'},
+    },
+    "twitter_tweet": {
+        "platform": "twitter",
+        "columns": "tweet_id, content, username, created_at, retweet_count, like_count, url",
+        "rename": {'tweet_id': 'raw_id', 'username': 'author', 'created_at': 'raw_time'},
+    },
+}
+
+# 流式清洗时每批读取的原始行数，峰值内存与该值成正比，与表大小无关
+CHUNK_SIZE = 5000
+
+OUTPUT_COLUMNS = (['platform', 'raw_id', 'content', 'author', 'timestamp', 'url', 'keyword',
+                   'sentiment', 'sentiment_confident'] + list(ENGAGEMENT_FIELDS))
+
+def clean_rows(contents, raw_times):
+    """
+    清洗中 CPU 密集的部分：文本清洗、时间解析、本地情感打分（启用 cpu_pool 时在子进程中执行）
+    返回与输入等长的 [(content, timestamp, sentiment, sentiment_confident), ...]
+    """
+    content = clean_text_series(pd.Series(contents, dtype=object))
+    timestamps = normalize_time_series(pd.Series(raw_times, dtype=object))
+    scores, confident = sentiment.score_series(content)
+    return list(zip(content.tolist(), timestamps.tolist(), scores.tolist(), confident.astype(int).tolist()))
+
+def clean_chunk(df, source, keyword):
+    """把一批原始行转换为 cleaned_data 的行"""
+    df = df.rename(columns=source["rename"])
+    df['platform'] = source["platform"]
+    # 互动字段转为数值列：非数字 / 无穷大记为 NULL，该平台没有的字段也为 NULL
+    for field in ENGAGEMENT_FIELDS:
+        if field in df.columns:
+            df[field] = pd.to_numeric(df[field], errors='coerce').astype(float).replace([np.inf, -np.inf], np.nan)
+        else:
+            df[field] = np.nan
+    rows = cpu_pool.map_chunks(clean_rows, df['content'].tolist(), df['raw_time'].tolist())
+    content, timestamps, scores, confident = zip(*rows) if rows else ((), (), (), ())
+    df['content'] = pd.Series(content, index=df.index, dtype=object)
+    df['timestamp'] = pd.Series(timestamps, index=df.index, dtype=object)
+    df['keyword'] = keyword
+    df['sentiment'] = np.array(scores, dtype=float)
+    df['sentiment_confident'] = np.array(confident, dtype=int)
+    return df.drop_duplicates(subset=['platform', 'raw_id'])[OUTPUT_COLUMNS]
+
+def upsert_cleaned(conn, df):
+    """(platform, raw_id, keyword) 唯一，已存在的行就地更新，重复运行不会产生重复行"""
+    columns = list(df.columns)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in ('platform', 'raw_id', 'keyword'))
+    cur = conn.executemany(f"""
+    INSERT INTO cleaned_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+    ON CONFLICT(platform, raw_id, keyword) DO UPDATE SET {updates}
+    """, df.itertuples(index=False, name=None))
+    return cur.rowcount
+
+def process_data(keyword="unknown", task_ids=None, incremental=True, chunk_size=CHUNK_SIZE):
+    """
+    清洗原始数据并写入 cleaned_data
+    task_ids: 只处理这些采集任务的数据
+    incremental: 未指定 task_ids 时，只处理上次清洗之后新增的原始行（按 rowid 高水位）；
+                 为 False 时重新清洗全部历史数据
+    chunk_size: 每个原始表按 rowid 分批读取，每批清洗并写入后再读下一批，内存占用不随表大小增长；
+                近似重复检测与情感补打分也按同样的批大小处理
+    写入使用 (platform, raw_id, keyword) 上的 upsert，重复运行结果不变
+    写入后对新行做近似重复检测（见 near_dup），结果记录在 near_dup_doc 中
+    每行同时写入本地情感预打分（见 sentiment），并增量更新 keyword_stats 聚合表
+    """
     print(f"🚀 开始数据清洗流程 (关键词: {keyword})...")
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
+    migrate(conn)
     
-    # 如果指定了 task_ids，只处理这些任务的数据
-    if task_ids:
-        task_filter = f"WHERE task_id IN ({','.join(map(str, task_ids))})"
-    else:
-        task_filter = ""
-    
-    # 1. 读取 Reddit 数据
-    print("📥 读取 Reddit 数据...")
-    reddit_query = f"SELECT post_id, title, subreddit, score, created_utc, url FROM reddit_submission {task_filter}"
-    reddit_df = pd.read_sql_query(reddit_query, conn)
-    reddit_df = reddit_df.rename(columns={
-        'post_id': 'raw_id',
-        'title': 'content',
-        'subreddit': 'author',
-        'created_utc': 'raw_time'
-    })
-    reddit_df['platform'] = 'reddit'
-    reddit_df['engagement'] = reddit_df['score'].apply(lambda x: json.dumps({'score': x}))
-
-    # 2. 读取 YouTube 数据
-    print("📥 读取 YouTube 数据...")
-    youtube_query = f"SELECT video_id, title, channel, published_at, view_count, url FROM youtube_video {task_filter}"
-    youtube_df = pd.read_sql_query(youtube_query, conn)
-    youtube_df = youtube_df.rename(columns={
-        'video_id': 'raw_id',
-        'title': 'content',
-        'channel': 'author',
-        'published_at': 'raw_time'
-    })
-    youtube_df['platform'] = 'youtube'
-    youtube_df['engagement'] = youtube_df['view_count'].apply(lambda x: json.dumps({'view_count': x}))
-
-    # 3. 读取 Twitter 数据
-    print("📥 读取 Twitter 数据...")
-    twitter_query = f"SELECT tweet_id, content, username, created_at, retweet_count, like_count, url FROM twitter_tweet {task_filter}"
-    twitter_df = pd.read_sql_query(twitter_query, conn)
-    twitter_df = twitter_df.rename(columns={
-        'tweet_id': 'raw_id',
-        'username': 'author',
-        'created_at': 'raw_time'
-    })
-    twitter_df['platform'] = 'twitter'
-    twitter_df['engagement'] = twitter_df.apply(lambda r: json.dumps({'retweet_count': r['retweet_count'], 'like_count': r['like_count']}), axis=1)
-
-    # 合并所有数据
-    print("🔄 合并数据并进行清洗...")
-    all_data = pd.concat([reddit_df, youtube_df, twitter_df], ignore_index=True)
-    
-    if all_data.empty:
+    # 如果指定了 task_ids，只处理这些任务的数据；否则按高水位增量读取
+    use_watermark = not task_ids and incremental
+    marks = get_watermarks(conn, keyword) if use_watermark else {table: 0 for table in SOURCE_TABLES}
+    task_filter = f"AND task_id IN ({','.join(map(str, task_ids))})" if task_ids else ""
+
+    total_read = 0
+    total_written = 0
+    for table in SOURCE_TABLES:
+        source = SOURCES[table]
+        print(f"📥 读取 {table} 数据...")
+        last_rowid = int(marks[table])
+
+        while True:
+            # 按 rowid 做键集分页，不在写入期间保持读游标
+            chunk = pd.read_sql_query(
+                f"SELECT rowid AS src_rowid, {source['columns']} FROM {table} "
+                f"WHERE rowid > ? {task_filter} ORDER BY rowid LIMIT ?",
+                conn, params=(last_rowid, chunk_size)
+            )
+            if chunk.empty:
+                break
+
+            last_rowid = int(chunk['src_rowid'].iloc[-1])
+            total_read += len(chunk)
+            cleaned = clean_chunk(chunk, source, keyword)
+            # 统计增量需要先读出将被覆盖的旧行，再写入；先拿写锁，读旧行、写入与统计更新在同一事务中提交，
+            # 并发运行的清洗不会基于同一份旧行各自累加
+            conn.execute("BEGIN IMMEDIATE")
+            keyword_stats.apply_chunk(conn, keyword, cleaned)
+            total_written += upsert_cleaned(conn, cleaned)
+            if use_watermark:
+                save_watermarks(conn, keyword, {table: last_rowid})
+            conn.commit()
+
+            if len(chunk) < chunk_size:
+                break
+
+    # 也会补建迁移前已存在、尚未建索引的行
+    indexed, duplicates = near_dup.index_new_rows(conn, keyword, chunk_size)
+    if indexed:
+        print(f"🔁 近似重复检测: 新增 {indexed} 条，其中 {duplicates} 条归入已有重复簇")
+    scored = sentiment.backfill(conn, keyword, chunk_size)
+    if scored:
+        print(f"😊 已为 {scored} 条历史数据补充本地情感分")
+
+    if total_read == 0:
         print("⚠️ 没有数据需要清洗")
         conn.close()
         return
 
-    # 执行清洗逻辑
-    all_data['content'] = all_data['content'].apply(clean_text)
-    all_data['timestamp'] = all_data['raw_time'].apply(normalize_time)
-    
-    # 去重
-    initial_count = len(all_data)
-    all_data = all_data.drop_duplicates(subset=['platform', 'raw_id'])
-    print(f"🧹 去重完成: {initial_count} -> {len(all_data)}")
-
-    # 准备存入数据库的最终字段
-    final_df = all_data[['platform', 'raw_id', 'content', 'author', 'timestamp', 'engagement', 'url']]
-    
-    # 添加关键词字段
-    final_df['keyword'] = keyword
-
-    # 存入数据库
-    print(f"💾 正在将清洗后的数据存入 'cleaned_data' 表 (关键词: {keyword})...")
-    final_df.to_sql('cleaned_data', conn, if_exists='append', index=False)
+    print(f"💾 已将 {total_read} 条原始数据清洗写入 'cleaned_data' 表 (关键词: {keyword})，写入 {total_written} 条记录")
     
     conn.close()
     print("✅ 数据清洗完成！")
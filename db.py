@@ -0,0 +1,121 @@
+"""
+统一的 SQLite 连接工厂
+- 所有模块通过 get_connection() 获取连接，避免各自 sqlite3.connect 使用默认配置
+- 开启 WAL：调度线程写入时 API 仍可并发读取，减少 "database is locked"
+- 进程内连接池：get_connection() 每次借出一个独立的连接，conn.close() 回滚未提交事务后归还池中，
+  之后任意线程的调用方都可直接复用，省去建连和 PRAGMA 的开销
+- 每个调用方拿到的都是自己的连接，嵌套调用中的 close() / with conn 不会提交或回滚外层的事务
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_NAME = os.getenv("DB_NAME", "multi_source.db")
+
+# 可通过环境变量调整的性能参数
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")               # WAL 下 NORMAL 已足够安全
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))       # 页缓存大小 (KB)
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))                   # 池中最多保留的空闲连接数
+
+_pool_lock = threading.Lock()
+_idle = {}  # 数据库文件 -> [空闲连接]
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接：close() 回滚未提交事务并归还连接池，真正关闭请调用 force_close()"""
+
+    db_name = None
+    checked_out = False
+
+    def close(self):
+        # 重复 close 不会把同一个连接归还两次
+        if not self.checked_out:
+            return
+        self.checked_out = False
+        try:
+            if self.in_transaction:
+                self.rollback()
+        except sqlite3.Error:
+            self.force_close()
+            return
+        if not _release(self):
+            self.force_close()
+
+    def force_close(self):
+        self.checked_out = False
+        super().close()
+
+
+def configure(conn):
+    """对连接应用 WAL 及性能相关的 PRAGMA"""
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def connect(db_name=None, row_factory=None):
+    """创建一个新的、已配置好的独立连接（不经过连接池，close() 即真正关闭）"""
+    conn = sqlite3.connect(db_name or DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    return configure(conn)
+
+
+def _release(conn):
+    """把连接放回池中；池已满或数据库已切换时返回 False，由调用方关闭"""
+    with _pool_lock:
+        idle = _idle.setdefault(conn.db_name, [])
+        if conn.db_name != DB_NAME or len(idle) >= POOL_SIZE:
+            return False
+        idle.append(conn)
+        return True
+
+
+def get_connection(row_factory=None):
+    """
+    从连接池借出一个连接，用完调用 conn.close() 归还（或使用 with connection() as conn）
+    row_factory: 如 sqlite3.Row；每次借出时重新设置
+    未归还的连接在被回收时直接关闭，不会泄漏
+    """
+    db_name = DB_NAME
+    with _pool_lock:
+        idle = _idle.get(db_name)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        # 借出期间只有一个调用方使用，可以在不同线程之间传递
+        conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_MS / 1000, factory=PooledConnection,
+                               check_same_thread=False)
+        configure(conn)
+        conn.db_name = db_name
+    conn.row_factory = row_factory
+    conn.checked_out = True
+    return conn
+
+
+@contextmanager
+def connection(row_factory=None):
+    """借出连接，退出时归还（未提交的事务回滚）"""
+    conn = get_connection(row_factory)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_idle_connections():
+    """关闭连接池中的全部空闲连接（切换数据库或进程退出前可调用）"""
+    with _pool_lock:
+        conns = [conn for idle in _idle.values() for conn in idle]
+        _idle.clear()
+    for conn in conns:
+        try:
+            conn.force_close()
+        except sqlite3.ProgrammingError:
+            pass
@@ -0,0 +1,25 @@
+"""
+互动数据字段定义
+cleaned_data 中每个互动字段是一个数值列（缺失为 NULL），可以直接在 SQL 里 SUM()；
+对外接口仍按平台返回与以前相同的嵌套 engagement 对象
+"""
+
+ENGAGEMENT_FIELDS = ("score", "view_count", "retweet_count", "like_count", "num_comments")
+
+# 每个平台 engagement 对象包含的字段（与清洗前写入 JSON 的字段一致）
+PLATFORM_FIELDS = {
+    "reddit": ("score",),
+    "youtube": ("view_count",),
+    "twitter": ("retweet_count", "like_count"),
+}
+
+
+def as_object(platform, values):
+    """
+    把数值列还原为 API 返回的 engagement 对象
+    values: 支持按字段名取值的行（dict / sqlite3.Row）
+    """
+    fields = PLATFORM_FIELDS.get(platform)
+    if fields is None:
+        fields = [f for f in ENGAGEMENT_FIELDS if values[f] is not None]
+    return {f: values[f] for f in fields}
@@ -0,0 +1,106 @@
+"""
+任务进度事件总线
+- 采集 / 分析线程通过 publish(channel, data) 发布事件（线程安全），channel 通常是任务 id
+- 每个 channel 保留最近 REPLAY_SIZE 条事件；订阅时可按 Last-Event-ID 补发断线期间错过的事件
+- 不指定 channel 的订阅只补发全局最近 REPLAY_SIZE 条事件，不会把所有 channel 的历史（最多 MAX_CHANNELS × REPLAY_SIZE 条）一次推给客户端
+- 订阅者是 asyncio 协程：事件通过 loop.call_soon_threadsafe 投递到各自的队列，不阻塞发布线程
+- 事件序号全局递增，同时作为 SSE 的 id
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+REPLAY_SIZE = 200
+MAX_CHANNELS = 500
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class EventBus:
+    def __init__(self, replay_size=REPLAY_SIZE, max_channels=MAX_CHANNELS):
+        self.replay_size = replay_size
+        self.max_channels = max_channels
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._history = OrderedDict()  # channel -> deque[event]，按最近活跃排序
+        self._recent = deque(maxlen=replay_size)  # 所有 channel 合并后的最近事件
+        self._subscribers = set()       # (loop, queue, channel, match)
+
+    def publish(self, channel, data, event_type="progress"):
+        """发布一条事件；可在任意线程调用"""
+        with self._lock:
+            event = {"id": next(self._seq), "channel": channel, "type": event_type,
+                     "ts": time.time(), "data": data}
+            history = self._history.pop(channel, None) or deque(maxlen=self.replay_size)
+            history.append(event)
+            self._history[channel] = history
+            self._recent.append(event)
+            # 只保留最近活跃的 channel，旧任务的历史被淘汰
+            while len(self._history) > self.max_channels:
+                self._history.popitem(last=False)
+            targets = [(loop, queue) for loop, queue, ch, match in self._subscribers
+                       if (ch is None or ch == channel) and (match is None or match(event))]
+
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # 订阅者所在的事件循环已关闭
+                pass
+        return event
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # 消费过慢的订阅者丢弃最旧的事件，客户端可凭 Last-Event-ID 重连补发
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def replay(self, channel=None, after_id=0):
+        """
+        返回 id > after_id 的历史事件，按 id 排序
+        channel 为 None 时只在所有 channel 合并后的最近 replay_size 条事件中查找
+        """
+        with self._lock:
+            history = self._recent if channel is None else self._history.get(channel, ())
+            return [e for e in history if e["id"] > after_id]
+
+    def channels(self):
+        with self._lock:
+            return list(self._history)
+
+    async def subscribe(self, channel=None, after_id=0, match=None):
+        """
+        异步迭代事件：先补发 after_id 之后的历史事件，再持续推送新事件
+        channel 为 None 时订阅所有 channel；match(event) 为假的事件不投递给该订阅者
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        entry = (loop, queue, channel, match)
+        # 先注册再取历史，避免两者之间发布的事件丢失；重复的用 id 去掉
+        with self._lock:
+            self._subscribers.add(entry)
+        try:
+            last_id = after_id
+            for event in self.replay(channel, after_id):
+                if match is not None and not match(event):
+                    continue
+                last_id = event["id"]
+                yield event
+            while True:
+                event = await queue.get()
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield event
+        finally:
+            with self._lock:
+                self._subscribers.discard(entry)
+
+
+bus = EventBus()
+
+
+def publish(channel, data, event_type="progress"):
+    return bus.publish(channel, data, event_type)
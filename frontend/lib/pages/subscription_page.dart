@@ -27,8 +27,8 @@ class _SubscriptionPageState extends State<SubscriptionPage> {
       Provider.of<DataProvider>(context, listen: false).fetchSubscriptions();
       // 启动定时刷新订阅列表（每5秒刷新一次，用于显示下次执行时间的倒计时）
       _startRefreshTimer();
-      // 启动任务状态轮询（用于显示定时任务的进度）
-      _startTaskStatusPolling();
+      // 订阅所有任务的进度事件（用于显示定时任务的进度），事件流不可用时退回轮询
+      _startTaskEvents();
     });
   }
 
@@ -40,6 +40,32 @@ class _SubscriptionPageState extends State<SubscriptionPage> {
     });
   }
 
+  void _startTaskEvents() {
+    final provider = Provider.of<DataProvider>(context, listen: false);
+    final running = <String>{};
+    _taskEvents = provider.apiService.jobEvents().listen((event) async {
+      if (!mounted) return;
+      final job = event['data'] as Map<String, dynamic>;
+      final wasRunning = running.isNotEmpty;
+      if (job['state'] == 'running') {
+        running.add(job['id'] as String);
+      } else {
+        running.remove(job['id']);
+      }
+      provider.setTaskStatus(running.isNotEmpty, job['progress'] as String? ?? '');
+
+      // 如果任务刚完成（从运行变为不运行），刷新数据
+      if (wasRunning && running.isEmpty) {
+        await Future.delayed(const Duration(milliseconds: 500));
+        await provider.fetchSubscriptions();
+      }
+    }, onError: (_) {
+      _taskEvents?.cancel();
+      _taskEvents = null;
+      if (mounted) _startTaskStatusPolling();
+    }, cancelOnError: true);
+  }
+
   void _startTaskStatusPolling() {
     _taskStatusTimer = Timer.periodic(const Duration(milliseconds: 500), (_) async {
       if (mounted) {
@@ -65,12 +91,14 @@ class _SubscriptionPageState extends State<SubscriptionPage> {
   }
 
   late Timer _refreshTimer;
-  late Timer _taskStatusTimer;
+  Timer? _taskStatusTimer;
+  StreamSubscription<Map<String, dynamic>>? _taskEvents;
 
   @override
   void dispose() {
     _refreshTimer.cancel();
-    _taskStatusTimer.cancel();
+    _taskStatusTimer?.cancel();
+    _taskEvents?.cancel();
     _keywordController.dispose();
     _redditLimitController.dispose();
     _youtubeLimitController.dispose();
@@ -74,11 +74,11 @@ class DataProvider with ChangeNotifier {
     _error = null;
     notifyListeners();
     try {
-      await _apiService.startCollection(
+      final jobId = await _apiService.startCollection(
           keyword, language, redditLimit, youtubeLimit, twitterLimit);
       
-      // 启动轮询检查任务状态
-      _pollTaskStatus();
+      // 订阅该 job 的进度事件，事件流不可用时退回轮询
+      _watchTask(jobId: jobId, startMessage: '任务启动中...');
     } catch (e) {
       _error = e.toString();
     } finally {
@@ -87,14 +87,62 @@ class DataProvider with ChangeNotifier {
     }
   }
 
-  void _pollTaskStatus() {
-    // 每3秒检查一次任务状态，最多检查40次（2分钟）
-    int pollCount = 0;
-    const maxPolls = 40;
-    
+  // 事件之间超过该时长没有消息时不再等待，退回轮询
+  static const _eventIdleTimeout = Duration(minutes: 5);
+
+  Future<void> _watchTask({String? jobId, String? taskName, required String startMessage,
+      bool refreshSubscriptions = false}) async {
     _isTaskRunning = true;
-    _taskProgress = '任务启动中...';
+    _taskProgress = startMessage;
+    notifyListeners();
+
+    if (jobId != null || taskName != null) {
+      try {
+        final stream = _apiService
+            .jobEvents(job: jobId, task: taskName)
+            .timeout(_eventIdleTimeout);
+        await for (final event in stream) {
+          final job = event['data'] as Map<String, dynamic>;
+          _taskProgress = job['progress'] as String? ?? _taskProgress;
+          notifyListeners();
+          if (job['state'] == 'succeeded' || job['state'] == 'failed') {
+            await _onTaskFinished(refreshSubscriptions);
+            return;
+          }
+        }
+      } catch (e) {
+        // 事件流连接失败或超时，退回轮询
+      }
+    }
+    _pollTaskStatus(refreshSubscriptions: refreshSubscriptions);
+  }
+
+  Future<void> _onTaskFinished(bool refreshSubscriptions) async {
+    // 任务完成，刷新所有数据
+    _taskProgress = '正在刷新数据...';
+    notifyListeners();
+    
+    await Future.delayed(const Duration(seconds: 1));
+    await refreshDashboard();
+    await refreshSourceData(); // 同时刷新源数据
+    if (refreshSubscriptions) {
+      await fetchSubscriptions(); // 刷新订阅列表以更新执行次数
+    }
+    
+    _taskProgress = '完成！';
+    notifyListeners();
+    
+    // 2秒后清除状态
+    await Future.delayed(const Duration(seconds: 2));
+    _isTaskRunning = false;
+    _taskProgress = '';
     notifyListeners();
+  }
+
+  void _pollTaskStatus({bool refreshSubscriptions = false}) {
+    // 事件流不可用时的后备方案：每3秒检查一次任务状态，最多检查40次（2分钟）
+    int pollCount = 0;
+    const maxPolls = 40;
     
     Future.delayed(const Duration(seconds: 3), () async {
       while (pollCount < maxPolls) {
@@ -108,23 +156,7 @@ class DataProvider with ChangeNotifier {
           notifyListeners();
           
           if (!isRunning) {
-            // 任务完成，刷新所有数据
-            _taskProgress = '正在刷新数据...';
-            notifyListeners();
-            
-            await Future.delayed(const Duration(seconds: 1));
-            await refreshDashboard();
-            await refreshSourceData(); // 同时刷新源数据
-            
-            _taskProgress = '完成！';
-            notifyListeners();
-            
-            // 2秒后清除状态
-            await Future.delayed(const Duration(seconds: 2));
-            _isTaskRunning = false;
-            _taskProgress = '';
-            notifyListeners();
-            
+            await _onTaskFinished(refreshSubscriptions);
             break;
           }
           
@@ -173,12 +205,15 @@ class DataProvider with ChangeNotifier {
     _error = null;
     notifyListeners();
     try {
-      await _apiService.createSubscription(keyword, language, redditLimit,
+      final id = await _apiService.createSubscription(keyword, language, redditLimit,
           youtubeLimit, twitterLimit, intervalSeconds);
       await fetchSubscriptions();
       
-      // 启动轮询检查任务状态（定时任务会立即执行）
-      _pollTaskStatusForSubscription();
+      // 定时任务会立即执行：按任务名 subscription_<id> 订阅其进度事件
+      _watchTask(
+          taskName: id == null ? null : 'subscription_$id',
+          startMessage: '定时任务启动中...',
+          refreshSubscriptions: true);
     } catch (e) {
       _error = e.toString();
     } finally {
@@ -187,68 +222,6 @@ class DataProvider with ChangeNotifier {
     }
   }
 
-  void _pollTaskStatusForSubscription() {
-    // 每3秒检查一次任务状态，最多检查40次（2分钟）
-    int pollCount = 0;
-    const maxPolls = 40;
-    
-    _isTaskRunning = true;
-    _taskProgress = '定时任务启动中...';
-    notifyListeners();
-    
-    Future.delayed(const Duration(seconds: 3), () async {
-      while (pollCount < maxPolls) {
-        try {
-          final status = await _apiService.fetchTaskStatus();
-          final isRunning = status['is_running'] as bool;
-          final progress = status['progress'] as String? ?? '';
-          
-          _isTaskRunning = isRunning;
-          _taskProgress = progress;
-          notifyListeners();
-          
-          if (!isRunning) {
-            // 任务完成，刷新所有数据
-            _taskProgress = '正在刷新数据...';
-            notifyListeners();
-            
-            await Future.delayed(const Duration(seconds: 1));
-            await refreshDashboard();
-            await refreshSourceData();
-            await fetchSubscriptions(); // 刷新订阅列表以更新执行次数
-            
-            _taskProgress = '完成！';
-            notifyListeners();
-            
-            // 2秒后清除状态
-            await Future.delayed(const Duration(seconds: 2));
-            _isTaskRunning = false;
-            _taskProgress = '';
-            notifyListeners();
-            
-            break;
-          }
-          
-          pollCount++;
-          if (pollCount < maxPolls) {
-            await Future.delayed(const Duration(seconds: 3));
-          }
-        } catch (e) {
-          _isTaskRunning = false;
-          _taskProgress = '';
-          notifyListeners();
-          break;
-        }
-      }
-      
-      if (pollCount >= maxPolls) {
-        _isTaskRunning = false;
-        _taskProgress = '';
-        notifyListeners();
-      }
-    });
-  }
-
   Future<void> deleteSubscription(int id) async {
     _isLoading = true;
     _error = null;
@@ -5,6 +5,7 @@ import '../models/source_post.dart';
 
 import '../models/subscription.dart';
 import '../models/alert.dart';
+import 'event_stream.dart';
 
 class ApiService {
   static const String baseUrl = 'http://localhost:8888/api';
@@ -29,7 +30,8 @@ class ApiService {
     }
   }
 
-  Future<void> startCollection(String keyword, String language, int redditLimit,
+  /// 返回后端登记的 job id，用于订阅 /api/events?job=<id>
+  Future<String?> startCollection(String keyword, String language, int redditLimit,
       int youtubeLimit, int twitterLimit) async {
     final response = await http.post(
       Uri.parse('$baseUrl/collect'),
@@ -45,6 +47,18 @@ class ApiService {
     if (response.statusCode != 200 && response.statusCode != 202) {
       throw Exception('Failed to start collection: ${response.body}');
     }
+    return json.decode(utf8.decode(response.bodyBytes))['job_id'] as String?;
+  }
+
+  /// 订阅任务事件（SSE）：job 为 job id，task 为任务名（如 subscription_3），都不传时订阅所有任务
+  /// 每条消息的 data 字段是 job 快照
+  Stream<Map<String, dynamic>> jobEvents({String? job, String? task}) {
+    final query = <String, String>{
+      if (job != null) 'job': job,
+      if (task != null) 'task': task,
+    };
+    final uri = Uri.parse('$baseUrl/events');
+    return openEventStream(query.isEmpty ? uri : uri.replace(queryParameters: query));
   }
 
   Future<Map<String, dynamic>> fetchTaskStatus() async {
@@ -66,7 +80,8 @@ class ApiService {
     }
   }
 
-  Future<void> createSubscription(
+  /// 返回新订阅的 id
+  Future<int?> createSubscription(
       String keyword,
       String language,
       int redditLimit,
@@ -88,6 +103,7 @@ class ApiService {
     if (response.statusCode != 200) {
       throw Exception('Failed to create subscription: ${response.body}');
     }
+    return json.decode(utf8.decode(response.bodyBytes))['id'] as int?;
   }
 
   Future<void> deleteSubscription(int id) async {
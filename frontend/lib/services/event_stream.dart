@@ -0,0 +1,3 @@
+// 订阅后端 /api/events 的 SSE 事件流
+// Web 端使用浏览器原生 EventSource（断线自动重连并携带 Last-Event-ID），其他平台用 http 流式读取
+export 'event_stream_io.dart' if (dart.library.html) 'event_stream_web.dart';
@@ -0,0 +1,37 @@
+import 'dart:async';
+import 'dart:convert';
+import 'package:http/http.dart' as http;
+
+/// 打开 SSE 连接，逐条返回 event 类型为 [eventType] 的消息（data 字段解析后的 JSON）
+/// 连接失败或中断时流以错误结束，由调用方决定是否退回轮询
+Stream<Map<String, dynamic>> openEventStream(Uri uri, {String eventType = 'job'}) async* {
+  final client = http.Client();
+  try {
+    final request = http.Request('GET', uri)..headers['Accept'] = 'text/event-stream';
+    final response = await client.send(request);
+    if (response.statusCode != 200) {
+      throw Exception('Failed to open event stream: ${response.statusCode}');
+    }
+
+    String? type;
+    final data = StringBuffer();
+    final lines = response.stream.transform(utf8.decoder).transform(const LineSplitter());
+    await for (final line in lines) {
+      if (line.isEmpty) {
+        // 空行表示一条消息结束；": keep-alive" 心跳没有 data，会被跳过
+        if (type == eventType && data.isNotEmpty) {
+          yield json.decode(data.toString()) as Map<String, dynamic>;
+        }
+        type = null;
+        data.clear();
+      } else if (line.startsWith('event:')) {
+        type = line.substring(6).trim();
+      } else if (line.startsWith('data:')) {
+        data.write(line.substring(5).trimLeft());
+      }
+    }
+    throw Exception('Event stream closed');
+  } finally {
+    client.close();
+  }
+}
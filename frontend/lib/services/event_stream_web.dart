@@ -0,0 +1,30 @@
+import 'dart:async';
+import 'dart:convert';
+import 'dart:html' as html;
+
+/// 打开 SSE 连接，逐条返回 event 类型为 [eventType] 的消息（data 字段解析后的 JSON）
+/// 浏览器在连接中断后会自动重连；首次连接失败或连接被关闭时流以错误结束，由调用方决定是否退回轮询
+Stream<Map<String, dynamic>> openEventStream(Uri uri, {String eventType = 'job'}) {
+  html.EventSource? source;
+  late StreamController<Map<String, dynamic>> controller;
+  controller = StreamController<Map<String, dynamic>>(
+    onListen: () {
+      var opened = false;
+      source = html.EventSource(uri.toString());
+      source!.onOpen.listen((_) => opened = true);
+      source!.addEventListener(eventType, (event) {
+        final data = (event as html.MessageEvent).data as String;
+        controller.add(json.decode(data) as Map<String, dynamic>);
+      });
+      source!.onError.listen((_) {
+        if (!opened || source!.readyState == html.EventSource.CLOSED) {
+          source!.close();
+          controller.addError(Exception('Event stream unavailable'));
+          controller.close();
+        }
+      });
+    },
+    onCancel: () => source?.close(),
+  );
+  return controller.stream;
+}
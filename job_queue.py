@@ -0,0 +1,227 @@
+"""
+定时订阅的持久化任务队列 + 固定大小的工作线程池
+- check_subscriptions 只把到期的订阅写入 job_queue 表，由 JOB_WORKERS 个工作线程领取执行，
+  订阅再多，同时运行的采集 + 分析任务数也不超过线程数
+- 最迟的任务优先：按应运行时间 due_at 升序领取
+- 入队时加 0 ~ JITTER_SECONDS 秒的随机延迟（not_before），把同一分钟到期的订阅错开
+- 同一订阅同时只有一条排队 / 运行中的记录（部分唯一索引），重复入队被忽略
+- 进程重启后，上次未跑完的 running 记录重新排队
+- handler 可以返回 concurrent.futures.Future（如挂到其他 job 上等待共享结果）：工作线程不等待，
+  立即领取下一条，记录在 Future 完成时再标记为 done / failed
+"""
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from db import connection
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JITTER_SECONDS = float(os.getenv("JOB_JITTER_SECONDS", "30"))
+# 空闲时最长的轮询间隔（秒）；入队时会立即唤醒工作线程
+POLL_SECONDS = 5.0
+# 吞吐量统计窗口（秒）
+THROUGHPUT_WINDOW = 300
+# 已结束的记录保留时长（秒）
+RETENTION_SECONDS = 7 * 24 * 3600
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def enqueue(conn, subscription_id, due_at, job_id=None, jitter=JITTER_SECONDS, now=None):
+    """
+    把订阅加入队列（不提交事务，由调用方提交）
+    返回队列记录 id；该订阅已有未完成的记录时返回 None
+    """
+    now = time.time() if now is None else now
+    cur = conn.execute("""
+    INSERT OR IGNORE INTO job_queue (subscription_id, job_id, state, due_at, not_before, enqueued_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, (subscription_id, job_id, QUEUED, due_at, now + random.uniform(0, jitter), now))
+    return cur.lastrowid if cur.rowcount else None
+
+
+def claim(conn, now=None):
+    """领取一条可以执行的记录（最迟的优先）并标记为 running；没有时返回 None"""
+    now = time.time() if now is None else now
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+        SELECT * FROM job_queue WHERE state = ? AND not_before <= ?
+        ORDER BY due_at, id LIMIT 1
+        """, (QUEUED, now)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE job_queue SET state = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                         (RUNNING, now, row[0]))
+            # 返回更新后的记录（state / started_at / attempts 为领取后的值）
+            row = conn.execute("SELECT * FROM job_queue WHERE id = ?", (row[0],)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row
+
+
+def complete(conn, queue_id, error=None):
+    conn.execute("UPDATE job_queue SET state = ?, finished_at = ?, error = ? WHERE id = ?",
+                 (FAILED if error else DONE, time.time(), str(error) if error else None, queue_id))
+    conn.commit()
+
+
+def set_job_id(conn, queue_id, job_id):
+    conn.execute("UPDATE job_queue SET job_id = ? WHERE id = ?", (job_id, queue_id))
+    conn.commit()
+
+
+def recover(conn):
+    """把上次进程退出时仍在 running 的记录重新排队，返回条数"""
+    cur = conn.execute("UPDATE job_queue SET state = ?, started_at = NULL WHERE state = ?", (QUEUED, RUNNING))
+    conn.commit()
+    return cur.rowcount
+
+
+def prune(conn, retention=RETENTION_SECONDS):
+    """删除结束超过 retention 秒的记录"""
+    conn.execute("DELETE FROM job_queue WHERE state IN (?, ?) AND finished_at < ?",
+                 (DONE, FAILED, time.time() - retention))
+    conn.commit()
+
+
+def next_ready_in(conn, now=None):
+    """距离下一条排队记录可执行还有多少秒；队列为空时返回 None"""
+    now = time.time() if now is None else now
+    row = conn.execute("SELECT MIN(not_before) FROM job_queue WHERE state = ?", (QUEUED,)).fetchone()
+    return None if row[0] is None else max(0.0, row[0] - now)
+
+
+def queue_metrics(conn, now=None, window=THROUGHPUT_WINDOW):
+    """
+    队列指标：
+    queued（其中 ready 为已过随机延迟可立即执行的）、running、
+    窗口内完成 / 失败数与每分钟吞吐量、最迟排队任务的延迟、窗口内平均等待时间（开始 - 应运行时间）
+    """
+    now = time.time() if now is None else now
+    queued, ready, running, oldest_due = conn.execute("""
+    SELECT SUM(state = :queued), SUM(state = :queued AND not_before <= :now), SUM(state = :running),
+           MIN(CASE WHEN state = :queued THEN due_at END)
+    FROM job_queue WHERE state IN (:queued, :running)
+    """, {"queued": QUEUED, "running": RUNNING, "now": now}).fetchone()
+    done, failed, avg_wait = conn.execute("""
+    SELECT SUM(state = ?), SUM(state = ?), AVG(started_at - due_at)
+    FROM job_queue WHERE state IN (?, ?) AND finished_at >= ?
+    """, (DONE, FAILED, DONE, FAILED, now - window)).fetchone()
+    done, failed = done or 0, failed or 0
+    return {
+        "queued": queued or 0,
+        "ready": ready or 0,
+        "running": running or 0,
+        "done": done,
+        "failed": failed,
+        "window_seconds": window,
+        "throughput_per_minute": round((done + failed) * 60 / window, 2),
+        "max_lateness_seconds": round(now - oldest_due, 1) if oldest_due is not None else 0,
+        "avg_wait_seconds": round(avg_wait, 1) if avg_wait is not None else None,
+    }
+
+
+class WorkerPool:
+    """
+    固定数量的工作线程，循环领取队列记录并调用 handler(row)
+    handler 正常返回记为 done，抛出异常记为 failed；
+    返回 Future 时不占用工作线程，按 Future 的结果（正常 / 异常）在其完成时记为 done / failed
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, poll_seconds=POLL_SECONDS):
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._busy = 0
+
+    def start(self):
+        with connection(row_factory=sqlite3.Row) as conn:
+            recovered = recover(conn)
+        if recovered:
+            logger.info(f"任务队列: {recovered} 条未完成的任务重新排队")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self.notify()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """有新任务入队时唤醒空闲的工作线程"""
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self._busy
+
+    def _run(self):
+        with connection(row_factory=sqlite3.Row) as conn:
+            self._loop(conn)
+
+    def _loop(self, conn):
+        while not self._stopped.is_set():
+            try:
+                row = claim(conn)
+                wait = next_ready_in(conn) if row is None else None
+            except sqlite3.Error as e:
+                logger.error(f"任务队列领取失败: {e}")
+                row = wait = None
+            if row is None:
+                with self._cond:
+                    self._cond.wait(self.poll_seconds if wait is None else min(wait, self.poll_seconds))
+                continue
+
+            with self._cond:
+                self._busy += 1
+            error = pending = None
+            try:
+                pending = self.handler(row)
+            except Exception as e:
+                error = e
+            finally:
+                with self._cond:
+                    self._busy -= 1
+            if isinstance(pending, Future):
+                pending.add_done_callback(functools.partial(self._complete_later, row["id"], row["subscription_id"]))
+                continue
+            self._complete(conn, row["id"], row["subscription_id"], error)
+
+    @staticmethod
+    def _complete(conn, queue_id, subscription_id, error):
+        if error is not None:
+            logger.error(f"任务 #{queue_id} (订阅 {subscription_id}) 失败: {error}")
+        try:
+            complete(conn, queue_id, error)
+        except sqlite3.Error as e:
+            logger.error(f"任务 #{queue_id} 状态写入失败: {e}")
+
+    def _complete_later(self, queue_id, subscription_id, future):
+        """handler 返回的 Future 完成时调用（在完成 Future 的线程中），用独立的连接写入状态"""
+        error = future.exception() if not future.cancelled() else RuntimeError("cancelled")
+        with connection() as conn:
+            self._complete(conn, queue_id, subscription_id, error)
+
+    def metrics(self):
+        with connection(row_factory=sqlite3.Row) as conn:
+            metrics = queue_metrics(conn)
+        metrics.update(workers=self.workers, busy_workers=self.busy)
+        return metrics
@@ -0,0 +1,263 @@
+"""
+后台任务登记表
+- 每次采集 + 分析（手动 /api/collect 或定时订阅）登记为一个 job，各自记录状态、时间戳、
+  各阶段耗时与结果摘要，多个 job 并发运行时互不覆盖
+- 状态流转: queued → running → succeeded / failed
+- 每次变化都把 job 快照发布到事件总线，channel 为 job id
+- 同一 (keyword, language) 同时只执行一次（single-flight）：已有 job 在执行时，新的请求挂到该 job 上
+  共享结果；FRESHNESS_SECONDS 内成功完成的结果直接复用，不重新采集分析
+- 挂上去的调用方可用 on_finish 注册回调，在共享的 job 结束时收到快照，不必占着线程 wait()
+- 只保存在内存中；已结束的 job 保留最近 MAX_FINISHED 个
+"""
+import copy
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import events
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+STATES = (QUEUED, RUNNING, SUCCEEDED, FAILED)
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# submit / begin 的结果：新执行、挂到正在执行的 job 上、复用新鲜结果
+NEW, ATTACHED, FRESH = "new", "attached", "fresh"
+
+MAX_FINISHED = 500
+FRESHNESS_SECONDS = int(os.getenv("JOB_FRESHNESS_SECONDS", "300"))
+
+
+def _key(job):
+    return job["keyword"], job["language"]
+
+
+class JobRegistry:
+    def __init__(self, max_finished=MAX_FINISHED):
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._jobs = OrderedDict()  # job_id -> job，按创建顺序
+        self._inflight = {}         # (keyword, language) -> 正在执行的 job id
+        self._latest = {}           # (keyword, language) -> 最近一次成功的 job id
+        self._callbacks = {}        # job id -> [on_finish 回调]
+
+    def create(self, name, keyword=None, language=None, subscription_id=None, params=None):
+        """
+        登记一个新 job，返回 job id
+        name: 任务名，如 manual_{keyword} / subscription_{id}（/api/task-status 中的 current_task）
+        """
+        with self._lock:
+            job = self._new_job(name, keyword, language, subscription_id, params)
+            snapshot = copy.deepcopy(job)
+        self._publish(snapshot)
+        return job["id"]
+
+    def _new_job(self, name, keyword, language, subscription_id, params):
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "name": name,
+            "keyword": keyword,
+            "language": language,
+            "subscription_id": subscription_id,
+            "params": params or {},
+            "state": QUEUED,
+            "progress": "",
+            "stage": None,
+            "stages": [],
+            "result": None,
+            "error": None,
+            "shared_from": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "updated_at": now,
+        }
+        self._jobs[job["id"]] = job
+        self._evict()
+        return job
+
+    def _shared(self, key, fresh_within, exclude=None):
+        """（持有锁时调用）返回可共享的 (job id, ATTACHED / FRESH)，没有时返回 (None, NEW)"""
+        job_id = self._inflight.get(key)
+        if job_id is not None and job_id != exclude:
+            return job_id, ATTACHED
+        latest = self._jobs.get(self._latest.get(key))
+        if (fresh_within and latest and latest["state"] == SUCCEEDED
+                and time.time() - latest["finished_at"] <= fresh_within):
+            return latest["id"], FRESH
+        return None, NEW
+
+    def submit(self, name, keyword, language, subscription_id=None, params=None, fresh_within=FRESHNESS_SECONDS):
+        """
+        single-flight 登记：同一 (keyword, language) 已有 job 在执行时返回 (该 job id, ATTACHED)，
+        fresh_within 秒内有成功结果时返回 (该 job id, FRESH)，都没有才登记新 job 并返回 (新 job id, NEW)
+        NEW 的 job 由调用方负责执行并 finish
+        """
+        with self._lock:
+            job_id, outcome = self._shared((keyword, language), fresh_within)
+            if outcome != NEW:
+                return job_id, outcome
+            job = self._new_job(name, keyword, language, subscription_id, params)
+            self._inflight[_key(job)] = job["id"]
+            snapshot = copy.deepcopy(job)
+        self._publish(snapshot)
+        return job["id"], NEW
+
+    def begin(self, job_id, fresh_within=FRESHNESS_SECONDS):
+        """
+        开始执行一个已登记的 job（如定时任务），同样按 (keyword, language) 去重：
+        可共享时记录 shared_from 并返回 (共享的 job id, ATTACHED / FRESH)，调用方用 wait() 或 on_finish() 取结果；
+        否则把该 job 标记为 running 并返回 (job_id, NEW)
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            shared_id, outcome = self._shared(_key(job), fresh_within, exclude=job_id)
+            if outcome == NEW:
+                self._inflight[_key(job)] = job_id
+                job.update(state=RUNNING, started_at=time.time())
+            else:
+                job.update(state=RUNNING, started_at=time.time(), shared_from=shared_id,
+                           progress=f"复用任务 {shared_id} 的结果")
+            job["updated_at"] = time.time()
+            snapshot = copy.deepcopy(job)
+        self._publish(snapshot)
+        return (job_id, NEW) if outcome == NEW else (shared_id, outcome)
+
+    def wait(self, job_id, timeout=None):
+        """阻塞直到 job 结束，返回其快照；超时返回当前快照，job 不存在返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] not in ACTIVE_STATES:
+                    return copy.deepcopy(job) if job else None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return copy.deepcopy(job)
+                self._finished.wait(remaining)
+
+    def on_finish(self, job_id, callback):
+        """
+        job 结束时以其快照调用 callback(snapshot)（在调用 finish 的线程中执行）；
+        job 已结束时立即在当前线程调用，job 不存在时以 None 调用
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["state"] in ACTIVE_STATES:
+                self._callbacks.setdefault(job_id, []).append(callback)
+                return
+            snapshot = copy.deepcopy(job) if job else None
+        callback(snapshot)
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["state"] not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(changes)
+            job["updated_at"] = time.time()
+            snapshot = copy.deepcopy(job)
+        self._publish(snapshot)
+        return snapshot
+
+    @staticmethod
+    def _publish(snapshot):
+        events.publish(snapshot["id"], snapshot, event_type="job")
+
+    def start(self, job_id):
+        return self._update(job_id, state=RUNNING, started_at=time.time())
+
+    def progress(self, job_id, message):
+        return self._update(job_id, progress=message)
+
+    @contextmanager
+    def stage(self, job_id, name):
+        """记录一个阶段的起止时间与耗时；阶段内抛出的异常会标记在该阶段上并继续抛出"""
+        record = {"name": name, "started_at": time.time(), "finished_at": None, "duration": None, "ok": None}
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["stages"].append(record)
+        self._update(job_id, stage=name)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            with self._lock:
+                record.update(finished_at=time.time(), duration=round(time.perf_counter() - start, 3), ok=ok)
+            self._update(job_id, stage=None)
+
+    def finish(self, job_id, result=None, error=None):
+        """结束 job：error 为空时状态为 succeeded，否则为 failed"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(state=FAILED if error else SUCCEEDED, result=result,
+                       error=str(error) if error else None, finished_at=time.time(), updated_at=time.time())
+            key = _key(job)
+            if self._inflight.get(key) == job_id:
+                del self._inflight[key]
+                if not error:
+                    self._latest[key] = job_id
+            self._evict()
+            self._finished.notify_all()
+            callbacks = self._callbacks.pop(job_id, [])
+            snapshot = copy.deepcopy(job)
+        self._publish(snapshot)
+        for callback in callbacks:
+            try:
+                callback(copy.deepcopy(snapshot))
+            except Exception as e:
+                # 回调出错不影响 finish 的调用方
+                logger.error(f"job {job_id} 的结束回调失败: {e}")
+        return snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job else None
+
+    def list(self, state=None, limit=50):
+        """按创建时间倒序返回 job 快照"""
+        with self._lock:
+            jobs = [job for job in reversed(self._jobs.values()) if state is None or job["state"] == state]
+            return copy.deepcopy(jobs[:limit])
+
+    def legacy_status(self):
+        """
+        兼容旧版 /api/task-status 的单任务状态：
+        按 running、queued、已结束的顺序，取第一个非空分组中最近更新的 job
+        is_running 只反映正在执行的 job；排队等待工作线程的 job 单独计入 queued_jobs
+        """
+        with self._lock:
+            running = [job for job in self._jobs.values() if job["state"] == RUNNING]
+            queued = [job for job in self._jobs.values() if job["state"] == QUEUED]
+            candidates = running or queued or list(self._jobs.values())
+            job = max(candidates, key=lambda j: j["updated_at"]) if candidates else None
+            return {
+                "is_running": bool(running),
+                "current_task": job["name"] if job else None,
+                "last_update": int(job["updated_at"]) if job else 0,
+                "progress": job["progress"] if job else "",
+                "active_jobs": len(running) + len(queued),
+                "running_jobs": len(running),
+                "queued_jobs": len(queued),
+            }
+
+
+registry = JobRegistry()
@@ -0,0 +1,114 @@
+"""
+关键词聚合统计（物化表 keyword_stats）
+- 每个关键词一行：总帖数、各平台帖数、各互动字段之和、热度指数
+- process_data 每写入一批 cleaned_data 前，先按 (platform, raw_id) 查出将被覆盖的旧行，
+  只把新旧差值累加到统计表；查询旧行前即持有写锁，与写入在同一事务中提交
+- Dashboard 直接读取一行，不需要扫描 cleaned_data
+"""
+import math
+from db import connection
+from engagement import ENGAGEMENT_FIELDS
+
+PLATFORMS = ("reddit", "youtube", "twitter")
+# IN (...) 查询每次最多带的参数个数，低于 SQLite 默认上限
+_LOOKUP_BATCH = 500
+
+COLUMNS = (["total_posts"] + [f"{p}_posts" for p in PLATFORMS]
+           + [f"{f}_sum" for f in ENGAGEMENT_FIELDS])
+
+# 热度 = 帖数 + 总互动 / 10
+HEAT_INDEX_SQL = f"total_posts + ({' + '.join(f'{f}_sum' for f in ENGAGEMENT_FIELDS)}) / 10.0"
+
+
+def _number(v):
+    """NULL / NaN / 无穷大按 0 计"""
+    if v is None:
+        return 0.0
+    v = float(v)
+    return 0.0 if math.isnan(v) or math.isinf(v) else v
+
+
+def _accumulate(delta, platform, values, sign):
+    delta["total_posts"] += sign
+    if platform in PLATFORMS:
+        delta[f"{platform}_posts"] += sign
+    for field, v in zip(ENGAGEMENT_FIELDS, values):
+        delta[f"{field}_sum"] += sign * _number(v)
+
+
+def heat_index(stats):
+    engagement = sum(stats[f"{f}_sum"] for f in ENGAGEMENT_FIELDS)
+    heat = stats["total_posts"] + engagement / 10.0
+    return 0.0 if math.isnan(heat) or math.isinf(heat) else heat
+
+
+def _existing_engagement(conn, keyword, df):
+    """查出本批中已存在于 cleaned_data 的行 {(platform, raw_id): (各互动字段值)}"""
+    existing = {}
+    for platform, group in df.groupby("platform"):
+        raw_ids = [str(x) for x in group["raw_id"].tolist()]
+        for start in range(0, len(raw_ids), _LOOKUP_BATCH):
+            batch = raw_ids[start:start + _LOOKUP_BATCH]
+            rows = conn.execute(f"""
+            SELECT raw_id, {', '.join(ENGAGEMENT_FIELDS)} FROM cleaned_data
+            WHERE keyword = ? AND platform = ? AND raw_id IN ({','.join('?' * len(batch))})
+            """, [keyword, platform] + batch).fetchall()
+            existing.update({(platform, r[0]): tuple(r[1:]) for r in rows})
+    return existing
+
+
+def apply_chunk(conn, keyword, df):
+    """
+    在 upsert_cleaned 之前调用：把这一批写入对统计的影响（新增行 + 被更新行的新旧差值）累加到 keyword_stats
+    调用方须已用 BEGIN IMMEDIATE 持有写锁，不提交事务，由调用方与 cleaned_data 的写入一起提交
+    """
+    if df.empty:
+        return
+    existing = _existing_engagement(conn, keyword, df)
+    delta = dict.fromkeys(COLUMNS, 0.0)
+    new_values = zip(*(df[f].tolist() for f in ENGAGEMENT_FIELDS))
+    for platform, raw_id, values in zip(df["platform"].tolist(), df["raw_id"].tolist(), new_values):
+        key = (platform, str(raw_id))
+        if key in existing:
+            _accumulate(delta, platform, existing[key], -1)
+        _accumulate(delta, platform, values, 1)
+
+    conn.execute("INSERT OR IGNORE INTO keyword_stats (keyword) VALUES (?)", (keyword,))
+    sets = ", ".join(f"{c} = {c} + ?" for c in COLUMNS)
+    conn.execute(f"UPDATE keyword_stats SET {sets}, updated_at = strftime('%s', 'now') WHERE keyword = ?",
+                 [delta[c] for c in COLUMNS] + [keyword])
+    conn.execute(f"UPDATE keyword_stats SET heat_index = {HEAT_INDEX_SQL} WHERE keyword = ?", (keyword,))
+
+
+def rebuild(conn, keyword=None):
+    """按 cleaned_data 全量重算（迁移回填或数据修复用）；keyword 为 None 时重算所有关键词"""
+    keyword_filter = "WHERE keyword = ?" if keyword is not None else ""
+    params = (keyword,) if keyword is not None else ()
+    conn.execute(f"DELETE FROM keyword_stats {keyword_filter}", params)
+    platform_counts = ", ".join(f"SUM(platform = '{p}')" for p in PLATFORMS)
+    field_sums = ", ".join(f"COALESCE(SUM({f}), 0)" for f in ENGAGEMENT_FIELDS)
+    conn.execute(f"""
+    INSERT INTO keyword_stats (keyword, {', '.join(COLUMNS)}, updated_at)
+    SELECT keyword, COUNT(*), {platform_counts}, {field_sums}, strftime('%s', 'now')
+    FROM cleaned_data {keyword_filter} GROUP BY keyword
+    """, params)
+    conn.execute(f"UPDATE keyword_stats SET heat_index = {HEAT_INDEX_SQL} {keyword_filter}", params)
+
+
+def get_stats(keyword=None, conn=None):
+    """读取关键词的统计；keyword 为 None 时汇总所有关键词。没有数据返回 None"""
+    if conn is None:
+        with connection() as conn:
+            return get_stats(keyword, conn)
+    if keyword is not None:
+        row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM keyword_stats WHERE keyword = ?", (keyword,)).fetchone()
+    else:
+        row = conn.execute(f"SELECT {', '.join(f'SUM({c})' for c in COLUMNS)} FROM keyword_stats").fetchone()
+    if not row or row[0] is None:
+        return None
+    stats = {c: (v or 0) for c, v in zip(COLUMNS, row)}
+    stats["total_posts"] = int(stats["total_posts"])
+    for p in PLATFORMS:
+        stats[f"{p}_posts"] = int(stats[f"{p}_posts"])
+    stats["heat_index"] = heat_index(stats)
+    return stats
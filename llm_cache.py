@@ -0,0 +1,43 @@
+"""
+LLM 响应缓存：以 (model, messages) 的 SHA-256 为键存储 Map / Reduce 的 JSON 结果
+- 订阅定时重跑时采样结果稳定，相同批次直接命中，不再调用 API
+- TTL 过期后视为未命中
+- 总字节数超过上限时按最近访问时间 (LRU) 淘汰
+- 存储、淘汰与统计由 sqlite_cache.SqliteCache 实现
+"""
+import hashlib
+import json
+from sqlite_cache import SqliteCache
+
+CACHE_TTL_SECONDS = 24 * 3600
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+_cache = SqliteCache("llm_cache", ("cache_key",), extra_columns=("phase",),
+                     ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES)
+
+
+def make_key(model, messages):
+    """对模型名和完整消息（含 prompt 与批次文本）做内容寻址"""
+    payload = json.dumps({"model": model, "messages": messages}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key, ttl=CACHE_TTL_SECONDS):
+    """返回缓存的结果 dict；未命中或已过期返回 None"""
+    data = _cache.get((key,), ttl)
+    return None if data is None else json.loads(data.decode("utf-8"))
+
+
+def put(key, result, phase="", max_bytes=CACHE_MAX_BYTES):
+    """写入缓存，并在超过容量上限时淘汰最久未访问的条目"""
+    _cache.put((key,), json.dumps(result, ensure_ascii=False).encode("utf-8"), max_bytes, phase=phase)
+
+
+def purge_expired(ttl=CACHE_TTL_SECONDS):
+    """删除过期条目，返回删除数量"""
+    return _cache.purge_expired(ttl)
+
+
+def get_stats():
+    """返回命中/未命中计数及命中率"""
+    return _cache.get_stats()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+数据库迁移工具（带版本号）
+
+- 已执行的迁移记录在 schema_version 表中，每个迁移只会执行一次
+- 新增迁移：在 MIGRATIONS 末尾追加 (版本号, 描述, 函数)，版本号递增
+- 用法：
+    python migrate.py            # 执行所有未执行的迁移
+    python migrate.py --status   # 查看当前版本及待执行的迁移
+"""
+import argparse
+import json
+import logging
+import time
+from db import connection
+import keyword_stats
+from engagement import ENGAGEMENT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def _table_exists(cur, table):
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return cur.fetchone() is not None
+
+
+def _columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+# ----------------- 迁移定义 -----------------
+
+def m001_subscription_execution_count(cur):
+    """为 subscriptions 表添加 execution_count 列"""
+    # 新库由 api.init_db_tables 直接建出含该列的表
+    if _table_exists(cur, "subscriptions") and "execution_count" not in _columns(cur, "subscriptions"):
+        cur.execute("ALTER TABLE subscriptions ADD COLUMN execution_count INTEGER DEFAULT 0")
+
+
+CLEANED_DATA_SCHEMA = """
+CREATE TABLE cleaned_data (
+    id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    raw_id TEXT NOT NULL,
+    content TEXT,
+    author TEXT,
+    timestamp TEXT,
+    url TEXT,
+    keyword TEXT NOT NULL DEFAULT 'unknown',
+    UNIQUE (platform, raw_id, keyword)
+)
+"""
+
+
+def m002_cleaned_data_schema(cur):
+    """cleaned_data 改为显式表结构：(platform, raw_id, keyword) 唯一 + (keyword, timestamp) 索引"""
+    if not _table_exists(cur, "cleaned_data"):
+        cur.execute(CLEANED_DATA_SCHEMA)
+    else:
+        # 旧表由 DataFrame.to_sql 创建，没有主键和索引：重建并按写入顺序去重迁移
+        cur.execute("ALTER TABLE cleaned_data RENAME TO cleaned_data_old")
+        cur.execute(CLEANED_DATA_SCHEMA)
+        old_columns = _columns(cur, "cleaned_data_old")
+        keyword_expr = "COALESCE(keyword, 'unknown')" if "keyword" in old_columns else "'unknown'"
+        copied = ["content", "author", "timestamp", "url"]
+        if "engagement" in old_columns:
+            # 旧的 engagement JSON 暂时保留，由 m010 拆成数值列后在 m012 删除
+            cur.execute("ALTER TABLE cleaned_data ADD COLUMN engagement TEXT")
+            copied.append("engagement")
+        cur.execute(f"""
+        INSERT OR IGNORE INTO cleaned_data (platform, raw_id, {', '.join(copied)}, keyword)
+        SELECT platform, CAST(raw_id AS TEXT), {', '.join(copied)}, {keyword_expr}
+        FROM cleaned_data_old
+        WHERE platform IS NOT NULL AND raw_id IS NOT NULL
+        ORDER BY rowid
+        """)
+        cur.execute("DROP TABLE cleaned_data_old")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cleaned_keyword_ts ON cleaned_data(keyword, timestamp)")
+
+
+RAW_TABLES = ("reddit_submission", "youtube_video", "twitter_tweet")
+
+
+def create_raw_task_indexes(cur):
+    """
+    为已存在的原始数据表的 task_id 建索引（清洗阶段按 task_id 过滤）
+    原始表由 collect.init_db 创建，可能晚于本迁移执行，init_db 建表后也会调用
+    """
+    for table in RAW_TABLES:
+        if _table_exists(cur, table):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_task ON {table}(task_id)")
+
+
+def m003_raw_task_indexes(cur):
+    """为原始数据表的 task_id 建索引"""
+    create_raw_task_indexes(cur)
+
+
+def m004_cleaning_watermark(cur):
+    """增量清洗的高水位表：记录每个原始表在每个关键词下已清洗到的最大 rowid"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS cleaning_watermark (
+        source_table TEXT NOT NULL,
+        keyword TEXT NOT NULL,
+        last_rowid INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source_table, keyword)
+    )
+    """)
+
+
+def m005_analysis_store(cur):
+    """增量分析：保存每个 Map 批次的结果，以及批次与 cleaned_data 行的对应关系"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_batch (
+        batch_id INTEGER PRIMARY KEY,
+        scope TEXT NOT NULL,
+        language TEXT NOT NULL,
+        result TEXT NOT NULL,
+        doc_count INTEGER,
+        created_at INTEGER
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_analysis_batch_scope ON analysis_batch(scope, language, batch_id)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_batch_doc (
+        cleaned_id INTEGER NOT NULL,
+        scope TEXT NOT NULL,
+        language TEXT NOT NULL,
+        batch_id INTEGER NOT NULL,
+        PRIMARY KEY (cleaned_id, scope, language)
+    )
+    """)
+
+
+def m006_subscription_sampling_strategy(cur):
+    """为 subscriptions 表添加 sampling_strategy 列（每个订阅可选采样策略）"""
+    if _table_exists(cur, "subscriptions") and "sampling_strategy" not in _columns(cur, "subscriptions"):
+        cur.execute("ALTER TABLE subscriptions ADD COLUMN sampling_strategy TEXT DEFAULT 'uniform'")
+
+
+def m007_near_dup_index(cur):
+    """近似重复检测：每行的 MinHash 签名与所属簇，以及 LSH 桶索引"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS near_dup_doc (
+        cleaned_id INTEGER PRIMARY KEY,
+        keyword TEXT NOT NULL,
+        cluster_id INTEGER NOT NULL,
+        signature BLOB
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_near_dup_doc_cluster ON near_dup_doc(keyword, cluster_id)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS near_dup_band (
+        keyword TEXT NOT NULL,
+        band_key INTEGER NOT NULL,
+        cleaned_id INTEGER NOT NULL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_near_dup_band ON near_dup_band(keyword, band_key)")
+
+
+def m008_cleaned_data_sentiment(cur):
+    """cleaned_data 增加本地情感预打分列（sentiment 0-100，sentiment_confident 0/1）"""
+    columns = _columns(cur, "cleaned_data")
+    if "sentiment" not in columns:
+        cur.execute("ALTER TABLE cleaned_data ADD COLUMN sentiment REAL")
+    if "sentiment_confident" not in columns:
+        cur.execute("ALTER TABLE cleaned_data ADD COLUMN sentiment_confident INTEGER")
+
+
+def m009_keyword_stats(cur):
+    """关键词聚合统计物化表（回填在 m010 中按数值列进行）"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS keyword_stats (
+        keyword TEXT PRIMARY KEY,
+        total_posts INTEGER NOT NULL DEFAULT 0,
+        reddit_posts INTEGER NOT NULL DEFAULT 0,
+        youtube_posts INTEGER NOT NULL DEFAULT 0,
+        twitter_posts INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0,
+        view_count_sum REAL NOT NULL DEFAULT 0,
+        retweet_count_sum REAL NOT NULL DEFAULT 0,
+        like_count_sum REAL NOT NULL DEFAULT 0,
+        num_comments_sum REAL NOT NULL DEFAULT 0,
+        heat_index REAL NOT NULL DEFAULT 0,
+        updated_at INTEGER
+    )
+    """)
+
+
+def _engagement_number(eng, field):
+    try:
+        v = float(eng[field])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return None if v != v or v in (float("inf"), float("-inf")) else v
+
+
+def m010_engagement_columns(cur):
+    """engagement JSON 拆成数值列（score / view_count / retweet_count / like_count / num_comments）并回填"""
+    columns = _columns(cur, "cleaned_data")
+    for field in ENGAGEMENT_FIELDS:
+        if field not in columns:
+            cur.execute(f"ALTER TABLE cleaned_data ADD COLUMN {field} INTEGER")
+    if "engagement" not in columns:
+        # 新库的 cleaned_data 没有 engagement 列，无需回填
+        keyword_stats.rebuild(cur.connection)
+        return
+
+    # 旧数据中可能有 NaN，SQLite 的 json_extract 无法解析，只能在 Python 中逐批转换
+    last_id = 0
+    while True:
+        rows = cur.execute(
+            "SELECT id, engagement FROM cleaned_data WHERE id > ? AND engagement IS NOT NULL ORDER BY id LIMIT 5000",
+            (last_id,)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for cleaned_id, raw in rows:
+            try:
+                eng = json.loads(raw)
+            except ValueError:
+                eng = {}
+            if not isinstance(eng, dict):
+                eng = {}
+            updates.append([_engagement_number(eng, f) for f in ENGAGEMENT_FIELDS] + [cleaned_id])
+        cur.executemany(
+            f"UPDATE cleaned_data SET {', '.join(f'{f} = ?' for f in ENGAGEMENT_FIELDS)}, engagement = NULL WHERE id = ?",
+            updates
+        )
+        last_id = rows[-1][0]
+
+    keyword_stats.rebuild(cur.connection)
+
+
+def m011_job_queue(cur):
+    """定时订阅任务队列：state 为 queued / running / done / failed，同一订阅同时只有一条未完成记录"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS job_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subscription_id INTEGER NOT NULL,
+        job_id TEXT,
+        state TEXT NOT NULL DEFAULT 'queued',
+        due_at INTEGER NOT NULL,
+        not_before REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        enqueued_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        error TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_state ON job_queue(state, due_at)")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_job_queue_pending ON job_queue(subscription_id)
+    WHERE state IN ('queued', 'running')
+    """)
+
+
+def m012_drop_engagement_json(cur):
+    """删除 m010 转换后已不再使用的 cleaned_data.engagement 列"""
+    if "engagement" in _columns(cur, "cleaned_data"):
+        cur.execute("ALTER TABLE cleaned_data DROP COLUMN engagement")
+
+
+def m013_analysis_batch_ambiguous_count(cur):
+    """analysis_batch 记录批次中本地无法判定的文档数，Reduce 按它加权 LLM 情感分（旧批次为 NULL，按 doc_count 计）"""
+    if "ambiguous_count" not in _columns(cur, "analysis_batch"):
+        cur.execute("ALTER TABLE analysis_batch ADD COLUMN ambiguous_count INTEGER")
+
+
+MIGRATIONS = [
+    (1, "subscriptions.execution_count", m001_subscription_execution_count),
+    (2, "cleaned_data explicit schema + indexes", m002_cleaned_data_schema),
+    (3, "raw tables task_id indexes", m003_raw_task_indexes),
+    (4, "cleaning_watermark", m004_cleaning_watermark),
+    (5, "analysis_batch / analysis_batch_doc", m005_analysis_store),
+    (6, "subscriptions.sampling_strategy", m006_subscription_sampling_strategy),
+    (7, "near_dup_doc / near_dup_band", m007_near_dup_index),
+    (8, "cleaned_data.sentiment / sentiment_confident", m008_cleaned_data_sentiment),
+    (9, "keyword_stats", m009_keyword_stats),
+    (10, "cleaned_data engagement numeric columns", m010_engagement_columns),
+    (11, "job_queue", m011_job_queue),
+    (12, "drop cleaned_data.engagement", m012_drop_engagement_json),
+    (13, "analysis_batch.ambiguous_count", m013_analysis_batch_ambiguous_count),
+]
+
+
+# ----------------- 执行器 -----------------
+
+def _ensure_version_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at INTEGER
+    )
+    """)
+
+
+def current_version(conn=None):
+    if conn is None:
+        with connection() as conn:
+            return current_version(conn)
+    cur = conn.cursor()
+    _ensure_version_table(cur)
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def pending_migrations(conn=None):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(conn=None):
+    """
+    执行所有未执行的迁移，每个迁移单独一个事务
+    返回本次执行的版本号列表；已是最新版本时开销只有一次查询
+    """
+    if conn is None:
+        with connection() as conn:
+            return migrate(conn)
+    applied = []
+    for version, description, func in pending_migrations(conn):
+        logger.info(f"执行迁移 #{version}: {description}...")
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            # 加写锁后再确认一次，避免多个进程/线程重复执行同一迁移
+            cur.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if cur.fetchone():
+                conn.rollback()
+                continue
+            func(cur)
+            cur.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                        (version, description, int(time.time())))
+            conn.commit()
+            applied.append(version)
+            logger.info(f"✓ 迁移 #{version} 完成")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"迁移 #{version} 失败: {e}")
+            raise
+    return applied
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="数据库迁移工具")
+    parser.add_argument("--status", action="store_true", help="只显示当前版本和待执行的迁移")
+    args = parser.parse_args()
+
+    if args.status:
+        logger.info(f"当前版本: {current_version()}")
+        for version, description, _ in pending_migrations():
+            logger.info(f"  待执行 #{version}: {description}")
+        return
+
+    applied = migrate()
+    if applied:
+        logger.info(f"✓ 已执行迁移: {applied}，当前版本 {current_version()}")
+    else:
+        logger.info(f"数据库已是最新版本 ({current_version()})，无需迁移")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+清洗阶段的近似重复检测（MinHash + LSH）
+- 对清洗后的 content 取字符 n-gram（中英文通用），计算 MinHash 签名
+- 签名分成 LSH_BANDS 段，每段哈希成一个桶键存入 near_dup_band 表；
+  新文档只需按桶键查索引得到候选，不与全部历史文档比较
+- 候选按签名估计的 Jaccard 相似度确认，达到阈值即归入同一重复簇
+- near_dup_doc 记录每行所属的簇（cluster_id = 簇内最早一行的 id），下游按簇折叠
+- 索引按关键词隔离，与 cleaned_data 的 keyword 一致；已建索引的行不会重复计算
+"""
+import hashlib
+import zlib
+import numpy as np
+from db import connection
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+# 估计 Jaccard 相似度达到该值才算重复（LSH 候选阈值约为 (1/16)^(1/8) ≈ 0.71）
+SIMILARITY_THRESHOLD = 0.8
+INDEX_CHUNK_SIZE = 5000
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    """去掉空白并转小写后的字符 n-gram；短文本整体作为一个 shingle"""
+    text = "".join(text.lower().split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """计算文本的 MinHash 签名（NUM_PERM 个 uint32），空文本返回 None"""
+    if not text:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+    # 所有排列一次矩阵运算：(a * h + b) mod p，取每个排列的最小值
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    """把签名按段切分，每段（连同段号）哈希为一个 64 位有符号整数桶键"""
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(band.to_bytes(2, "little") + chunk.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def similarity(sig_a, sig_b):
+    """由两个 MinHash 签名估计 Jaccard 相似度"""
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+def _find_cluster(conn, keyword, signature, keys):
+    """在已建索引的文档中找最相似且达到阈值的一个，返回其 cluster_id；没有则返回 None"""
+    rows = conn.execute(f"""
+    SELECT DISTINCT d.cleaned_id, d.cluster_id, d.signature FROM near_dup_band b
+    JOIN near_dup_doc d ON d.cleaned_id = b.cleaned_id
+    WHERE b.keyword = ? AND b.band_key IN ({','.join('?' * len(keys))})
+    """, [keyword] + keys).fetchall()
+
+    best, best_score = None, SIMILARITY_THRESHOLD
+    for cleaned_id, cluster_id, blob in rows:
+        score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+        if score >= best_score:
+            best, best_score = cluster_id, score
+    return best
+
+
+def index_new_rows(conn, keyword, chunk_size=INDEX_CHUNK_SIZE):
+    """
+    为该关键词下尚未建索引的 cleaned_data 行计算签名并归簇
+    按 id 递增处理，同一批内的重复也能互相识别；返回 (新建索引行数, 其中判为重复的行数)
+    """
+    indexed = duplicates = 0
+    last_id = 0
+    while True:
+        # 查询未建索引的行前先拿写锁，并发的清洗不会重复索引同一行
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+        SELECT c.id, c.content FROM cleaned_data c
+        LEFT JOIN near_dup_doc d ON d.cleaned_id = c.id
+        WHERE c.keyword = ? AND c.id > ? AND d.cleaned_id IS NULL
+        ORDER BY c.id LIMIT ?
+        """, (keyword, last_id, chunk_size)).fetchall()
+        if not rows:
+            conn.commit()
+            break
+
+        for cleaned_id, content in rows:
+            signature = minhash(content)
+            if signature is None:
+                conn.execute("INSERT INTO near_dup_doc (cleaned_id, keyword, cluster_id, signature) VALUES (?, ?, ?, NULL)",
+                             (cleaned_id, keyword, cleaned_id))
+                indexed += 1
+                continue
+
+            keys = band_keys(signature)
+            cluster_id = _find_cluster(conn, keyword, signature, keys)
+            if cluster_id is None:
+                cluster_id = cleaned_id
+            else:
+                duplicates += 1
+            conn.execute("INSERT INTO near_dup_doc (cleaned_id, keyword, cluster_id, signature) VALUES (?, ?, ?, ?)",
+                         (cleaned_id, keyword, cluster_id, signature.tobytes()))
+            conn.executemany("INSERT INTO near_dup_band (keyword, band_key, cleaned_id) VALUES (?, ?, ?)",
+                             [(keyword, key, cleaned_id) for key in keys])
+            indexed += 1
+
+        last_id = rows[-1][0]
+        conn.commit()
+        if len(rows) < chunk_size:
+            break
+    return indexed, duplicates
+
+
+def get_clusters(keyword, min_size=2):
+    """返回该关键词下成员数不少于 min_size 的重复簇：[{"cluster_id", "size", "ids"}, ...]"""
+    with connection() as conn:
+        rows = conn.execute("""
+        SELECT cluster_id, COUNT(*), GROUP_CONCAT(cleaned_id) FROM near_dup_doc
+        WHERE keyword = ? GROUP BY cluster_id HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC
+        """, (keyword, min_size)).fetchall()
+    return [{"cluster_id": r[0], "size": r[1], "ids": [int(x) for x in r[2].split(",")]} for r in rows]
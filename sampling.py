@@ -0,0 +1,112 @@
+"""
+AI 分析前的采样策略
+- uniform:     均匀随机采样（与原来的 df.sample 完全一致）
+- stratified:  按平台分层，各平台尽量均分名额，避免单一平台占满样本
+- engagement:  按互动量加权（log 缩放），热门内容更容易被选中
+- recency:     按发布时间指数衰减加权，新内容更容易被选中
+- dedup:       先去掉归一化后内容相同的近似重复，再均匀采样
+
+所有策略都基于 numpy / pandas 向量化实现，百万行级别也只需一次遍历。
+输入 DataFrame 需要 content 列；stratified / recency 分别需要 platform / timestamp 列，
+engagement 需要 engagement.ENGAGEMENT_FIELDS 中的数值列，缺失时退化为 uniform。
+"""
+import numpy as np
+import pandas as pd
+from engagement import ENGAGEMENT_FIELDS
+
+DEFAULT_STRATEGY = "uniform"
+RECENCY_HALF_LIFE_DAYS = 3.0
+
+_NON_WORD_RE = r'[\W_]+'
+
+
+def _weighted_sample(df, n, weights, random_state):
+    """按权重无放回采样（Efraimidis-Spirakis：取 -log(u)/w 最小的 n 个）"""
+    rng = np.random.default_rng(random_state)
+    weights = np.asarray(weights, dtype=float)
+    weights = np.where(np.isfinite(weights) & (weights > 0), weights, 1e-9)
+    keys = -np.log(rng.random(len(df))) / weights
+    index = np.argpartition(keys, n - 1)[:n]
+    return df.iloc[np.sort(index)]
+
+
+def sample_uniform(df, n, random_state=42):
+    return df.sample(n, random_state=random_state)
+
+
+def sample_stratified(df, n, random_state=42):
+    if "platform" not in df.columns:
+        return sample_uniform(df, n, random_state)
+
+    # 注水式分配名额：小平台全取，剩余名额在大平台间均分
+    counts = df["platform"].value_counts().sort_values()
+    quotas = {}
+    remaining = n
+    for i, (platform, count) in enumerate(counts.items()):
+        share = remaining // (len(counts) - i)
+        quotas[platform] = min(int(count), share)
+        remaining -= quotas[platform]
+    # 整除余下的名额补给还有剩余行的平台
+    for platform, count in counts[::-1].items():
+        if remaining <= 0:
+            break
+        extra = min(int(count) - quotas[platform], remaining)
+        quotas[platform] += extra
+        remaining -= extra
+
+    rng = np.random.default_rng(random_state)
+    rank = pd.Series(rng.random(len(df)), index=df.index).groupby(df["platform"]).rank(method="first")
+    return df[rank <= df["platform"].map(quotas)]
+
+
+def engagement_totals(df):
+    """各互动数值列按行求和，NULL 按 0 计"""
+    fields = [f for f in ENGAGEMENT_FIELDS if f in df.columns]
+    return df[fields].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
+
+
+def sample_engagement(df, n, random_state=42):
+    if not any(f in df.columns for f in ENGAGEMENT_FIELDS):
+        return sample_uniform(df, n, random_state)
+    weights = np.log1p(engagement_totals(df).clip(lower=0).to_numpy()) + 1.0
+    return _weighted_sample(df, n, weights, random_state)
+
+
+def sample_recency(df, n, random_state=42, half_life_days=RECENCY_HALF_LIFE_DAYS):
+    if "timestamp" not in df.columns:
+        return sample_uniform(df, n, random_state)
+    ts = pd.to_datetime(df["timestamp"], errors="coerce", utc=True, format="ISO8601")
+    newest = ts.max()
+    if pd.isnull(newest):
+        return sample_uniform(df, n, random_state)
+    age_days = ((newest - ts).dt.total_seconds() / 86400).to_numpy()
+    # 无法解析时间的行按中位年龄处理
+    age_days = np.where(np.isnan(age_days), np.nanmedian(age_days), age_days)
+    weights = np.exp2(-age_days / half_life_days)
+    return _weighted_sample(df, n, weights, random_state)
+
+
+def sample_dedup(df, n, random_state=42):
+    key = df["content"].fillna("").str.lower().str.replace(_NON_WORD_RE, "", regex=True).str[:120]
+    unique = df[~key.duplicated()]
+    if len(unique) <= n:
+        return unique
+    return sample_uniform(unique, n, random_state)
+
+
+STRATEGIES = {
+    "uniform": sample_uniform,
+    "stratified": sample_stratified,
+    "engagement": sample_engagement,
+    "recency": sample_recency,
+    "dedup": sample_dedup,
+}
+
+
+def sample(df, n, strategy=DEFAULT_STRATEGY, random_state=42):
+    """按指定策略采样最多 n 行；行数不超过 n 时原样返回"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"未知的采样策略: {strategy}，可选: {', '.join(STRATEGIES)}")
+    if len(df) <= n and strategy != "dedup":
+        return df
+    return STRATEGIES[strategy](df, n, random_state)
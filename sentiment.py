@@ -0,0 +1,202 @@
+"""
+本地情感预打分（词典法，纯 CPU，中英文通用）
+- 中英文情感词典各一份，每个词带权重；前置否定词（not / 不 / 没有 ...）翻转极性，
+  前置程度副词（very / 非常 ...）放大权重
+- 英文按小写单词查词典；中文词典编译成一个正则一次扫描，无需分词
+- 原始得分 raw = 命中权重之和，映射到 0-100：50 + 50 * tanh(raw / 3)
+- 正负信号明确（|raw| 足够大且反向信号较弱）的文本标记为 confident，
+  总体情感分中只有非 confident 文本的份额采用 LLM 的情感判断
+清洗阶段对每一行 cleaned_data 打分，不受 AI 分析采样数量限制
+"""
+import itertools
+import math
+import re
+import numpy as np
+
+CONFIDENT_MARGIN = 1.0
+
+EN_LEXICON = {
+    # 正面
+    "good": 1, "great": 2, "excellent": 2, "amazing": 2, "awesome": 2, "love": 2, "loved": 2,
+    "like": 1, "liked": 1, "nice": 1, "best": 2, "better": 1, "happy": 1, "glad": 1,
+    "fantastic": 2, "wonderful": 2, "perfect": 2, "impressive": 2, "fast": 1, "faster": 1,
+    "stable": 1, "easy": 1, "useful": 1, "helpful": 1, "recommend": 1, "recommended": 1,
+    "beautiful": 1, "cool": 1, "fun": 1, "solid": 1, "works": 1, "win": 1, "improved": 1,
+    "improvement": 1, "thanks": 1, "thank": 1, "brilliant": 2, "excited": 1, "favorite": 1,
+    "enjoy": 1, "enjoyed": 1, "smooth": 1, "reliable": 1, "clean": 1, "powerful": 1,
+    # 负面
+    "bad": -1, "terrible": -2, "awful": -2, "horrible": -2, "hate": -2, "hated": -2,
+    "worst": -2, "worse": -1, "sad": -1, "angry": -2, "slow": -1, "slower": -1, "bug": -1,
+    "bugs": -1, "buggy": -1, "broken": -2, "crash": -1, "crashes": -1, "fail": -1,
+    "failed": -1, "failure": -1, "useless": -2, "disappointing": -2, "disappointed": -2,
+    "annoying": -1, "problem": -1, "problems": -1, "issue": -1, "issues": -1, "scam": -2,
+    "waste": -2, "poor": -1, "ugly": -1, "expensive": -1, "overpriced": -2, "sucks": -2,
+    "garbage": -2, "trash": -2, "painful": -1, "confusing": -1, "unstable": -1, "lag": -1,
+    "laggy": -1, "regret": -1, "wrong": -1, "lose": -1, "lost": -1, "dead": -1,
+}
+EN_NEGATIONS = ("not", "no", "never", "don't", "dont", "doesn't", "doesnt", "isn't", "isnt",
+                "wasn't", "wasnt", "can't", "cant", "won't", "wont", "hardly")
+EN_INTENSIFIERS = {"very": 1.5, "really": 1.5, "so": 1.5, "extremely": 2.0, "super": 1.5,
+                   "totally": 1.5, "absolutely": 2.0, "quite": 1.2, "pretty": 1.2}
+
+ZH_LEXICON = {
+    # 正面
+    "好": 1, "好用": 2, "不错": 1, "很棒": 2, "棒": 1, "优秀": 2, "喜欢": 2, "满意": 2,
+    "推荐": 1, "强大": 2, "厉害": 2, "牛": 1, "赞": 1, "支持": 1, "开心": 1, "高兴": 1,
+    "流畅": 1, "稳定": 1, "方便": 1, "实用": 1, "惊艳": 2, "完美": 2, "期待": 1, "感谢": 1,
+    "给力": 2, "靠谱": 1, "划算": 1, "提升": 1, "进步": 1, "成功": 1, "优化": 1, "精彩": 2,
+    "漂亮": 1, "快": 1, "值得": 1, "良心": 2, "好评": 2, "爱了": 2, "神器": 2, "舒服": 1,
+    # 负面
+    "差": -1, "太差": -2, "垃圾": -2, "失望": -2, "讨厌": -2, "难用": -2, "卡顿": -1,
+    "崩溃": -2, "闪退": -2, "慢": -1, "贵": -1, "坑": -2, "骗": -2, "骗子": -2, "问题": -1,
+    "故障": -1, "失败": -1, "糟糕": -2, "恶心": -2, "后悔": -2, "烂": -2, "吐槽": -1,
+    "不满": -2, "愤怒": -2, "生气": -1, "担心": -1, "麻烦": -1, "难受": -1, "退款": -1,
+    "翻车": -2, "缺陷": -1, "漏洞": -1, "差评": -2, "无语": -1, "智商税": -2, "割韭菜": -2,
+    "倒退": -1,
+}
+ZH_NEGATIONS = ("没有", "不是", "并不", "从不", "不", "没", "别", "无", "未")
+ZH_INTENSIFIERS = {"非常": 1.5, "很": 1.5, "太": 1.5, "超": 1.5, "特别": 1.5, "极其": 2.0,
+                   "十分": 1.5, "真": 1.2, "挺": 1.2, "最": 2.0}
+
+
+def _alternation(words):
+    # 长词优先，保证 "好用" 不会被拆成 "好"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+_EN_TOKEN_RE = re.compile(r"[a-z']+")
+_ZH_WORD_RE = re.compile(_alternation(ZH_LEXICON))
+# 匹配词前面紧挨着的 [否定词][程度副词]
+_ZH_PREFIX_RE = re.compile(rf"({_alternation(ZH_NEGATIONS)})?({_alternation(ZH_INTENSIFIERS)})?$")
+_ZH_PREFIX_WINDOW = 4
+_HAS_CJK_RE = re.compile(r"[\u4e00-\u9fa5]")
+_EN_NEGATION_SET = frozenset(EN_NEGATIONS)
+
+
+def _en_hits(text):
+    """英文：小写分词后查词典，检查前一个词（程度副词）和再前一个词（否定词）"""
+    tokens = _EN_TOKEN_RE.findall(text.lower())
+    for i, token in enumerate(tokens):
+        weight = EN_LEXICON.get(token)
+        if weight is None:
+            continue
+        j = i - 1
+        if j >= 0 and tokens[j] in EN_INTENSIFIERS:
+            weight *= EN_INTENSIFIERS[tokens[j]]
+            j -= 1
+        if j >= 0 and tokens[j] in _EN_NEGATION_SET:
+            weight = -weight * 0.5
+        yield weight
+
+
+def _zh_hits(text):
+    """中文：正则一次扫描找出词典词，再看紧挨着的前缀里有没有否定词 / 程度副词"""
+    for m in _ZH_WORD_RE.finditer(text):
+        weight = ZH_LEXICON[m.group()]
+        start = m.start()
+        if start:
+            negation, intensifier = _ZH_PREFIX_RE.search(text, max(0, start - _ZH_PREFIX_WINDOW), start).groups()
+            if intensifier:
+                weight *= ZH_INTENSIFIERS[intensifier]
+            if negation:
+                weight = -weight * 0.5
+        yield weight
+
+
+def raw_score(text):
+    """返回 (正向权重和, 负向权重和的绝对值)"""
+    pos = neg = 0.0
+    if not text:
+        return pos, neg
+    hits = _en_hits(text)
+    if _HAS_CJK_RE.search(text):
+        hits = itertools.chain(hits, _zh_hits(text))
+    for weight in hits:
+        if weight > 0:
+            pos += weight
+        else:
+            neg -= weight
+    return pos, neg
+
+
+def score_text(text):
+    """返回 (0-100 情感分, 是否 confident)"""
+    pos, neg = raw_score(text)
+    raw = pos - neg
+    confident = abs(raw) >= CONFIDENT_MARGIN and min(pos, neg) <= abs(raw) / 2
+    return round(50 + 50 * math.tanh(raw / 3), 2), confident
+
+
+def score_series(series):
+    """批量打分，返回 (scores: float ndarray, confident: bool ndarray)"""
+    texts = series.tolist()
+    scores = np.empty(len(texts), dtype=float)
+    confident = np.empty(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        scores[i], confident[i] = score_text(text)
+    return scores, confident
+
+
+def backfill(conn, keyword, chunk_size=5000):
+    """为该关键词下还没有本地情感分的行补打分（如迁移前已存在的数据），返回补打分行数"""
+    total = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, content FROM cleaned_data WHERE keyword = ? AND sentiment IS NULL LIMIT ?",
+            (keyword, chunk_size)
+        ).fetchall()
+        if not rows:
+            conn.commit()
+            break
+        conn.executemany(
+            "UPDATE cleaned_data SET sentiment = ?, sentiment_confident = ? WHERE id = ?",
+            [(*score_text(content), cleaned_id) for cleaned_id, content in rows]
+        )
+        conn.commit()
+        total += len(rows)
+        if len(rows) < chunk_size:
+            break
+    return total
+
+
+def keyword_summary(conn, keyword=None):
+    """
+    汇总本地情感分（近似重复簇只计代表行）
+    返回 {"total", "confident", "ambiguous", "confident_mean", "ambiguous_mean", "mean"}
+    """
+    keyword_filter = "AND c.keyword = ?" if keyword else ""
+    row = conn.execute(f"""
+    SELECT COUNT(*),
+           SUM(CASE WHEN c.sentiment_confident = 1 THEN 1 ELSE 0 END),
+           AVG(CASE WHEN c.sentiment_confident = 1 THEN c.sentiment END),
+           AVG(CASE WHEN COALESCE(c.sentiment_confident, 0) = 0 THEN c.sentiment END),
+           AVG(c.sentiment)
+    FROM cleaned_data c
+    LEFT JOIN near_dup_doc n ON n.cleaned_id = c.id
+    WHERE c.sentiment IS NOT NULL AND (n.cluster_id IS NULL OR n.cluster_id = c.id) {keyword_filter}
+    """, (keyword,) if keyword else ()).fetchone()
+    total, confident = row[0] or 0, row[1] or 0
+    return {
+        "total": total,
+        "confident": confident,
+        "ambiguous": total - confident,
+        "confident_mean": round(row[2], 2) if row[2] is not None else None,
+        "ambiguous_mean": round(row[3], 2) if row[3] is not None else None,
+        "mean": round(row[4], 2) if row[4] is not None else None,
+    }
+
+
+def blend(summary, llm_mean):
+    """
+    总体情感分：confident 行用本地分，其余（ambiguous）份额用 LLM 的均分
+    没有 LLM 均分时 ambiguous 份额退回这些行自己的本地分；没有本地数据时退回 LLM 均分
+    """
+    if not summary or not summary["total"]:
+        return llm_mean
+    confident_sum = (summary["confident_mean"] or 0) * summary["confident"]
+    ambiguous_sum = 0
+    if summary["ambiguous"]:
+        ambiguous_score = llm_mean if llm_mean is not None else summary["ambiguous_mean"]
+        ambiguous_sum = ambiguous_score * summary["ambiguous"]
+    return round((confident_sum + ambiguous_sum) / summary["total"], 2)
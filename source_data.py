@@ -0,0 +1,106 @@
+"""
+源数据分页查询
+- 按 (timestamp DESC, id DESC) 做键集分页：游标记录上一页最后一行的 (timestamp, id)，
+  下一页从该位置继续，走 (keyword, timestamp) 索引，耗时与历史数据量无关
+- 支持按平台、时间范围过滤，以及只返回指定字段
+- NDJSON 流式接口按 STREAM_PAGE_SIZE 逐页调用 fetch_page
+"""
+import base64
+import json
+from engagement import ENGAGEMENT_FIELDS, as_object
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 500
+
+FIELDS = ("platform", "content", "author", "timestamp", "engagement", "url", "keyword")
+
+
+def encode_cursor(timestamp, row_id):
+    payload = json.dumps([timestamp, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不合法时抛出 ValueError"""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(row_id, int) or not (timestamp is None or isinstance(timestamp, str)):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return timestamp, row_id
+
+
+def parse_fields(fields):
+    """逗号分隔的字段列表；为空时返回全部字段，含未知字段时抛出 ValueError"""
+    if not fields:
+        return FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def latest_keyword(conn):
+    """最近写入的非 unknown 关键词"""
+    row = conn.execute("SELECT keyword FROM cleaned_data WHERE keyword != 'unknown' ORDER BY rowid DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def fetch_page(conn, keyword=None, limit=DEFAULT_PAGE_SIZE, cursor=None, platform=None,
+               since=None, until=None, fields=FIELDS):
+    """
+    读取一页数据，返回 (items, next_cursor)；没有更多数据时 next_cursor 为 None
+    since / until: 时间下限（含）/ 上限（不含），与 timestamp 的 ISO-8601 字符串比较
+    """
+    where, params = [], []
+    if keyword:
+        where.append("keyword = ?")
+        params.append(keyword)
+    if platform:
+        where.append("platform = ?")
+        params.append(platform)
+    if since:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        where.append("timestamp < ?")
+        params.append(until)
+    last_ts, last_id = decode_cursor(cursor) if cursor else (None, None)
+
+    columns = ["id", "platform", "timestamp"] + [f for f in fields if f not in ("platform", "timestamp", "engagement")]
+    if "engagement" in fields:
+        columns += list(ENGAGEMENT_FIELDS)
+
+    def query(conditions, cond_params, order, n):
+        sql = f"SELECT {', '.join(columns)} FROM cleaned_data WHERE " + " AND ".join(where + conditions)
+        return conn.execute(f"{sql} ORDER BY {order} LIMIT ?", params + cond_params + [n]).fetchall()
+
+    # 多取一行用来判断是否还有下一页
+    # 降序时 NULL 排在最后，分两段查询，每段都能从 (keyword, timestamp) 索引上直接定位到游标位置：
+    # 1. timestamp 非空的行，按行值 (timestamp, id) 比较  2. timestamp 为 NULL 的行，按 id 比较
+    rows = []
+    if last_id is None or last_ts is not None:
+        conditions, cond_params = ["timestamp IS NOT NULL"], []
+        if last_id is not None:
+            conditions.append("(timestamp, id) < (?, ?)")
+            cond_params = [last_ts, last_id]
+        rows = query(conditions, cond_params, "timestamp DESC, id DESC", limit + 1)
+    if len(rows) <= limit and not (since or until):
+        conditions, cond_params = ["timestamp IS NULL"], []
+        if last_id is not None and last_ts is None:
+            conditions.append("id < ?")
+            cond_params = [last_id]
+        rows += query(conditions, cond_params, "id DESC", limit + 1 - len(rows))
+
+    has_more = len(rows) > limit
+    rows = [dict(zip(columns, row)) for row in rows[:limit]]
+    items = [
+        {f: as_object(row["platform"], row) if f == "engagement" else row[f] for f in fields}
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+    return items, next_cursor
+
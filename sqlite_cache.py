@@ -0,0 +1,151 @@
+"""
+基于 SQLite 的通用磁盘缓存（字幕缓存、LLM 响应缓存共用）
+- 每个缓存一张表：键列 + 附加列 + zlib 压缩后的 data，记录 size / created_at / last_access
+- TTL 过期后视为未命中
+- 总字节数超过上限时按最近访问时间 (LRU) 淘汰
+- 命中时只有 last_access 早于 TOUCH_INTERVAL_SECONDS 才回写，大部分命中是纯读，不占写锁
+- 总字节数在进程内累计维护，写入时不再对全表 SUM(size)；超过上限准备淘汰时才重新精确统计一次
+- 建表与总字节数按数据库文件分别记录，切换 DB_NAME 后自动在新库中建表
+"""
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from db import connection
+
+# 命中时 last_access 的最小回写间隔（秒），LRU 的精度即为该间隔
+TOUCH_INTERVAL_SECONDS = 600
+
+
+class SqliteCache:
+    def __init__(self, table, key_columns, extra_columns=(), ttl=24 * 3600, max_bytes=50 * 1024 * 1024,
+                 touch_interval=TOUCH_INTERVAL_SECONDS):
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.extra_columns = tuple(extra_columns)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._where = " AND ".join(f"{c} = ?" for c in self.key_columns)
+        self._lock = threading.Lock()
+        self._totals = {}  # 数据库文件 -> 当前总字节数（已建表的库才有）
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _create_table(self, conn):
+        columns = [f"{c} TEXT" for c in self.key_columns + self.extra_columns]
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {self.table} (
+            {", ".join(columns)},
+            data BLOB,
+            size INTEGER,
+            created_at INTEGER,
+            last_access INTEGER,
+            PRIMARY KEY ({", ".join(self.key_columns)})
+        )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_access ON {self.table}(last_access)")
+        conn.commit()
+        return self._sum_size(conn)
+
+    def _sum_size(self, conn):
+        return conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    @contextmanager
+    def _connect(self):
+        """借出连接并在一个事务中执行，退出时提交并归还"""
+        with connection() as conn:
+            if conn.db_name not in self._totals:
+                total = self._create_table(conn)
+                with self._lock:
+                    self._totals.setdefault(conn.db_name, total)
+            with conn:
+                yield conn
+
+    def _add_total(self, conn, delta):
+        with self._lock:
+            self._totals[conn.db_name] += delta
+            return self._totals[conn.db_name]
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def get(self, key, ttl=None):
+        """返回解压后的 bytes；未命中或已过期返回 None"""
+        ttl = self.ttl if ttl is None else ttl
+        now = int(time.time())
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT data, created_at, last_access FROM {self.table} WHERE {self._where}", key
+            ).fetchone()
+            if not row or now - row[1] > ttl:
+                self._bump("misses")
+                return None
+            if now - (row[2] or 0) >= self.touch_interval:
+                conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE {self._where}", (now, *key))
+        self._bump("hits")
+        return zlib.decompress(row[0])
+
+    def put(self, key, payload, max_bytes=None, **extra):
+        """写入 bytes（压缩存储），并在超过容量上限时淘汰最久未访问的条目；extra 为附加列的值"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        data = zlib.compress(payload)
+        now = int(time.time())
+        columns = self.key_columns + self.extra_columns + ("data", "size", "created_at", "last_access")
+        values = (*key, *(extra.get(c) for c in self.extra_columns), data, len(data), now, now)
+        with self._connect() as conn:
+            # 先拿写锁，读旧条目大小与覆盖写入之间不会插入其他写入者
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute(f"SELECT size FROM {self.table} WHERE {self._where}", key).fetchone()
+            conn.execute(f"""
+            INSERT OR REPLACE INTO {self.table} ({", ".join(columns)})
+            VALUES ({", ".join("?" * len(columns))})
+            """, values)
+            self._bump("writes")
+            total = self._add_total(conn, len(data) - (old[0] if old else 0))
+            if total > max_bytes:
+                self._evict(conn, max_bytes)
+
+    def _evict(self, conn, max_bytes):
+        # 其他进程也可能写入同一张表，淘汰前重新精确统计
+        total = self._sum_size(conn)
+        evicted = 0
+        if total > max_bytes:
+            keys = ", ".join(self.key_columns)
+            rows = conn.execute(f"SELECT {keys}, size FROM {self.table} ORDER BY last_access ASC").fetchall()
+            for row in rows:
+                if total <= max_bytes:
+                    break
+                conn.execute(f"DELETE FROM {self.table} WHERE {self._where}", row[:-1])
+                total -= row[-1]
+                evicted += 1
+        with self._lock:
+            self._totals[conn.db_name] = total
+        self._bump("evictions", evicted)
+
+    def purge_expired(self, ttl=None):
+        """删除过期条目，返回删除数量"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cutoff = int(time.time()) - ttl
+            size = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table} WHERE created_at < ?",
+                                (cutoff,)).fetchone()[0]
+            cur = conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (cutoff,))
+            self._add_total(conn, -size)
+            return cur.rowcount
+
+    def total_bytes(self):
+        """当前数据库中缓存的总字节数（进程内累计值）"""
+        with self._connect() as conn:
+            with self._lock:
+                return self._totals[conn.db_name]
+
+    def get_stats(self):
+        """返回命中/未命中计数及命中率"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
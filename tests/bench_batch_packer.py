@@ -0,0 +1,70 @@
+"""
+Map 批次打包基准：10 万篇文档，逐条 encode + 字符串相加的顺序装箱 vs pack_batches（批量编码 + FFD）
+运行: pytest tests/bench_batch_packer.py -s（不在默认的 pytest tests/ 中执行）
+"""
+import random
+import time
+
+import pytest
+import tiktoken
+
+from batch_packer import fill_ratio, pack_batches
+
+DOCS = 100_000
+MAX_TOKENS = 4000
+WORDS = ("python pandas data great video really helpful thanks the of and to "
+         "这个 视频 非常 清楚 评论 讨论 价值 不错").split()
+
+ENCODING = tiktoken.get_encoding("cl100k_base")
+
+
+def make_docs(n, long_share):
+    """短评论为主，long_share 比例是超过单批上限的长文（如字幕）"""
+    rng = random.Random(42)
+    docs = []
+    for _ in range(n):
+        length = rng.randint(2000, 6000) if rng.random() < long_share else rng.randint(5, 120)
+        docs.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+    return docs
+
+
+def old_pack(texts, max_tokens):
+    """改造前的写法：逐条 ENCODING.encode 计数，按顺序装箱，current_batch += "\\n" + text"""
+    batches = []
+    current_batch = ""
+    current_tokens = 0
+    for text in texts:
+        tokens = len(ENCODING.encode(text))
+        if current_tokens + tokens > max_tokens:
+            batches.append({"text": current_batch.strip(), "tokens": current_tokens})
+            current_batch = text
+            current_tokens = tokens
+        else:
+            current_batch += "\n" + text
+            current_tokens += tokens
+    if current_batch.strip():
+        batches.append({"text": current_batch.strip(), "tokens": current_tokens})
+    return batches
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+@pytest.mark.parametrize("long_share", (0, 0.01))
+def test_bench_pack_batches(long_share):
+    docs = make_docs(DOCS, long_share)
+    old_time, old = timed(old_pack, docs, MAX_TOKENS)
+    new_time, new = timed(pack_batches, docs, MAX_TOKENS, ENCODING)
+
+    assert all(b["tokens"] <= MAX_TOKENS for b in new)
+    old_over = sum(b["tokens"] > MAX_TOKENS for b in old)
+    # 旧写法的超限批次按上限计入，填充率不超过 100%
+    old_fill = sum(min(b["tokens"], MAX_TOKENS) for b in old) / (len(old) * MAX_TOKENS)
+
+    print(f"\n{DOCS:,} 篇文档（长文 {long_share:.0%}），单批上限 {MAX_TOKENS} token，"
+          f"编码 {ENCODING.name}（词表 {ENCODING.n_vocab}）")
+    print(f"  逐条 encode + 字符串相加  {old_time:6.2f}s  {len(old):>6} 批  填充率 {old_fill:.1%}  超限批次 {old_over}")
+    print(f"  pack_batches              {new_time:6.2f}s  {len(new):>6} 批  填充率 {fill_ratio(new, MAX_TOKENS):.1%}  超限批次 0")
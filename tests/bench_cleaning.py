@@ -0,0 +1,50 @@
+"""
+清洗吞吐基准：50 万行，逐条 Series.apply(clean_text / normalize_time) vs 向量化的 clean_text_series / normalize_time_series
+运行: pytest tests/bench_cleaning.py -s（不在默认的 pytest tests/ 中执行）
+"""
+import time
+
+import pandas as pd
+
+import data_cleaning
+
+ROWS = 500_000
+
+
+def make_chunk(n):
+    """三个平台各占三分之一：Reddit 标题 + Unix 时间戳，YouTube 标题 + ISO 时间，Nitter 推文 + Nitter 时间"""
+    texts, times = [], []
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            texts.append(f"Post {i} about Python &amp; pandas 🔥 https://www.reddit.com/r/python/{i}")
+            times.append(1700000000.0 + i)
+        elif kind == 1:
+            texts.append(f"  Video {i}:   how to clean data —  part {i % 7}  ")
+            times.append(f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T{i % 24:02d}:00:00Z")
+        else:
+            texts.append(f"tweet {i} 中文测试，很好！ #tag @user https://t.co/{i}")
+            times.append(f"Jan {i % 28 + 1}, 2024 · {i % 12 + 1}:{i % 60:02d} PM UTC")
+    return pd.Series(texts, dtype=object), pd.Series(times, dtype=object)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def test_bench_cleaning_throughput():
+    texts, times = make_chunk(ROWS)
+    old_text, old_content = timed(lambda s: s.apply(data_cleaning.clean_text), texts)
+    new_text, new_content = timed(data_cleaning.clean_text_series, texts)
+    old_time, old_ts = timed(lambda s: s.apply(data_cleaning.normalize_time), times)
+    new_time, new_ts = timed(data_cleaning.normalize_time_series, times)
+
+    assert old_content.tolist() == new_content.tolist()
+    assert old_ts.tolist() == new_ts.tolist()
+
+    print(f"\n{ROWS:,} 行")
+    for name, old, new in (("clean_text", old_text, new_text), ("normalize_time", old_time, new_time)):
+        print(f"  {name:<15} apply {old:7.2f}s ({ROWS / old:>10,.0f} 行/s)  "
+              f"向量化 {new:6.2f}s ({ROWS / new:>10,.0f} 行/s)  {old / new:.1f}x")
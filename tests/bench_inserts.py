@@ -0,0 +1,74 @@
+"""
+原始记录写入基准：逐行 execute vs executemany 批量写入
+运行: pytest tests/bench_inserts.py -s（不在默认的 pytest tests/ 中执行）
+"""
+import sqlite3
+import time
+
+import pytest
+
+import collect
+import db
+
+SIZES = (10_000, 100_000)
+
+
+def make_posts(n, prefix):
+    return [{"post_id": f"{prefix}{i}", "title": f"post {i} about the keyword", "subreddit": "python",
+             "score": i % 500, "num_comments": i % 40, "created_utc": 1700000000 + i, "is_self": i % 2,
+             "is_stickied": 0, "url": f"https://www.reddit.com/r/python/comments/{prefix}{i}"}
+            for i in range(n)]
+
+
+def row_at_a_time(posts):
+    """改造前的写法：单独的连接创建任务，再在另一个连接中逐行 execute"""
+    with sqlite3.connect(db.DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        INSERT INTO crawl_task (source_type, keyword, language, limit_count, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """, ("reddit", "bench", "en", len(posts), int(time.time())))
+        task_id = cur.lastrowid
+    with sqlite3.connect(db.DB_NAME) as conn:
+        cur = conn.cursor()
+        for p in posts:
+            cur.execute("""
+            INSERT OR IGNORE INTO reddit_submission
+            (post_id, task_id, title, subreddit, score, num_comments,
+             created_utc, is_self, is_stickied, url)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                p["post_id"], task_id, p["title"], p["subreddit"],
+                p["score"], p["num_comments"], p["created_utc"],
+                p["is_self"], p["is_stickied"], p["url"]
+            ))
+        conn.commit()
+
+
+def bulk(posts):
+    collect.save_task_with_records("reddit", "bench", "en", len(posts), posts)
+
+
+def timed(func, n, path, monkeypatch):
+    """在新建的数据库中写入 n 行，返回耗时（三次取最好）"""
+    best = None
+    for run in range(3):
+        monkeypatch.setattr(db, "DB_NAME", str(path / f"{func.__name__}_{n}_{run}.db"))
+        db.close_idle_connections()
+        collect.init_db()
+        posts = make_posts(n, "p")
+        start = time.perf_counter()
+        func(posts)
+        elapsed = time.perf_counter() - start
+        with db.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM reddit_submission").fetchone()[0] == n
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_bench_raw_inserts(temp_db, tmp_path, monkeypatch, n):
+    old = timed(row_at_a_time, n, tmp_path, monkeypatch)
+    new = timed(bulk, n, tmp_path, monkeypatch)
+    print(f"\n{n:>7} 行  逐行 execute {old:7.3f}s ({n / old:>9,.0f} 行/s)  "
+          f"executemany {new:7.3f}s ({n / new:>9,.0f} 行/s)  {old / new:.2f}x")
@@ -0,0 +1,123 @@
+"""
+查询延迟基准：100 万行 cleaned_data，迁移前（to_sql 旧表 + 旧查询）vs 迁移后（索引 + 统计表 + 分页）
+运行: pytest tests/bench_queries.py -s（不在默认的 pytest tests/ 中执行）
+"""
+import json
+import math
+import time
+
+import db
+import keyword_stats
+import migrate
+import source_data
+
+ROWS = 1_000_000
+KEYWORDS = [f"kw{i}" for i in range(20)]
+PLATFORMS = ("reddit", "youtube", "twitter")
+KEYWORD = "kw7"
+
+
+def make_rows(n):
+    for i in range(n):
+        platform = PLATFORMS[i % 3]
+        if platform == "reddit":
+            eng = {"score": i % 500, "num_comments": i % 40}
+        elif platform == "youtube":
+            eng = {"view_count": i % 10000}
+        else:
+            eng = {"retweet_count": i % 30, "like_count": i % 200}
+        # 时间戳与写入顺序不一致，ORDER BY timestamp 需要真正排序
+        ts = f"2024-{(i * 7) % 12 + 1:02d}-{(i * 13) % 28 + 1:02d}T{(i * 11) % 24:02d}:00:00"
+        yield (platform, str(i), f"post {i} about {KEYWORDS[i % 20]}", f"user{i % 997}", ts,
+               json.dumps(eng), f"https://example.com/{i}", KEYWORDS[i % 20])
+
+
+def build_legacy_table(conn):
+    # DataFrame.to_sql 建出的旧表：无主键、无索引，互动数据是 JSON 字符串
+    conn.execute("""
+    CREATE TABLE cleaned_data (platform TEXT, raw_id TEXT, content TEXT, author TEXT,
+                               timestamp TEXT, engagement TEXT, url TEXT, keyword TEXT)
+    """)
+    conn.executemany("INSERT INTO cleaned_data VALUES (?, ?, ?, ?, ?, ?, ?, ?)", make_rows(ROWS))
+    conn.commit()
+
+
+def old_dashboard(conn, keyword):
+    """改造前的 load_dashboard：COUNT(*) 后再取出全部 engagement 在 Python 中解析求和"""
+    total = conn.execute("SELECT COUNT(*) FROM cleaned_data WHERE keyword = ?", (keyword,)).fetchone()[0]
+    engagement = 0
+    for (eng_str,) in conn.execute("SELECT engagement FROM cleaned_data WHERE keyword = ?", (keyword,)):
+        eng = json.loads(eng_str)
+        for field in ("score", "view_count", "retweet_count", "like_count", "num_comments"):
+            v = float(eng.get(field) or 0)
+            if not (math.isnan(v) or math.isinf(v)):
+                engagement += v
+    return total, total + engagement / 10
+
+
+def new_dashboard(conn, keyword):
+    stats = keyword_stats.get_stats(keyword, conn)
+    return stats["total_posts"], stats["heat_index"]
+
+
+def old_source_data(conn, keyword):
+    """改造前的 /api/source-data：一次取出全部匹配行并按时间排序"""
+    return conn.execute("""
+    SELECT platform, content, author, timestamp, engagement, url, keyword
+    FROM cleaned_data WHERE keyword = ? ORDER BY timestamp DESC
+    """, (keyword,)).fetchall()
+
+
+def new_first_page(conn, keyword):
+    return source_data.fetch_page(conn, keyword)[0]
+
+
+def new_all_pages(conn, keyword):
+    items, cursor = [], None
+    while True:
+        page, cursor = source_data.fetch_page(conn, keyword, source_data.STREAM_PAGE_SIZE, cursor)
+        items.extend(page)
+        if not cursor:
+            return items
+
+
+def best_of(func, *args, runs=5):
+    best, result = None, None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def test_bench_query_latency(temp_db):
+    with db.connection() as conn:
+        build_legacy_table(conn)
+        before = {
+            "dashboard": best_of(old_dashboard, conn, KEYWORD),
+            "source-data": best_of(old_source_data, conn, KEYWORD, runs=3),
+            "latest-keyword": best_of(source_data.latest_keyword, conn),
+        }
+
+        start = time.perf_counter()
+        migrate.migrate(conn)
+        migration = time.perf_counter() - start
+
+        after = {
+            "dashboard": best_of(new_dashboard, conn, KEYWORD),
+            "source-data 首页": best_of(new_first_page, conn, KEYWORD),
+            "source-data 全部": best_of(new_all_pages, conn, KEYWORD, runs=3),
+            "latest-keyword": best_of(source_data.latest_keyword, conn),
+        }
+
+    assert before["dashboard"][1][0] == after["dashboard"][1][0] == ROWS // len(KEYWORDS)
+    assert math.isclose(before["dashboard"][1][1], after["dashboard"][1][1])
+    assert len(before["source-data"][1]) == len(after["source-data 全部"][1])
+    assert before["latest-keyword"][1] == after["latest-keyword"][1]
+
+    print(f"\n{ROWS:,} 行，关键词 {KEYWORD}（{ROWS // len(KEYWORDS):,} 行），迁移耗时 {migration:.1f}s")
+    for name, (elapsed, _) in before.items():
+        print(f"  迁移前 {name:<16} {elapsed * 1000:10.2f} ms")
+    for name, (elapsed, _) in after.items():
+        print(f"  迁移后 {name:<16} {elapsed * 1000:10.2f} ms")
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# 模块都在仓库根目录，测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# ai_analysis 导入时即创建 OpenAI 客户端，测试中不会请求真实 API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """每个测试使用独立的临时数据库文件"""
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "test.db"))
+    db.close_idle_connections()
+    yield db.DB_NAME
+    db.close_idle_connections()
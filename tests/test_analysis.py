@@ -0,0 +1,115 @@
+import pytest
+
+import ai_analysis
+import collect
+import data_cleaning
+import db
+import sentiment
+
+
+def unique_words(i):
+    return " ".join(f"w{i}x{j}" for j in range(8))
+
+
+def insert_videos(titles, start=0):
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT INTO youtube_video (video_id, task_id, title, channel, published_at, view_count, url)
+        VALUES (?, 1, ?, 'chan', '2024-01-02T03:04:05Z', 1, '')
+        """, [(f"v{start + i}", title) for i, title in enumerate(titles)])
+        conn.commit()
+    data_cleaning.process_data("kw")
+
+
+@pytest.fixture
+def scored(temp_db):
+    """前 6 条本地可判定（明显正面），后 4 条无法判定"""
+    collect.init_db()
+    insert_videos([f"great amazing love {unique_words(i)}" for i in range(6)] + [unique_words(i) for i in range(6, 10)])
+    with db.connection() as conn:
+        return sentiment.keyword_summary(conn, "kw")
+
+
+def test_map_input_includes_confident_rows(scored):
+    # confident 行的情感分取本地得分，但仍要送去 Map 提取要点
+    assert (scored["confident"], scored["ambiguous"]) == (6, 4)
+    df = ai_analysis.load_unanalyzed("kw", "en")
+    assert len(df) == 10
+
+
+def test_saved_batches_record_ambiguous_docs(scored):
+    df = ai_analysis.load_unanalyzed("kw", "en")
+    ids = df.sort_values("id")["id"].tolist()
+    ai_analysis.save_batch_results("kw", "en", [ids[:6], ids[6:]], [{"sentiment_score": 90}, {"sentiment_score": 40}])
+    results = ai_analysis.load_batch_results("kw", "en")
+    assert [r["ambiguous_docs"] for r in results] == [0, 4]
+    assert ai_analysis.load_unanalyzed("kw", "en").empty
+
+
+def test_reduce_weights_llm_scores_by_ambiguous_docs(scored, monkeypatch):
+    monkeypatch.setattr(ai_analysis, "cached_json_completion", lambda *a, **k: {"final_controversies": []})
+    map_results = [{"sentiment_score": 90, "key_points": ["a"], "ambiguous_docs": 0},
+                   {"sentiment_score": 40, "key_points": ["b"], "ambiguous_docs": 4}]
+    report = ai_analysis.reduce_phase(map_results, "en", "kw", scored)
+    expected = (scored["confident_mean"] * 6 + 40 * 4) / 10
+    assert report["avg_sentiment"] == round(expected, 2)
+
+
+def test_reduce_with_only_confident_batches_still_summarizes(scored, monkeypatch):
+    prompts = []
+
+    def fake_completion(messages, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return {"final_controversies": ["c"], "human_summary": "summary", "mermaid_graph": "graph TD; A-->B;"}
+
+    monkeypatch.setattr(ai_analysis, "cached_json_completion", fake_completion)
+    report = ai_analysis.reduce_phase([{"sentiment_score": 90, "key_points": ["great point"], "ambiguous_docs": 0}],
+                                      "en", "kw", scored)
+    assert "great point" in prompts[0]
+    assert report["human_summary"] == "summary" and report["mermaid_graph"]
+    # 没有 LLM 均分时 ambiguous 份额用这些行自己的本地分，confident 行不重复计入
+    expected = (scored["confident_mean"] * 6 + scored["ambiguous_mean"] * 4) / 10
+    assert report["avg_sentiment"] == round(expected, 2) == sentiment.blend(scored, None)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch, tmp_path):
+    """替换 Map / Reduce 的 LLM 调用，返回每次 Map 收到的批次文本"""
+    monkeypatch.chdir(tmp_path)  # 报告文件写到临时目录
+    mapped = []
+
+    def fake_map(batches, language):
+        mapped.append(batches)
+        return [{"sentiment_score": 50, "key_points": [f"run{len(mapped)}"]} for _ in batches]
+
+    monkeypatch.setattr(ai_analysis, "map_batches", fake_map)
+    monkeypatch.setattr(ai_analysis, "cached_json_completion",
+                        lambda *a, **k: {"final_controversies": [], "human_summary": "summary"})
+    return mapped
+
+
+def test_rerun_without_new_rows_reuses_stored_batches(scored, fake_llm):
+    assert ai_analysis.run_analysis("en", "kw")["human_summary"] == "summary"
+    assert len(fake_llm) == 1
+
+    report = ai_analysis.run_analysis("en", "kw")
+    assert len(fake_llm) == 1
+    assert report["human_summary"] == "summary"
+    assert len(ai_analysis.load_batch_results("kw", "en")) > 0
+
+
+def test_rerun_maps_only_new_rows(scored, fake_llm):
+    ai_analysis.run_analysis("en", "kw")
+    insert_videos(["brand new video about something else entirely"], start=10)
+
+    ai_analysis.run_analysis("en", "kw")
+    assert len(fake_llm) == 2
+    assert fake_llm[1] == ["brand new video about something else entirely"]
+    # Reduce 使用历史与本次的全部批次
+    assert {r["key_points"][0] for r in ai_analysis.load_batch_results("kw", "en")} == {"run1", "run2"}
+
+
+def test_batches_are_stored_per_language(scored, fake_llm):
+    ai_analysis.run_analysis("en", "kw")
+    ai_analysis.run_analysis("zh", "kw")
+    assert len(fake_llm) == 2
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import collect
+import data_cleaning
+import db
+import jobs
+
+
+@pytest.fixture
+def api(temp_db):
+    import api
+
+    api.init_db_tables()
+    collect.init_db()
+    return api
+
+
+@pytest.fixture
+def client(api):
+    # 不进入 with：不触发 startup，测试中不启动调度器和工作线程
+    return TestClient(api.app)
+
+
+def seed_posts(n, keyword="kw"):
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT INTO reddit_submission (post_id, task_id, title, subreddit, score, num_comments, created_utc,
+                                       is_self, is_stickied, url)
+        VALUES (?, 1, ?, 'r', ?, 2, ?, 0, 0, 'u')
+        """, [(f"p{i}", f"post {i} " + " ".join(f"w{i}x{j}" for j in range(6)), i, 1700000000 + i)
+              for i in range(n)])
+        conn.commit()
+    data_cleaning.process_data(keyword)
+
+
+def test_source_data_without_paging_returns_everything(client):
+    seed_posts(450)
+    response = client.get("/api/source-data", params={"keyword": "kw"})
+    assert response.status_code == 200
+    assert len(response.json()) == 450
+    assert "x-next-cursor" not in response.headers
+
+
+def test_source_data_pages_follow_cursor(client):
+    seed_posts(450)
+    first = client.get("/api/source-data", params={"keyword": "kw", "limit": 100})
+    assert len(first.json()) == 100
+    cursor = first.headers["x-next-cursor"]
+
+    # 只给 cursor 时按默认页大小继续
+    second = client.get("/api/source-data", params={"keyword": "kw", "cursor": cursor})
+    assert len(second.json()) == 200
+    seen = {item["content"] for item in first.json() + second.json()}
+    assert len(seen) == 300
+
+
+def first_event(api, **params):
+    """调用 /api/events 的处理函数，取出第一条 SSE 消息"""
+    async def read():
+        response = await api.stream_events(**{"job": None, "task": None, "last_event_id": 0,
+                                              "last_event_id_header": None, **params})
+        body = response.body_iterator
+        try:
+            return await asyncio.wait_for(body.__anext__(), timeout=5)
+        finally:
+            await body.aclose()
+    return json.loads(asyncio.run(read()).split("data: ", 1)[1])
+
+
+def test_events_accept_legacy_task_name(api):
+    other = jobs.registry.create("manual_other_022", "other", "en")
+    target = jobs.registry.create("manual_target_022", "target", "en")
+
+    event = first_event(api, task="manual_target_022")
+    assert event["channel"] == target
+    assert event["data"]["name"] == "manual_target_022"
+
+    # job 优先于 task
+    event = first_event(api, job=other, task="manual_target_022")
+    assert event["channel"] == other
+
+
+def add_subscription(keyword):
+    with db.connection() as conn:
+        cur = conn.execute("INSERT INTO subscriptions (keyword, language, interval_seconds) VALUES (?, 'en', 600)",
+                           (keyword,))
+        conn.commit()
+        return cur.lastrowid
+
+
+@pytest.mark.parametrize("shared_error", [None, "collect failed"])
+def test_attached_scheduled_task_finishes_with_shared_job(api, shared_error):
+    keyword = f"attach_{bool(shared_error)}"
+    sub_id = add_subscription(keyword)
+    shared_id, _ = jobs.registry.submit(f"manual_{keyword}", keyword, "en")
+    job_id = jobs.registry.create(f"subscription_{sub_id}", keyword=keyword, language="en", subscription_id=sub_id)
+
+    # 挂到正在执行的手动任务上：立即返回 Future，不阻塞调用线程
+    future = api.scheduled_collection_task(sub_id, job_id)
+    assert not future.done()
+    assert jobs.registry.get(job_id)["shared_from"] == shared_id
+
+    jobs.registry.finish(shared_id, result={"avg_sentiment": 12.0}, error=shared_error)
+    assert future.done()
+    job = jobs.registry.get(job_id)
+    with db.connection() as conn:
+        alerts = conn.execute("SELECT COUNT(*) FROM alerts WHERE subscription_id = ?", (sub_id,)).fetchone()[0]
+        execution_count = conn.execute("SELECT execution_count FROM subscriptions WHERE id = ?",
+                                       (sub_id,)).fetchone()[0]
+    if shared_error:
+        assert isinstance(future.exception(), RuntimeError)
+        assert job["state"] == jobs.FAILED and shared_error in job["error"]
+        assert (alerts, execution_count) == (0, 0)
+    else:
+        assert future.exception() is None
+        assert job["state"] == jobs.SUCCEEDED and job["result"] == {"avg_sentiment": 12.0}
+        assert (alerts, execution_count) == (1, 1)
+
+
+def test_collect_rejects_unknown_sampling_strategy(client):
+    before = jobs.registry.list(None, jobs.MAX_FINISHED)
+    response = client.post("/api/collect", json={"keyword": "kw", "sampling_strategy": "nope"})
+    assert response.status_code == 400
+    assert "nope" in response.json()["detail"]
+    # 参数校验失败时不登记 job
+    assert jobs.registry.list(None, jobs.MAX_FINISHED) == before
+
+
+def test_subscription_rejects_unknown_sampling_strategy(client):
+    response = client.post("/api/subscriptions", json={"keyword": "kw", "sampling_strategy": "nope"})
+    assert response.status_code == 400
+    assert client.get("/api/subscriptions").json() == []
+
+
+def test_create_subscription_returns_id(client):
+    response = client.post("/api/subscriptions", json={"keyword": "kw", "interval_seconds": 3600})
+    assert response.status_code == 200
+    sub_id = response.json()["id"]
+    assert [s["id"] for s in client.get("/api/subscriptions").json()] == [sub_id]
+
+
+def test_import_does_not_touch_database(tmp_path):
+    """cpu_pool 的 spawn 子进程会重新导入主模块：导入 api 不应建库或迁移，建表在 startup 中完成"""
+    db_file = tmp_path / "import.db"
+    script = f"""
+import os, sys
+sys.path.insert(0, {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r})
+import api
+assert not os.path.exists({str(db_file)!r}), "导入时创建了数据库"
+from fastapi.testclient import TestClient
+with TestClient(api.app):
+    pass
+import sqlite3
+tables = {{r[0] for r in sqlite3.connect({str(db_file)!r}).execute("SELECT name FROM sqlite_master")}}
+assert {{"subscriptions", "alerts", "job_queue"}} <= tables, tables
+"""
+    env = {**os.environ, "DB_NAME": str(db_file)}
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
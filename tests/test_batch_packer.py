@@ -0,0 +1,46 @@
+import pytest
+import tiktoken
+
+from batch_packer import pack_batches, split_tokens
+
+CJK_TEXT = "这个视频讲得非常清楚，评论区的讨论也很有价值。" * 20 + "最后一句。"
+
+
+@pytest.fixture
+def byte_encoding():
+    """字节级编码（每个字节一个 token，无合并）：中文字符固定占 3 个 token，切片必然落在字符中间"""
+    ranks = {bytes([i]): i for i in range(256)}
+    return tiktoken.Encoding(name="bytes", pat_str=r"\S+|\s+", mergeable_ranks=ranks, special_tokens={})
+
+
+def check_pieces(pieces, text, max_tokens, encoding):
+    assert "".join(piece for _, piece in pieces) == text
+    for n_tokens, piece in pieces:
+        assert "�" not in piece
+        assert n_tokens == len(encoding.encode_ordinary(piece)) <= max_tokens
+
+
+@pytest.mark.parametrize("max_tokens", [1, 4, 10, 32, 100])
+def test_split_keeps_cjk_characters_whole(byte_encoding, max_tokens):
+    tokens = byte_encoding.encode_ordinary(CJK_TEXT)
+    check_pieces(split_tokens(tokens, max_tokens, byte_encoding), CJK_TEXT, max(max_tokens, 3), byte_encoding)
+
+
+def test_pack_batches_never_exceeds_limit_with_cjk(byte_encoding):
+    texts = [CJK_TEXT, "short comment", "中文短评"]
+    batches = pack_batches(texts, 10, byte_encoding)
+    for b in batches:
+        assert "�" not in b["text"]
+        assert len(byte_encoding.encode_ordinary(b["text"])) <= b["tokens"] <= 10
+    pieces = [b["text"] for b in batches if b["ids"] == [0]]
+    assert sorted("".join(pieces)) == sorted(CJK_TEXT)
+
+
+def test_split_with_cl100k():
+    try:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # 离线环境无法下载词表
+        pytest.skip(f"cl100k_base 不可用: {e}")
+    tokens = encoding.encode_ordinary(CJK_TEXT)
+    for max_tokens in (7, 50):
+        check_pieces(split_tokens(tokens, max_tokens, encoding), CJK_TEXT, max_tokens, encoding)
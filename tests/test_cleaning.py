@@ -0,0 +1,164 @@
+import threading
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import collect
+import data_cleaning
+import db
+import keyword_stats
+
+
+def insert_raw(n, start=0, title_size=200):
+    """生成 n 条 YouTube 原始记录（含较长的字幕文本，清洗时不应被读入内存）"""
+    rows = [(f"v{i}", 1, f"video {i} " + "great value " * (title_size // 12), "chan", "2024-01-02T03:04:05Z",
+             i, f"https://youtu.be/v{i}", "transcript " * 200)
+            for i in range(start, start + n)]
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT INTO youtube_video (video_id, task_id, title, channel, published_at, view_count, url, transcript)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+
+
+def cleaned_rows(keyword):
+    with db.connection() as conn:
+        return conn.execute("""
+        SELECT platform, raw_id, content, timestamp, view_count, sentiment FROM cleaned_data
+        WHERE keyword = ? ORDER BY raw_id
+        """, (keyword,)).fetchall()
+
+
+TEXTS = [
+    None,
+    "",
+    "   ",
+    "plain text",
+    "emoji 😀🔥 mixed 中文，标点！",
+    "see https://example.com/a?b=1&c=2 and http://x.y/z now",
+    "  tabs\tand\n\nnewlines   everywhere  ",
+    "&amp; &lt;b&gt;bold&lt;/b&gt; &#x1F600; &nbsp;",
+    "only junk ### @@@ $$$",
+    "url-only https://t.co/abc123",
+]
+
+TIMES = [
+    None,
+    "",
+    0,
+    1700000000,
+    1700000000.5,
+    float("nan"),
+    1e20,
+    "Jan 15, 2024 · 3:45 PM UTC",
+    "2 days ago",
+    "Streamed 3 weeks ago",
+    "2024-01-15T10:30:00Z",
+    "2024-01-15T10:30:00+08:00",
+    " 2024-01-15 10:30:00.123456 ",
+    "2024-01-15",
+    "Mon Jan 15 10:30:00 +0000 2024",
+    "2024-02-30T00:00:00",
+    "not a date",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_clean_text_series_matches_scalar(text):
+    assert data_cleaning.clean_text_series(pd.Series([text], dtype=object)).tolist() == [data_cleaning.clean_text(text)]
+
+
+@pytest.mark.parametrize("val", TIMES)
+def test_normalize_time_series_matches_scalar(val):
+    assert data_cleaning.normalize_time_series(pd.Series([val], dtype=object)).tolist() == [data_cleaning.normalize_time(val)]
+
+
+def test_series_functions_match_scalar_on_mixed_input():
+    # 同一批中混合各种格式，ISO 按时区分组解析后仍需回到原位置
+    texts = pd.Series(TEXTS * 3, index=range(100, 100 + len(TEXTS) * 3), dtype=object)
+    times = pd.Series(TIMES * 3, index=range(100, 100 + len(TIMES) * 3), dtype=object)
+    cleaned = data_cleaning.clean_text_series(texts)
+    normalized = data_cleaning.normalize_time_series(times)
+    assert cleaned.index.equals(texts.index) and normalized.index.equals(times.index)
+    assert cleaned.tolist() == [data_cleaning.clean_text(t) for t in texts]
+    assert normalized.tolist() == [data_cleaning.normalize_time(v) for v in times]
+
+
+@pytest.fixture
+def raw_db(temp_db):
+    collect.init_db()
+    return temp_db
+
+
+def peak_memory(n, chunk_size):
+    insert_raw(n, start=peak_memory.offset)
+    peak_memory.offset += n
+    tracemalloc.start()
+    try:
+        data_cleaning.process_data("kw", chunk_size=chunk_size)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+peak_memory.offset = 0
+
+
+def test_chunked_output_matches_single_pass(raw_db):
+    insert_raw(57)
+    data_cleaning.process_data("one", incremental=False, chunk_size=10_000)
+    data_cleaning.process_data("many", incremental=False, chunk_size=7)
+    assert cleaned_rows("one") == cleaned_rows("many")
+    assert len(cleaned_rows("many")) == 57
+
+
+def test_incremental_run_only_reads_new_rows(raw_db, monkeypatch):
+    insert_raw(20)
+    data_cleaning.process_data("kw", chunk_size=8)
+    insert_raw(5, start=20)
+
+    seen = []
+    original = data_cleaning.clean_chunk
+    monkeypatch.setattr(data_cleaning, "clean_chunk", lambda df, *a: seen.append(len(df)) or original(df, *a))
+    data_cleaning.process_data("kw", chunk_size=8)
+    assert sum(seen) == 5
+    assert len(cleaned_rows("kw")) == 25
+
+
+def test_peak_memory_does_not_grow_with_table_size(raw_db):
+    peak_memory.offset = 0
+    small = peak_memory(1_000, chunk_size=250)
+    large = peak_memory(4_000, chunk_size=250)
+    # 表大 4 倍、每行带约 2KB 字幕，峰值内存只由分块大小决定
+    assert large < small * 1.5, (small, large)
+    with db.connection() as conn:
+        assert keyword_stats.get_stats("kw", conn)["total_posts"] == 5_000
+
+
+def test_overlapping_runs_keep_stats_consistent(raw_db):
+    insert_raw(300, title_size=24)
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def run():
+        try:
+            barrier.wait()
+            data_cleaning.process_data("kw", incremental=False, chunk_size=5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+    with db.connection() as conn:
+        incremental = keyword_stats.get_stats("kw", conn)
+        keyword_stats.rebuild(conn, "kw")
+        rebuilt = keyword_stats.get_stats("kw", conn)
+    assert incremental == rebuilt
+    assert rebuilt["total_posts"] == 300
@@ -0,0 +1,127 @@
+import threading
+
+import db
+
+
+def create_table():
+    with db.connection() as conn:
+        conn.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, writer INTEGER, n INTEGER)")
+        conn.commit()
+
+
+def count_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM item").fetchone()[0]
+
+
+def test_wal_and_pragmas(temp_db):
+    with db.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == db.BUSY_TIMEOUT_MS
+
+
+def test_nested_caller_cannot_end_outer_transaction(temp_db):
+    create_table()
+    outer = db.get_connection()
+    outer.execute("INSERT INTO item (writer, n) VALUES (0, 1)")
+    assert outer.in_transaction
+
+    # 嵌套的辅助函数拿到的是另一个连接：它的 close() / with conn 不会回滚或提交外层事务
+    inner = db.get_connection()
+    assert inner is not outer
+    with inner:
+        assert count_rows(inner) == 0
+    inner.close()
+    with db.connection() as conn:
+        assert count_rows(conn) == 0
+
+    assert outer.in_transaction
+    outer.commit()
+    outer.close()
+    with db.connection() as conn:
+        assert count_rows(conn) == 1
+
+
+def test_connections_are_reused_across_threads(temp_db):
+    conn = db.get_connection()
+    conn.close()
+    conn.close()  # 重复 close 不会把连接归还两次
+
+    seen = []
+
+    def borrow():
+        with db.connection() as c:
+            c.execute("SELECT 1")
+            seen.append(c)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    thread.join()
+    assert seen == [conn]
+    assert db.get_connection() is conn
+    assert db.get_connection() is not conn
+
+
+def test_close_rolls_back_before_returning_to_pool(temp_db):
+    create_table()
+    conn = db.get_connection()
+    conn.execute("INSERT INTO item (writer, n) VALUES (0, 1)")
+    conn.close()
+
+    again = db.get_connection()
+    assert again is conn
+    assert not again.in_transaction
+    assert count_rows(again) == 0
+    again.close()
+
+
+def test_pool_keeps_at_most_pool_size_idle(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "POOL_SIZE", 2)
+    conns = [db.get_connection() for _ in range(5)]
+    for conn in conns:
+        conn.close()
+    assert len(db._idle[temp_db]) == 2
+
+
+def test_concurrent_writers_and_readers(temp_db):
+    create_table()
+    writers, readers, rows_per_writer = 4, 4, 200
+    done = threading.Event()
+    errors = []
+    observed = {i: [] for i in range(readers)}
+
+    def write(writer):
+        try:
+            for n in range(rows_per_writer):
+                with db.connection() as conn:
+                    conn.execute("INSERT INTO item (writer, n) VALUES (?, ?)", (writer, n))
+                    conn.commit()
+        except Exception as e:
+            errors.append(e)
+
+    def read(reader):
+        try:
+            while not done.is_set():
+                with db.connection() as conn:
+                    observed[reader].append(count_rows(conn))
+        except Exception as e:
+            errors.append(e)
+
+    reader_threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    for t in reader_threads + writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    done.set()
+    for t in reader_threads:
+        t.join()
+
+    assert errors == []
+    with db.connection() as conn:
+        assert count_rows(conn) == writers * rows_per_writer
+    for counts in observed.values():
+        assert counts
+        # 读线程在写入期间始终能读到已提交的数据，计数只增不减
+        assert counts == sorted(counts)
+    # 连接被复用：池中的空闲连接数不超过上限，远少于借出次数
+    assert len(db._idle[temp_db]) <= db.POOL_SIZE
@@ -0,0 +1,32 @@
+import asyncio
+
+import events
+
+
+def test_wildcard_replay_is_bounded():
+    bus = events.EventBus(replay_size=5, max_channels=50)
+    for channel in range(10):
+        for i in range(5):
+            bus.publish(f"job{channel}", i)
+
+    replayed = bus.replay()
+    assert [e["id"] for e in replayed] == [46, 47, 48, 49, 50]
+    assert [e["id"] for e in bus.replay(after_id=48)] == [49, 50]
+    # 指定 channel 时仍可补发该 channel 自己的历史
+    assert [e["data"] for e in bus.replay("job0")] == [0, 1, 2, 3, 4]
+
+
+def test_wildcard_subscriber_gets_recent_history_then_live_events():
+    bus = events.EventBus(replay_size=3)
+    for i in range(10):
+        bus.publish(f"job{i}", i)
+
+    async def read():
+        subscription = bus.subscribe()
+        received = [(await subscription.__anext__())["data"] for _ in range(3)]
+        bus.publish("live", "new")
+        received.append((await subscription.__anext__())["data"])
+        await subscription.aclose()
+        return received
+
+    assert asyncio.run(read()) == [7, 8, 9, "new"]
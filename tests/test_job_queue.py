@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import job_queue
+import jobs
+from db import connection
+from migrate import migrate
+
+
+@pytest.fixture
+def conn(temp_db):
+    with connection(row_factory=sqlite3.Row) as conn:
+        migrate(conn)
+        yield conn
+
+
+def wait_until(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.02)
+
+
+def test_claim_takes_latest_due_first_and_respects_jitter(conn):
+    now = 1000.0
+    job_queue.enqueue(conn, 1, due_at=900, jitter=0, now=now)
+    job_queue.enqueue(conn, 2, due_at=500, jitter=0, now=now)
+    conn.execute("INSERT INTO job_queue (subscription_id, state, due_at, not_before, enqueued_at) "
+                 "VALUES (3, 'queued', 100, ?, ?)", (now + 30, now))
+    conn.commit()
+
+    # 订阅 3 最迟，但还在随机延迟内
+    order = [job_queue.claim(conn, now=now)["subscription_id"] for _ in range(2)]
+    assert order == [2, 1]
+    assert job_queue.claim(conn, now=now) is None
+    assert job_queue.next_ready_in(conn, now=now) == pytest.approx(30)
+    assert job_queue.claim(conn, now=now + 30)["subscription_id"] == 3
+
+
+def test_enqueue_jitter_is_bounded(conn):
+    for sub_id in range(50):
+        job_queue.enqueue(conn, sub_id, due_at=0, jitter=10, now=1000)
+    delays = [row[0] - 1000 for row in conn.execute("SELECT not_before FROM job_queue")]
+    assert all(0 <= d <= 10 for d in delays)
+    assert max(delays) - min(delays) > 1
+
+
+def test_one_pending_row_per_subscription(conn):
+    first = job_queue.enqueue(conn, 7, due_at=0, jitter=0)
+    assert first is not None
+    assert job_queue.enqueue(conn, 7, due_at=0, jitter=0) is None
+    conn.commit()
+
+    row = job_queue.claim(conn)
+    assert job_queue.enqueue(conn, 7, due_at=0, jitter=0) is None  # running 时同样不重复入队
+    job_queue.complete(conn, row["id"])
+    assert job_queue.enqueue(conn, 7, due_at=0, jitter=0) is not None
+
+
+def test_recover_requeues_running_rows(conn):
+    job_queue.enqueue(conn, 1, due_at=0, jitter=0)
+    job_queue.enqueue(conn, 2, due_at=0, jitter=0)
+    conn.commit()
+    job_queue.claim(conn)
+    assert job_queue.recover(conn) == 1
+    metrics = job_queue.queue_metrics(conn)
+    assert (metrics["queued"], metrics["running"]) == (2, 0)
+    assert job_queue.claim(conn)["attempts"] == 2
+
+
+def test_worker_pool_records_success_and_failure(conn):
+    job_queue.enqueue(conn, 1, due_at=0, jitter=0)
+    job_queue.enqueue(conn, 2, due_at=1, jitter=0)
+    conn.commit()
+
+    def handler(row):
+        if row["subscription_id"] == 2:
+            raise RuntimeError("boom")
+
+    pool = job_queue.WorkerPool(handler, workers=2, poll_seconds=0.05)
+    pool.start()
+    try:
+        wait_until(lambda: job_queue.queue_metrics(conn)["done"] + job_queue.queue_metrics(conn)["failed"] == 2)
+    finally:
+        pool.stop(timeout=5)
+    rows = dict(conn.execute("SELECT subscription_id, error FROM job_queue").fetchall())
+    assert rows == {1: None, 2: "boom"}
+
+
+def test_thousand_subscriptions_run_with_bounded_concurrency(conn):
+    """模拟 1000 个订阅同时到期：全部执行完，并发数不超过工作线程数"""
+    workers = 8
+    for sub_id in range(1000):
+        job_queue.enqueue(conn, sub_id, due_at=sub_id, jitter=0)
+    conn.commit()
+
+    lock = threading.Lock()
+    running = peak = 0
+    seen = []
+
+    def handler(row):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+            seen.append(row["subscription_id"])
+        time.sleep(0.002)
+        with lock:
+            running -= 1
+
+    pool = job_queue.WorkerPool(handler, workers=workers, poll_seconds=0.05)
+    pool.start()
+    try:
+        wait_until(lambda: job_queue.queue_metrics(conn)["done"] == 1000, timeout=120)
+        metrics = pool.metrics()
+    finally:
+        pool.stop(timeout=5)
+
+    assert sorted(seen) == list(range(1000))
+    assert 1 < peak <= workers
+    assert metrics["queued"] == metrics["running"] == 0
+    # 最迟的任务先执行：前 workers 个领取的是 due_at 最小的那一批
+    assert sorted(seen[:workers]) == list(range(workers))
+
+
+def test_legacy_status_separates_queued_from_running():
+    registry = jobs.JobRegistry()
+    queued = [registry.create(f"subscription_{i}", f"kw{i}", "en") for i in range(3)]
+    status = registry.legacy_status()
+    assert status["is_running"] is False
+    assert (status["queued_jobs"], status["running_jobs"]) == (3, 0)
+
+    registry.start(queued[0])
+    status = registry.legacy_status()
+    assert status["is_running"] is True
+    assert status["current_task"] == "subscription_0"
+    assert (status["queued_jobs"], status["running_jobs"], status["active_jobs"]) == (2, 1, 3)
+
+
+def test_future_handlers_do_not_hold_workers(conn):
+    """handler 返回 Future（挂到其他任务上）时工作线程立即空出，记录在 Future 完成时结束"""
+    for sub_id in range(5):
+        job_queue.enqueue(conn, sub_id, due_at=sub_id, jitter=0)
+    conn.commit()
+    futures = {}
+
+    def handler(row):
+        futures[row["subscription_id"]] = Future()
+        return futures[row["subscription_id"]]
+
+    pool = job_queue.WorkerPool(handler, workers=1, poll_seconds=0.05)
+    pool.start()
+    try:
+        # 只有一个工作线程，仍能领取全部 5 条
+        wait_until(lambda: len(futures) == 5)
+        assert pool.busy == 0
+        assert job_queue.queue_metrics(conn)["running"] == 5
+
+        for sub_id, future in futures.items():
+            if sub_id == 4:
+                future.set_exception(RuntimeError("shared job failed"))
+            else:
+                future.set_result(None)
+        metrics = job_queue.queue_metrics(conn)
+        assert (metrics["running"], metrics["done"], metrics["failed"]) == (0, 4, 1)
+    finally:
+        pool.stop(timeout=5)
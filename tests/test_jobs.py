@@ -0,0 +1,109 @@
+import threading
+import time
+
+import jobs
+
+
+def run_concurrently(func, n=8):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        results[i] = func(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_submits_share_one_job():
+    registry = jobs.JobRegistry()
+    results = run_concurrently(lambda i: registry.submit(f"manual_{i}", "kw", "en"))
+    new = [job_id for job_id, outcome in results if outcome == jobs.NEW]
+    assert len(new) == 1
+    assert all(job_id == new[0] for job_id, _ in results)
+    assert {outcome for _, outcome in results} == {jobs.NEW, jobs.ATTACHED}
+
+
+def test_concurrent_begins_attach_to_the_first():
+    registry = jobs.JobRegistry()
+    job_ids = [registry.create(f"subscription_{i}", "kw", "en") for i in range(8)]
+    results = run_concurrently(lambda i: registry.begin(job_ids[i]))
+
+    runners = [shared for shared, outcome in results if outcome == jobs.NEW]
+    assert len(runners) == 1
+    assert all(shared == runners[0] for shared, _ in results)
+    attached = [registry.get(job_id) for job_id in job_ids if job_id != runners[0]]
+    assert all(job["shared_from"] == runners[0] for job in attached)
+
+    # 不同语言不共享
+    other = registry.create("subscription_x", "kw", "zh")
+    assert registry.begin(other) == (other, jobs.NEW)
+
+
+def test_fresh_result_is_reused_within_window():
+    registry = jobs.JobRegistry()
+    job_id, _ = registry.submit("manual_kw", "kw", "en")
+    registry.finish(job_id, result={"avg_sentiment": 60})
+
+    assert registry.submit("manual_kw", "kw", "en", fresh_within=60) == (job_id, jobs.FRESH)
+    # force（fresh_within=0）时重新执行
+    forced, outcome = registry.submit("manual_kw", "kw", "en", fresh_within=0)
+    assert outcome == jobs.NEW and forced != job_id
+    registry.finish(forced, result={})
+
+    time.sleep(0.05)
+    assert registry.submit("manual_kw", "kw", "en", fresh_within=0.01)[1] == jobs.NEW
+
+
+def test_failed_job_is_not_reused():
+    registry = jobs.JobRegistry()
+    job_id, _ = registry.submit("manual_kw", "kw", "en")
+    registry.finish(job_id, error="boom")
+    new_id, outcome = registry.submit("manual_kw", "kw", "en", fresh_within=60)
+    assert outcome == jobs.NEW and new_id != job_id
+
+
+def test_waiter_sees_shared_failure():
+    registry = jobs.JobRegistry()
+    runner = registry.create("subscription_1", "kw", "en")
+    waiter = registry.create("subscription_2", "kw", "en")
+    registry.begin(runner)
+    assert registry.begin(waiter) == (runner, jobs.ATTACHED)
+
+    seen = []
+    registry.on_finish(runner, seen.append)
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(snapshot=registry.wait(runner, timeout=5)))
+    thread.start()
+    registry.finish(runner, error=RuntimeError("collect failed"))
+    thread.join()
+
+    for snapshot in (result["snapshot"], seen[0]):
+        assert snapshot["state"] == jobs.FAILED
+        assert snapshot["error"] == "collect failed"
+
+
+def test_on_finish_after_finish_runs_immediately():
+    registry = jobs.JobRegistry()
+    job_id = registry.create("manual_kw", "kw", "en")
+    registry.finish(job_id, result={"ok": True})
+    seen = []
+    registry.on_finish(job_id, seen.append)
+    registry.on_finish("missing", seen.append)
+    assert seen[0]["result"] == {"ok": True}
+    assert seen[1] is None
+
+
+def test_failing_callback_does_not_break_finish():
+    registry = jobs.JobRegistry()
+    job_id = registry.create("manual_kw", "kw", "en")
+    seen = []
+    registry.on_finish(job_id, lambda snapshot: 1 / 0)
+    registry.on_finish(job_id, seen.append)
+    assert registry.finish(job_id, result={})["state"] == jobs.SUCCEEDED
+    assert len(seen) == 1
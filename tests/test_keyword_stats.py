@@ -0,0 +1,84 @@
+import pytest
+
+import collect
+import data_cleaning
+import db
+import keyword_stats
+
+
+@pytest.fixture
+def raw_db(temp_db):
+    collect.init_db()
+    return temp_db
+
+
+def add_reddit(rows):
+    """INSERT OR REPLACE：已有 post_id 的行被替换并获得新的 rowid，下一次清洗会更新 cleaned_data 中的同一行"""
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT OR REPLACE INTO reddit_submission (post_id, task_id, title, subreddit, score, created_utc, url)
+        VALUES (?, 1, ?, 'r', ?, 1700000000, 'u')
+        """, [(post_id, f"reddit post {post_id} about things", score) for post_id, score in rows])
+        conn.commit()
+
+
+def add_youtube(rows):
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT OR REPLACE INTO youtube_video (video_id, task_id, title, channel, published_at, view_count, url)
+        VALUES (?, 1, ?, 'c', '2024-01-02T03:04:05Z', ?, 'u')
+        """, [(video_id, f"video {video_id} about things", views) for video_id, views in rows])
+        conn.commit()
+
+
+def add_tweets(rows):
+    with db.connection() as conn:
+        conn.executemany("""
+        INSERT OR REPLACE INTO twitter_tweet (tweet_id, task_id, content, username, created_at,
+                                              retweet_count, like_count, url)
+        VALUES (?, 1, ?, 'u', '2024-01-02T03:04:05Z', ?, ?, 'u')
+        """, [(tweet_id, f"tweet {tweet_id} about things", rt, likes) for tweet_id, rt, likes in rows])
+        conn.commit()
+
+
+def stats_after_rebuild(keyword):
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        keyword_stats.rebuild(conn, keyword)
+        stats = keyword_stats.get_stats(keyword, conn)
+        conn.rollback()
+    return stats
+
+
+def test_incremental_stats_match_full_rebuild(raw_db):
+    add_reddit([(f"p{i}", i * 10) for i in range(20)])
+    add_youtube([(f"v{i}", 1000 + i) for i in range(10)])
+    add_tweets([(f"t{i}", i, None) for i in range(5)])
+    data_cleaning.process_data("kw", chunk_size=7)
+
+    # 第二轮：部分已有行的互动数更新（含置空、非数字），同时有新行
+    add_reddit([(f"p{i}", 5) for i in range(0, 20, 3)] + [("p100", 7)])
+    add_youtube([("v1", None), ("v2", "n/a"), ("v50", 3)])
+    add_tweets([("t0", 100, 200), ("t9", 1, 1)])
+    data_cleaning.process_data("kw", chunk_size=7)
+
+    incremental = keyword_stats.get_stats("kw")
+    assert incremental == stats_after_rebuild("kw")
+    assert incremental["total_posts"] == 38
+    assert (incremental["reddit_posts"], incremental["youtube_posts"], incremental["twitter_posts"]) == (21, 11, 6)
+    with db.connection() as conn:
+        score_sum = conn.execute("SELECT SUM(score) FROM cleaned_data WHERE keyword = 'kw'").fetchone()[0]
+    assert incremental["score_sum"] == score_sum
+
+
+def test_stats_are_kept_per_keyword(raw_db):
+    add_reddit([("p1", 10), ("p2", 20)])
+    data_cleaning.process_data("a")
+    add_reddit([("p3", 30)])
+    # 水位线按关键词记录，b 第一次清洗会读入全部原始行
+    data_cleaning.process_data("b")
+
+    assert keyword_stats.get_stats("a")["score_sum"] == 30
+    assert keyword_stats.get_stats("b")["score_sum"] == 60
+    assert keyword_stats.get_stats()["total_posts"] == 5
+    assert keyword_stats.get_stats("missing") is None
@@ -0,0 +1,148 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from openai import BadRequestError, InternalServerError, OpenAI, RateLimitError
+
+import ai_analysis
+
+
+class FakeOpenAI:
+    """本地的 OpenAI 兼容服务：按 plan 依次返回状态码，之后返回 200；每个请求延迟 latency 秒"""
+
+    def __init__(self):
+        self.plan = []
+        self.latency = 0.0
+        self.requests = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    fake.requests.append((time.monotonic(), body))
+                    status, headers = fake.plan.pop(0) if fake.plan else (200, {})
+                time.sleep(fake.latency)
+                if status == 200:
+                    marker = re.search(r"batch-(\d+)", body["messages"][-1]["content"])
+                    content = {"sentiment_score": int(marker.group(1)) if marker else 50, "key_points": []}
+                    payload = {"id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+                               "choices": [{"index": 0, "finish_reason": "stop",
+                                            "message": {"role": "assistant", "content": json.dumps(content)}}]}
+                else:
+                    payload = {"error": {"message": f"status {status}", "type": "test"}}
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_api(temp_db, monkeypatch):
+    fake = FakeOpenAI()
+    monkeypatch.setattr(ai_analysis, "client", OpenAI(api_key="test", base_url=fake.base_url, max_retries=0))
+    monkeypatch.setattr(ai_analysis, "request_limiter", ai_analysis.TokenBucket(100_000))
+    monkeypatch.setattr(ai_analysis, "token_limiter", ai_analysis.TokenBucket(100_000_000))
+    monkeypatch.setattr(ai_analysis, "RETRY_BASE_DELAY", 0.05)
+    monkeypatch.setattr(ai_analysis, "RETRY_MAX_DELAY", 0.2)
+    yield fake
+    fake.close()
+
+
+def completion(text="hello"):
+    response = ai_analysis.chat_completion([{"role": "user", "content": text}])
+    return json.loads(response.choices[0].message.content)
+
+
+def test_retries_429_and_5xx_then_succeeds(fake_api):
+    fake_api.plan = [(429, {}), (500, {}), (503, {})]
+    assert completion("batch-7")["sentiment_score"] == 7
+    assert len(fake_api.requests) == 4
+    # 指数退避：相邻两次重试的间隔递增（带 0.5-1.0 的随机抖动）
+    times = [t for t, _ in fake_api.requests]
+    assert times[1] - times[0] >= 0.05 * 0.5
+    assert times[3] - times[2] >= 0.05 * 4 * 0.5
+
+
+def test_retry_after_is_capped_by_backoff_ceiling(fake_api):
+    fake_api.plan = [(429, {"Retry-After": "120"})]
+    start = time.monotonic()
+    completion()
+    # 服务端要求等 120s，但不超过 RETRY_MAX_DELAY
+    assert time.monotonic() - start < 1.0
+    assert len(fake_api.requests) == 2
+
+
+def test_backoff_delay_never_exceeds_ceiling(fake_api):
+    response = httpx.Response(429, request=httpx.Request("POST", fake_api.base_url))
+    error = RateLimitError("slow down", response=response, body=None)
+    delays = [ai_analysis._retry_delay(error, attempt) for attempt in range(20)]
+    assert all(0 < d <= ai_analysis.RETRY_MAX_DELAY for d in delays)
+
+
+def test_gives_up_after_max_retries(fake_api, monkeypatch):
+    monkeypatch.setattr(ai_analysis, "MAX_RETRIES", 2)
+    fake_api.plan = [(500, {})] * 5
+    with pytest.raises(InternalServerError):
+        completion()
+    assert len(fake_api.requests) == 3
+
+
+def test_client_errors_are_not_retried(fake_api):
+    fake_api.plan = [(400, {})]
+    with pytest.raises(BadRequestError):
+        completion()
+    assert len(fake_api.requests) == 1
+
+
+def test_map_batches_concurrent_and_ordered(fake_api):
+    fake_api.latency = 0.2
+    batches = [f"comments of batch-{i}" for i in range(8)]
+    start = time.monotonic()
+    results = ai_analysis.map_batches(batches, "en", max_workers=8)
+    elapsed = time.monotonic() - start
+
+    # 顺序执行需要 8 * 0.2s
+    assert elapsed < 0.8
+    assert [r["sentiment_score"] for r in results] == list(range(8))
+
+
+def test_failed_batch_is_none_and_others_kept(fake_api, monkeypatch):
+    monkeypatch.setattr(ai_analysis, "MAX_RETRIES", 0)
+    fake_api.plan = [(500, {})]
+    results = ai_analysis.map_batches(["batch-1"], "en", max_workers=1)
+    assert results == [None]
+    assert ai_analysis.map_batches(["batch-2", "batch-3"], "en", max_workers=2)[1]["sentiment_score"] == 3
+
+
+def test_token_bucket_limits_rate():
+    bucket = ai_analysis.TokenBucket(120)  # 每秒补充 2 个
+    start = time.monotonic()
+    for _ in range(120):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.1  # 满桶可以直接突发
+    bucket.acquire()
+    bucket.acquire()
+    assert 0.7 <= time.monotonic() - start < 1.5
+
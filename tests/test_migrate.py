@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import db
+import keyword_stats
+import migrate
+
+
+def cleaned_columns(conn):
+    return [row[1] for row in conn.execute("PRAGMA table_info(cleaned_data)")]
+
+
+def test_fresh_database_has_no_engagement_column(temp_db):
+    with db.connection() as conn:
+        migrate.migrate(conn)
+        assert migrate.current_version(conn) == migrate.MIGRATIONS[-1][0]
+        columns = cleaned_columns(conn)
+    assert "engagement" not in columns
+    assert {"score", "view_count", "retweet_count", "like_count", "num_comments"} <= set(columns)
+
+
+def test_legacy_table_is_converted_and_engagement_dropped(temp_db):
+    with db.connection() as conn:
+        # DataFrame.to_sql 建出的旧表：无主键，互动数据是 JSON 字符串
+        conn.execute("""
+        CREATE TABLE cleaned_data (platform TEXT, raw_id TEXT, content TEXT, author TEXT,
+                                   timestamp TEXT, engagement TEXT, url TEXT, keyword TEXT)
+        """)
+        conn.executemany("INSERT INTO cleaned_data VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            ("reddit", "a", "x", "r", "2024-01-01", json.dumps({"score": 10, "num_comments": 2}), "u", "kw"),
+            ("reddit", "a", "x", "r", "2024-01-01", json.dumps({"score": 10, "num_comments": 2}), "u", "kw"),
+            ("twitter", "b", "y", "t", "2024-01-02", '{"retweet_count": 3, "like_count": NaN}', "u", "kw"),
+        ])
+        conn.commit()
+
+        migrate.migrate(conn)
+        assert "engagement" not in cleaned_columns(conn)
+        rows = conn.execute("""
+        SELECT platform, score, num_comments, retweet_count, like_count FROM cleaned_data ORDER BY raw_id
+        """).fetchall()
+        assert rows == [("reddit", 10, 2, None, None), ("twitter", None, None, 3, None)]
+        stats = keyword_stats.get_stats("kw", conn)
+    assert stats["total_posts"] == 2
+    assert stats["score_sum"] == 10 and stats["retweet_count_sum"] == 3
+
+
+@pytest.mark.parametrize("engagement, expected", [
+    ('{"score": 12, "num_comments": "3"}', (12, None, None, None, 3)),
+    ('{"view_count": 1.5e6}', (None, 1500000, None, None, None)),
+    ('{"retweet_count": Infinity, "like_count": -Infinity}', (None, None, None, None, None)),
+    ('{"score": "n/a", "like_count": null}', (None, None, None, None, None)),
+    ('[1, 2, 3]', (None, None, None, None, None)),
+    ("not json", (None, None, None, None, None)),
+    (None, (None, None, None, None, None)),
+])
+def test_legacy_engagement_becomes_numeric_columns(temp_db, engagement, expected):
+    with db.connection() as conn:
+        conn.execute("""
+        CREATE TABLE cleaned_data (platform TEXT, raw_id TEXT, content TEXT, author TEXT,
+                                   timestamp TEXT, engagement TEXT, url TEXT, keyword TEXT)
+        """)
+        conn.execute("INSERT INTO cleaned_data VALUES ('reddit', 'a', 'x', 'r', '2024-01-01', ?, 'u', 'kw')",
+                     (engagement,))
+        conn.commit()
+
+        migrate.migrate(conn)
+        row = conn.execute("SELECT score, view_count, retweet_count, like_count, num_comments FROM cleaned_data").fetchone()
+        stats = keyword_stats.get_stats("kw", conn)
+    assert tuple(row) == expected
+    assert stats["total_posts"] == 1
+    assert stats["heat_index"] == 1 + sum(v or 0 for v in expected) / 10
+
+
+def test_raw_task_indexes_created_after_migrations(temp_db):
+    with db.connection() as conn:
+        # 迁移先于原始表创建时（如先启动 API），建表后再补建索引
+        migrate.migrate(conn)
+        conn.execute("CREATE TABLE reddit_submission (post_id TEXT PRIMARY KEY, task_id INTEGER)")
+        migrate.create_raw_task_indexes(conn.cursor())
+        indexes = [row[1] for row in conn.execute("PRAGMA index_list(reddit_submission)")]
+    assert "idx_reddit_submission_task" in indexes
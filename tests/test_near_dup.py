@@ -0,0 +1,88 @@
+import pytest
+
+import db
+import migrate
+import near_dup
+
+BASE = "The new release fixes the memory leak in the scheduler and speeds up startup by forty percent"
+TEXTS = [
+    BASE,
+    "totally unrelated comment about cooking pasta with fresh tomatoes and basil tonight",
+    BASE + "!",
+    BASE.upper(),
+    "another different remark on the weather being rainy all week long in the city",
+    "",
+]
+
+
+@pytest.fixture
+def conn(temp_db):
+    with db.connection() as conn:
+        migrate.migrate(conn)
+        yield conn
+
+
+def insert(conn, texts, keyword="kw", start=0):
+    conn.executemany("INSERT INTO cleaned_data (platform, raw_id, content, keyword) VALUES ('reddit', ?, ?, ?)",
+                     [(f"r{start + i}", text, keyword) for i, text in enumerate(texts)])
+    conn.commit()
+    return [row[0] for row in conn.execute("SELECT id FROM cleaned_data WHERE keyword = ? ORDER BY id", (keyword,))]
+
+
+def clusters(conn, keyword="kw"):
+    return dict(conn.execute("SELECT cleaned_id, cluster_id FROM near_dup_doc WHERE keyword = ?", (keyword,)))
+
+
+def test_similarity_separates_duplicates_from_other_text():
+    sig = near_dup.minhash(BASE)
+    assert near_dup.similarity(sig, near_dup.minhash(BASE + "!")) >= near_dup.SIMILARITY_THRESHOLD
+    assert near_dup.similarity(sig, near_dup.minhash(TEXTS[1])) < 0.3
+    assert near_dup.minhash("") is None
+
+
+def test_duplicates_join_the_earliest_row(conn):
+    ids = insert(conn, TEXTS)
+    assert near_dup.index_new_rows(conn, "kw") == (6, 2)
+    assert clusters(conn) == {ids[0]: ids[0], ids[1]: ids[1], ids[2]: ids[0], ids[3]: ids[0],
+                              ids[4]: ids[4], ids[5]: ids[5]}
+    assert near_dup.get_clusters("kw") == [{"cluster_id": ids[0], "size": 3, "ids": [ids[0], ids[2], ids[3]]}]
+
+
+def test_indexing_is_idempotent(conn):
+    insert(conn, TEXTS)
+    near_dup.index_new_rows(conn, "kw")
+    before = clusters(conn)
+    bands = conn.execute("SELECT COUNT(*) FROM near_dup_band").fetchone()[0]
+
+    assert near_dup.index_new_rows(conn, "kw") == (0, 0)
+    assert clusters(conn) == before
+    assert conn.execute("SELECT COUNT(*) FROM near_dup_band").fetchone()[0] == bands
+
+
+def test_later_rows_join_existing_clusters(conn):
+    ids = insert(conn, TEXTS[:2])
+    near_dup.index_new_rows(conn, "kw")
+    ids = insert(conn, [BASE + " today"], start=2)
+    assert near_dup.index_new_rows(conn, "kw") == (1, 1)
+    assert clusters(conn)[ids[-1]] == ids[0]
+
+
+def test_chunked_indexing_matches_single_pass(conn):
+    insert(conn, TEXTS, keyword="a")
+    insert(conn, TEXTS, keyword="b", start=100)
+    near_dup.index_new_rows(conn, "a")
+    near_dup.index_new_rows(conn, "b", chunk_size=2)
+
+    def shape(keyword):
+        ids = sorted(clusters(conn, keyword))
+        return [ids.index(clusters(conn, keyword)[i]) for i in ids]
+
+    assert shape("a") == shape("b")
+
+
+def test_keywords_are_indexed_separately(conn):
+    insert(conn, [BASE], keyword="a")
+    near_dup.index_new_rows(conn, "a")
+    ids = insert(conn, [BASE], keyword="b", start=1)
+    assert near_dup.index_new_rows(conn, "b") == (1, 0)
+    assert clusters(conn, "b") == {ids[0]: ids[0]}
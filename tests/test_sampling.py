@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sampling
+
+
+def make_df(n=1000):
+    """reddit 占 90%；前 10 行互动量极高；时间按行号从旧到新递增"""
+    platforms = ["reddit"] * (n * 9 // 10) + ["youtube"] * (n // 20) + ["twitter"] * (n - n * 9 // 10 - n // 20)
+    return pd.DataFrame({
+        "content": [f"post number {i}" for i in range(n)],
+        "platform": platforms,
+        "timestamp": pd.date_range("2024-01-01", periods=n, freq="h").strftime("%Y-%m-%dT%H:%M:%S"),
+        "score": [100000 if i < 10 else 0 for i in range(n)],
+        "view_count": [None] * n,
+    })
+
+
+@pytest.mark.parametrize("strategy", list(sampling.STRATEGIES))
+def test_every_strategy_returns_n_distinct_rows(strategy):
+    df = make_df()
+    picked = sampling.sample(df, 100, strategy)
+    assert len(picked) == 100
+    assert picked.index.is_unique and picked.index.isin(df.index).all()
+    # 固定 random_state，结果可复现
+    assert picked.index.equals(sampling.sample(df, 100, strategy).index)
+
+
+def test_small_input_is_returned_unchanged():
+    df = make_df(50)
+    assert sampling.sample(df, 100, "engagement") is df
+
+
+def test_stratified_gives_small_platforms_their_share():
+    counts = sampling.sample(make_df(), 90, "stratified")["platform"].value_counts()
+    assert counts.to_dict() == {"reddit": 30, "youtube": 30, "twitter": 30}
+
+
+def test_stratified_hands_unused_quota_to_larger_platforms():
+    df = make_df()
+    df.loc[df["platform"] == "twitter", "platform"] = ["twitter"] * 5 + ["youtube"] * 45
+    counts = sampling.sample(df, 90, "stratified")["platform"].value_counts()
+    assert counts["twitter"] == 5 and counts.sum() == 90
+
+
+def test_engagement_prefers_popular_rows():
+    picked = sampling.sample(make_df(), 50, "engagement")
+    # 10 / 1000 的行在 50 个样本中几乎都会被选中（均匀采样期望只有 0.5 行）
+    assert (picked["score"] > 0).sum() >= 5
+
+
+def test_recency_prefers_new_rows():
+    df = make_df()
+    picked = sampling.sample(df, 100, "recency")
+    assert np.median(picked.index) > len(df) * 0.9
+
+
+def test_dedup_drops_normalized_duplicates():
+    df = pd.DataFrame({"content": ["Hello, World!", "hello world", "HELLO WORLD!!!", "something else"]})
+    picked = sampling.sample(df, 10, "dedup")
+    assert picked["content"].tolist() == ["Hello, World!", "something else"]
+
+
+def test_missing_columns_fall_back_to_uniform():
+    df = make_df()[["content"]]
+    for strategy in ("stratified", "engagement", "recency"):
+        assert sampling.sample(df, 100, strategy).index.equals(sampling.sample(df, 100, "uniform").index)
+
+
+def test_unknown_strategy_raises():
+    with pytest.raises(ValueError):
+        sampling.sample(make_df(), 10, "nope")
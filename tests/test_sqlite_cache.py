@@ -0,0 +1,88 @@
+import pytest
+
+from db import connection
+from sqlite_cache import SqliteCache
+
+
+@pytest.fixture
+def cache(temp_db):
+    return SqliteCache("test_cache", ("key",), extra_columns=("phase",), ttl=3600, max_bytes=10_000)
+
+
+def table_size(table="test_cache"):
+    with connection() as conn:
+        return conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+
+def last_access(key):
+    with connection() as conn:
+        return conn.execute("SELECT last_access FROM test_cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_round_trip_and_extra_columns(cache):
+    cache.put(("a",), b"hello", phase="map")
+    assert cache.get(("a",)) == b"hello"
+    assert cache.get(("missing",)) is None
+    with connection() as conn:
+        assert conn.execute("SELECT phase FROM test_cache WHERE key = 'a'").fetchone()[0] == "map"
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["writes"]) == (1, 1, 1)
+
+
+def test_expired_entry_is_a_miss(cache):
+    cache.put(("a",), b"hello")
+    with connection() as conn, conn:
+        conn.execute("UPDATE test_cache SET created_at = created_at - 7200")
+    assert cache.get(("a",)) is None
+    assert cache.purge_expired() == 1
+    assert cache.total_bytes() == table_size() == 0
+
+
+def test_recent_hit_does_not_write(cache):
+    cache.put(("a",), b"hello")
+    with connection() as conn, conn:
+        conn.execute("UPDATE test_cache SET last_access = last_access - 60")
+    stale = last_access("a")
+
+    # 间隔内的命中不回写 last_access
+    assert cache.get(("a",)) == b"hello"
+    assert last_access("a") == stale
+
+    with connection() as conn, conn:
+        conn.execute("UPDATE test_cache SET last_access = last_access - ?", (cache.touch_interval,))
+    assert cache.get(("a",)) == b"hello"
+    assert last_access("a") > stale
+
+
+def test_running_total_matches_table(cache):
+    for i in range(20):
+        cache.put((f"k{i % 7}",), bytes(range(i * 10 % 256)) * 3)
+    assert cache.total_bytes() == table_size()
+
+
+def test_evicts_least_recently_used(cache):
+    payload = bytes(range(256)) * 10  # 压缩后约 300 字节
+    for i in range(5):
+        cache.put((f"k{i}",), payload + bytes([i]))
+        with connection() as conn, conn:
+            conn.execute("UPDATE test_cache SET last_access = ? WHERE key = ?", (1000 + i, f"k{i}"))
+    size = table_size() / 5
+
+    cache.put(("new",), payload + bytes([5]), max_bytes=int(size * 4.5))
+    with connection() as conn:
+        keys = {row[0] for row in conn.execute("SELECT key FROM test_cache")}
+    assert keys == {"k2", "k3", "k4", "new"}
+    assert cache.get_stats()["evictions"] == 2
+    assert cache.total_bytes() == table_size()
+
+
+def test_table_created_per_database(cache, tmp_path, monkeypatch):
+    import db
+
+    cache.put(("a",), b"first")
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "other.db"))
+    assert cache.get(("a",)) is None
+    cache.put(("b",), b"second")
+    assert cache.total_bytes() == table_size()
+    with connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT key FROM test_cache")] == ["b"]
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+import collect
+
+
+@pytest.fixture
+def videos(temp_db):
+    return [{"video_id": f"v{i}", "title": f"video {i}", "transcript": None} for i in range(8)]
+
+
+@pytest.fixture
+def release():
+    """慢请求阻塞在这个 Event 上，测试结束时放行，不留下悬挂的线程"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def stub_fetch(monkeypatch, delays, release=None):
+    def fetch(video_id, lang="en"):
+        delay = delays.get(video_id, 0.2)
+        if delay is None:
+            release.wait(10)
+        else:
+            time.sleep(delay)
+        return f"text of {video_id}"
+    monkeypatch.setattr(collect, "fetch_transcript", fetch)
+
+
+def test_concurrent_fetch_keeps_order(videos, monkeypatch):
+    stub_fetch(monkeypatch, {})
+    start = time.monotonic()
+    collect.fetch_transcripts(videos, max_workers=8, video_timeout=5, stage_timeout=5)
+    elapsed = time.monotonic() - start
+
+    # 8 个 0.2s 的请求顺序执行需要 1.6s
+    assert elapsed < 0.8
+    assert [v["transcript"] for v in videos] == [f"text of v{i}" for i in range(8)]
+
+
+def test_results_are_cached(videos, monkeypatch):
+    stub_fetch(monkeypatch, {})
+    collect.fetch_transcripts(videos, max_workers=8)
+
+    monkeypatch.setattr(collect, "fetch_transcript", lambda *a: pytest.fail("should hit the cache"))
+    again = [dict(v, transcript=None) for v in videos]
+    collect.fetch_transcripts(again)
+    assert [v["transcript"] for v in again] == [v["transcript"] for v in videos]
+
+
+def test_timed_out_video_releases_its_slot(videos, monkeypatch, release):
+    stub_fetch(monkeypatch, {"v0": None, **{f"v{i}": 0.01 for i in range(1, 8)}}, release)
+    start = time.monotonic()
+    collect.fetch_transcripts(videos, max_workers=1, video_timeout=0.3, stage_timeout=5)
+    elapsed = time.monotonic() - start
+
+    # v0 超时后其余视频仍能在同一个名额上完成
+    assert elapsed < 2
+    assert videos[0]["transcript"] == ""
+    assert [v["transcript"] for v in videos[1:]] == [f"text of v{i}" for i in range(1, 8)]
+
+
+def test_stage_budget_returns_partial_results(videos, monkeypatch, release):
+    stub_fetch(monkeypatch, {f"v{i}": (0.01 if i % 2 == 0 else None) for i in range(8)}, release)
+    start = time.monotonic()
+    collect.fetch_transcripts(videos, max_workers=8, video_timeout=10, stage_timeout=0.5)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 2
+    assert [v["transcript"] for v in videos] == [f"text of v{i}" if i % 2 == 0 else "" for i in range(8)]
+
+
+def test_abandoned_requests_do_not_block_exit(videos, monkeypatch, release):
+    stub_fetch(monkeypatch, {f"v{i}": None for i in range(8)}, release)
+    collect.fetch_transcripts(videos, max_workers=4, video_timeout=0.2, stage_timeout=0.5)
+
+    stragglers = [t for t in threading.enumerate() if t.name.startswith("transcript-")]
+    assert stragglers
+    assert all(t.daemon for t in stragglers)
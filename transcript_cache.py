@@ -0,0 +1,33 @@
+"""
+YouTube 字幕磁盘缓存：按 (video_id, lang) 存储 zlib 压缩后的字幕文本
+- TTL 过期后视为未命中
+- 总字节数超过上限时按最近访问时间 (LRU) 淘汰
+- 存储、淘汰与统计由 sqlite_cache.SqliteCache 实现
+"""
+from sqlite_cache import SqliteCache
+
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+_cache = SqliteCache("transcript_cache", ("video_id", "lang"), ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES)
+
+
+def get(video_id, lang="en", ttl=CACHE_TTL_SECONDS):
+    """返回缓存的字幕文本；未命中或已过期返回 None（空字符串表示该视频确认无字幕）"""
+    data = _cache.get((video_id, lang), ttl)
+    return None if data is None else data.decode("utf-8")
+
+
+def put(video_id, text, lang="en", max_bytes=CACHE_MAX_BYTES):
+    """写入缓存，并在超过容量上限时淘汰最久未访问的条目"""
+    _cache.put((video_id, lang), (text or "").encode("utf-8"), max_bytes)
+
+
+def purge_expired(ttl=CACHE_TTL_SECONDS):
+    """删除过期条目，返回删除数量"""
+    return _cache.purge_expired(ttl)
+
+
+def get_stats():
+    """返回命中/未命中计数及命中率"""
+    return _cache.get_stats()